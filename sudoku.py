@@ -1,6 +1,46 @@
-import copy
+import argparse
+import cProfile
+import functools
+import hashlib
+import importlib.util
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
 import random
-import pygame
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _lazy_import(name):
+    """
+    Импорт модуля, который выполняется только при первом обращении к его атрибуту
+
+    :param name: Имя модуля
+    :return: Модуль (возможно, ещё не загруженный) или None, если модуль не установлен
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+pygame = _lazy_import("pygame")
+"""module or None: pygame загружается при первой отрисовке, поэтому решатель и генератор импортируются без него"""
 
 class SudokuError(Exception):
     """Базовый класс для логических ошибок игры Судоку"""
@@ -18,120 +58,3460 @@ CELL_SIZE = 540 // 9
 WHITE = (255, 255, 255)
 """tuple: Белый цвет. Используется для исходных (неизменяемых) цифр"""
 
-BLACK = (0, 0, 0)
-"""tuple: Черный цвет. Используется для линий сетки и текста меню"""
+BLACK = (0, 0, 0)
+"""tuple: Черный цвет. Используется для линий сетки и текста меню"""
+
+GRAY = (128, 128, 128)
+"""tuple: Серый цвет. Фоновая заливка игрового поля"""
+
+GREEN = (0, 255, 0)
+"""tuple: Зеленый цвет. Используется для правильных ответов и кнопок"""
+
+RED = (255, 0, 0)
+"""tuple: Красный цвет. Используется для ошибок, выделения и кнопок"""
+
+YELLOW = (255, 255, 0)
+"""tuple: Желтый цвет. Используется для подсказок и таймера"""
+
+screen = None
+"""pygame.Surface: Основная поверхность окна, на которой происходит отрисовка"""
+
+font = None
+"""pygame.font.Font: Шрифт для отрисовки текста и цифр"""
+
+small_font = None
+"""pygame.font.Font: Мелкий шрифт для строки подсказки в панели статистики (None - строка не рисуется)"""
+
+clock = None
+"""pygame.time.Clock: Объект для контроля FPS (кадров в секунду)"""
+
+FONT_NAME = "Times New Roman"
+"""str: Имя системного шрифта игры"""
+
+FONT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "sudoku", "fonts.json")
+"""str: Файл, в котором между запусками хранятся найденные пути к шрифтам"""
+ROW_OF = tuple(index // 9 for index in range(81))
+"""tuple: Номер строки для каждой из 81 клеток (индекс клетки = row * 9 + col)"""
+
+COL_OF = tuple(index % 9 for index in range(81))
+"""tuple: Номер столбца для каждой из 81 клеток"""
+
+BOX_OF = tuple((index // 27) * 3 + (index % 9) // 3 for index in range(81))
+"""tuple: Номер блока 3x3 для каждой из 81 клеток (блоки нумеруются слева направо, сверху вниз)"""
+
+FULL_MASK = 0b1111111110
+"""int: Битовая маска всех цифр 1-9 (бит d соответствует цифре d, нулевой бит не используется)"""
+
+
+BOX_CELLS = tuple(tuple(index for index in range(81) if BOX_OF[index] == box) for box in range(9))
+"""tuple: Индексы 9 клеток каждого блока 3x3"""
+
+
+class BoardRow:
+    """
+    Строка поля Board без копирования данных
+
+    Поддерживает board[row][col] для чтения и записи, len, итерацию, count и
+    сравнение со списком, поэтому код, написанный для списка списков, работает без изменений
+    """
+    __slots__ = ("cells", "start")
+
+    def __init__(self, cells, row):
+        self.cells = cells
+        self.start = row * 9
+
+    def __getitem__(self, col):
+        if isinstance(col, slice):
+            return list(self.cells[self.start:self.start + 9])[col]
+        if not -9 <= col < 9:
+            raise IndexError(f"Индекс столбца {col} вне диапазона")
+        return self.cells[self.start + col % 9]
+
+    def __setitem__(self, col, value):
+        if not -9 <= col < 9:
+            raise IndexError(f"Индекс столбца {col} вне диапазона")
+        self.cells[self.start + col % 9] = value
+
+    def __len__(self):
+        return 9
+
+    def __iter__(self):
+        return iter(self.cells[self.start:self.start + 9])
+
+    def __contains__(self, value):
+        return value in self.cells[self.start:self.start + 9]
+
+    def count(self, value):
+        """Количество клеток строки с заданным значением"""
+        return self.cells[self.start:self.start + 9].count(value)
+
+    def __eq__(self, other):
+        if isinstance(other, BoardRow):
+            return self.cells[self.start:self.start + 9] == other.cells[other.start:other.start + 9]
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Board:
+    """
+    Поле 9x9, хранящееся в одном bytearray из 81 клетки
+
+    Копирование - это копия 81 байта вместо copy.deepcopy вложенных списков,
+    сравнение и хеширование выполняются по байтам. Доступ board[row][col]
+    совместим со списком списков, также поддерживается board[row, col]
+    """
+    __slots__ = ("cells",)
+
+    def __init__(self, game_board=None):
+        """
+        :param game_board: Исходное поле: Board, 81 байт (bytes/bytearray) или список списков 9x9. None - пустое поле
+        """
+        if game_board is None:
+            self.cells = bytearray(81)
+        elif isinstance(game_board, Board):
+            self.cells = bytearray(game_board.cells)
+        elif isinstance(game_board, (bytes, bytearray)):
+            if len(game_board) != 81:
+                raise ValueError(f"Ожидалось 81 значение клеток, получено {len(game_board)}")
+            self.cells = bytearray(game_board)
+        else:
+            self.cells = bytearray(game_board[row][col] for row in range(9) for col in range(9))
+        """bytearray: Значения клеток построчно (0 - пустая клетка)"""
+
+    def copy(self):
+        """Возвращает независимую копию поля"""
+        board = Board.__new__(Board)
+        board.cells = bytearray(self.cells)
+        return board
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return Board, (bytes(self.cells),)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            row, col = key
+            return self.cells[row * 9 + col]
+        if not -9 <= key < 9:
+            raise IndexError(f"Индекс строки {key} вне диапазона")
+        return BoardRow(self.cells, key % 9)
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, tuple):
+            raise TypeError("Для записи используйте board[row][col] или board[row, col]")
+        row, col = key
+        self.cells[row * 9 + col] = value
+
+    def __len__(self):
+        return 9
+
+    def __iter__(self):
+        return (BoardRow(self.cells, row) for row in range(9))
+
+    def __eq__(self, other):
+        if isinstance(other, Board):
+            return self.cells == other.cells
+        if isinstance(other, (list, tuple)):
+            return len(other) == 9 and all(self[row] == other[row] for row in range(9))
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(bytes(self.cells))
+
+    def __repr__(self):
+        return f"Board({board_to_string(self)!r})"
+
+    def key(self):
+        """Возвращает неизменяемый ключ поля (81 байт) для словарей и множеств"""
+        return bytes(self.cells)
+
+    def row(self, row):
+        """Значения строки (bytes из 9 элементов)"""
+        return bytes(self.cells[row * 9:row * 9 + 9])
+
+    def col(self, col):
+        """Значения столбца (bytes из 9 элементов)"""
+        return bytes(self.cells[col::9])
+
+    def box(self, box):
+        """Значения блока 3x3 с номером box построчно (bytes из 9 элементов)"""
+        cells = self.cells
+        return bytes(cells[index] for index in BOX_CELLS[box])
+
+    def to_lists(self):
+        """Возвращает поле в виде списка списков"""
+        return [list(self.cells[row * 9:row * 9 + 9]) for row in range(9)]
+
+
+class BoardState:
+    """
+    Состояние поля с битовыми масками занятых цифр по строкам, столбцам и блокам
+
+    Маски обновляются инкрементально при постановке и удалении цифры,
+    поэтому проверка хода и получение кандидатов клетки стоят O(1)
+    """
+    __slots__ = ("cells", "rows", "cols", "boxes")
+
+    def __init__(self, game_board=None):
+        """
+        :param game_board: Поле 9x9 (Board или список списков), из которого берутся исходные цифры
+        """
+        self.cells = bytearray(81)
+        """bytearray: Значения 81 клетки построчно (0 - пустая клетка)"""
+
+        self.rows = [0] * 9
+        """list[int]: Маски цифр, уже стоящих в каждой строке"""
+
+        self.cols = [0] * 9
+        """list[int]: Маски цифр, уже стоящих в каждом столбце"""
+
+        self.boxes = [0] * 9
+        """list[int]: Маски цифр, уже стоящих в каждом блоке 3x3"""
+
+        if isinstance(game_board, Board):
+            for index, num in enumerate(game_board.cells):
+                if num:
+                    self.place(ROW_OF[index], COL_OF[index], num)
+        elif game_board is not None:
+            for row in range(9):
+                line = game_board[row]
+                for col in range(9):
+                    if line[col]:
+                        self.place(row, col, line[col])
+
+    def place(self, row, col, num):
+        """Ставит цифру в пустую клетку и обновляет маски"""
+        bit = 1 << num
+        index = row * 9 + col
+        self.cells[index] = num
+        self.rows[row] |= bit
+        self.cols[col] |= bit
+        self.boxes[BOX_OF[index]] |= bit
+
+    def remove(self, row, col):
+        """Очищает клетку и снимает её цифру с масок"""
+        index = row * 9 + col
+        bit = ~(1 << self.cells[index])
+        self.cells[index] = 0
+        self.rows[row] &= bit
+        self.cols[col] &= bit
+        self.boxes[BOX_OF[index]] &= bit
+
+    def candidates(self, row, col):
+        """Возвращает маску цифр, которые можно поставить в клетку"""
+        return ~(self.rows[row] | self.cols[col] | self.boxes[BOX_OF[row * 9 + col]]) & FULL_MASK
+
+    def is_valid(self, row, col, num):
+        """Проверяет ход за O(1): True, если цифры нет в строке, столбце и блоке"""
+        return not (self.rows[row] | self.cols[col] | self.boxes[BOX_OF[row * 9 + col]]) >> num & 1
+
+    def write_to(self, game_board):
+        """Копирует значения клеток в поле 9x9 (Board или список списков)"""
+        if isinstance(game_board, Board):
+            game_board.cells[:] = self.cells
+            return game_board
+        cells = self.cells
+        for row in range(9):
+            line = game_board[row]
+            for col in range(9):
+                line[col] = cells[row * 9 + col]
+        return game_board
+
+
+def is_valid_move(game_board, row, col, num):
+    """
+    Проверяет валидность хода по правилам Судоку
+
+    Для BoardState проверка выполняется по битовым маскам за O(1).
+    Для обычного поля (список списков) просматриваются строка, столбец и блок
+
+    :param game_board: Текущее поле 9x9 или BoardState
+    :param row: Индекс строки
+    :param col: Индекс столбца
+    :param num: Число для проверки
+    :return: True, если ход возможен
+    :raises ValueError: Если индексы вне диапазона
+    """
+    if not (0 <= row < 9 and 0 <= col < 9):
+        raise ValueError(f"Координаты ({row}, {col}) выходят за пределы поля")
+
+    if isinstance(game_board, BoardState):
+        return game_board.is_valid(row, col, num)
+
+    #Заимствованный код (снизу, источник: https://habr.com/ru/companies/otus/articles/746408/)
+    if num in game_board[row]:
+        return False
+
+    for i in range(9):
+        if game_board[i][col] == num:
+            return False
+
+    start_row = (row // 3) * 3
+    start_col = (col // 3) * 3
+    for i in range(3):
+        for j in range(3):
+            if game_board[start_row + i][start_col + j] == num:
+                return False
+    return True
+    #Заимствованный код (сверху, источник: https://habr.com/ru/companies/otus/articles/746408/)
+
+
+BIT_COUNT = tuple(bin(mask).count("1") for mask in range(1 << 10))
+"""tuple: Количество установленных битов для каждой маски кандидатов (0..1023)"""
+
+UNITS = tuple(
+    [tuple(row * 9 + col for col in range(9)) for row in range(9)]
+    + [tuple(row * 9 + col for row in range(9)) for col in range(9)]
+    + [tuple(index for index in range(81) if BOX_OF[index] == box) for box in range(9)]
+)
+"""tuple: 27 групп клеток (9 строк, 9 столбцов, 9 блоков), в каждой цифры не повторяются"""
+
+
+class SolveStats:
+    """Счётчики работы решателя для сравнения движков на одном наборе головоломок"""
+    __slots__ = ("nodes", "backtracks", "max_depth")
+
+    def __init__(self):
+        self.nodes = 0
+        """int: Количество пробных постановок цифры в узлах перебора"""
+
+        self.backtracks = 0
+        """int: Количество откатов пробной цифры"""
+
+        self.max_depth = 0
+        """int: Наибольшая глубина рекурсии перебора (число одновременно стоящих пробных цифр)"""
+
+    def __repr__(self):
+        return f"SolveStats(nodes={self.nodes}, backtracks={self.backtracks}, max_depth={self.max_depth})"
+
+
+def _fill_backtrack(state, start, stats, rng, depth=1):
+    """
+    Рекурсивный перебор поверх BoardState: заполняет первую пустую клетку в порядке строк
+
+    :param state: Состояние поля
+    :param start: Индекс клетки, с которой продолжается поиск пустой клетки
+    :param stats: SolveStats для подсчёта узлов, откатов и глубины
+    :param rng: Источник случайности для порядка цифр (None - по возрастанию)
+    :param depth: Глубина пробных цифр, которые ставит этот вызов
+    :return: True, если поле заполнено до конца
+    """
+    cells = state.cells
+    for index in range(start, 81):
+        if cells[index] == 0:
+            break
+    else:
+        return True
+
+    row = ROW_OF[index]
+    col = COL_OF[index]
+    box = BOX_OF[index]
+    free = ~(state.rows[row] | state.cols[col] | state.boxes[box]) & FULL_MASK
+    random_numbers = [num for num in range(1, 10) if free >> num & 1]
+    if rng is not None:
+        rng.shuffle(random_numbers)
+    if random_numbers and depth > stats.max_depth:
+        stats.max_depth = depth
+    for key in random_numbers:
+        stats.nodes += 1
+        state.place(row, col, key)
+        if _fill_backtrack(state, index + 1, stats, rng, depth + 1):
+            return True
+        state.remove(row, col)
+        stats.backtracks += 1
+    return False
+
+
+def _search_backtrack(state, stats, rng):
+    """Движок 'backtrack': перебор клеток в порядке строк без распространения ограничений"""
+    return _fill_backtrack(state, 0, stats, rng)
+
+
+def _propagate(state, trail):
+    """
+    Распространение ограничений: голые и скрытые одиночки до неподвижной точки
+
+    :param state: Состояние поля
+    :param trail: Список, в который добавляются индексы заполненных клеток (для отката)
+    :return: False, если найдено противоречие
+    """
+    cells = state.cells
+    rows = state.rows
+    cols = state.cols
+    boxes = state.boxes
+    changed = True
+    while changed:
+        changed = False
+        for index in range(81):
+            if cells[index]:
+                continue
+            free = ~(rows[ROW_OF[index]] | cols[COL_OF[index]] | boxes[BOX_OF[index]]) & FULL_MASK
+            if not free:
+                return False
+            if not free & (free - 1):
+                state.place(ROW_OF[index], COL_OF[index], free.bit_length() - 1)
+                trail.append(index)
+                changed = True
+        if changed:
+            continue
+
+        for unit in UNITS:
+            used = 0
+            seen_once = 0
+            seen_twice = 0
+            for index in unit:
+                if cells[index]:
+                    used |= 1 << cells[index]
+                    continue
+                free = ~(rows[ROW_OF[index]] | cols[COL_OF[index]] | boxes[BOX_OF[index]]) & FULL_MASK
+                seen_twice |= seen_once & free
+                seen_once |= free
+            if (seen_once | used) & FULL_MASK != FULL_MASK:
+                return False
+            singles = seen_once & ~seen_twice
+            if not singles:
+                continue
+            for index in unit:
+                if cells[index]:
+                    continue
+                free = ~(rows[ROW_OF[index]] | cols[COL_OF[index]] | boxes[BOX_OF[index]]) & FULL_MASK
+                single = free & singles
+                if not single:
+                    continue
+                if single & (single - 1):
+                    return False
+                state.place(ROW_OF[index], COL_OF[index], single.bit_length() - 1)
+                trail.append(index)
+                changed = True
+    return True
+
+
+def _search_mrv(state, stats, rng, depth=1):
+    """
+    Движок 'mrv': распространение одиночек и ветвление по клетке с наименьшим числом кандидатов
+
+    :param state: Состояние поля
+    :param stats: SolveStats для подсчёта узлов, откатов и глубины
+    :param rng: Источник случайности для порядка цифр (None - по возрастанию)
+    :param depth: Глубина пробных цифр, которые ставит этот вызов
+    :return: True, если поле заполнено до конца
+    """
+    trail = []
+    if _propagate(state, trail):
+        cells = state.cells
+        best = -1
+        best_free = 0
+        best_count = 10
+        for index in range(81):
+            if cells[index]:
+                continue
+            free = ~(state.rows[ROW_OF[index]] | state.cols[COL_OF[index]] | state.boxes[BOX_OF[index]]) & FULL_MASK
+            if BIT_COUNT[free] < best_count:
+                best, best_free, best_count = index, free, BIT_COUNT[free]
+                if best_count == 2:
+                    break
+        if best < 0:
+            return True
+
+        row = ROW_OF[best]
+        col = COL_OF[best]
+        digits = [num for num in range(1, 10) if best_free >> num & 1]
+        if rng is not None:
+            rng.shuffle(digits)
+        if digits and depth > stats.max_depth:
+            stats.max_depth = depth
+        for num in digits:
+            stats.nodes += 1
+            state.place(row, col, num)
+            if _search_mrv(state, stats, rng, depth + 1):
+                return True
+            state.remove(row, col)
+            stats.backtracks += 1
+
+    for index in reversed(trail):
+        state.remove(ROW_OF[index], COL_OF[index])
+    return False
+
+
+DLX_COLUMNS = 324
+"""int: Количество ограничений точного покрытия: клетка, цифра в строке, в столбце и в блоке (4 * 81)"""
+
+_DLX_FIRST_OPTION = DLX_COLUMNS + 1
+"""int: Номер первого узла строк-вариантов. Узел 0 - корень, узлы 1..324 - заголовки столбцов"""
+
+
+def _dlx_option_columns(option):
+    """Возвращает 4 столбца-ограничения, которые покрывает вариант 'цифра digit в клетке index'"""
+    index, digit = divmod(option, 9)
+    row = ROW_OF[index]
+    col = COL_OF[index]
+    return (
+        1 + index,
+        82 + row * 9 + digit,
+        163 + col * 9 + digit,
+        244 + BOX_OF[index] * 9 + digit,
+    )
+
+
+def _build_dlx_template():
+    """
+    Строит массивы связей полной матрицы точного покрытия 729 x 324
+
+    Каждый узел - это индекс в общих массивах L, R, U, D, C, а не отдельный объект
+    :return: (L, R, U, D, C, S) - списки соседей, номера столбцов и размеры столбцов
+    """
+    total = _DLX_FIRST_OPTION + 729 * 4
+    left = [0] * total
+    right = [0] * total
+    up = list(range(total))
+    down = list(range(total))
+    column = [0] * total
+    size = [0] * (DLX_COLUMNS + 1)
+
+    for node in range(DLX_COLUMNS + 1):
+        left[node] = node - 1 if node else DLX_COLUMNS
+        right[node] = node + 1 if node < DLX_COLUMNS else 0
+
+    for option in range(729):
+        first = _DLX_FIRST_OPTION + option * 4
+        for k, col in enumerate(_dlx_option_columns(option)):
+            node = first + k
+            column[node] = col
+            up[node] = up[col]
+            down[node] = col
+            down[up[col]] = node
+            up[col] = node
+            size[col] += 1
+            left[node] = first + (k - 1) % 4
+            right[node] = first + (k + 1) % 4
+    return left, right, up, down, column, size
+
+
+_DLX_TEMPLATE = _build_dlx_template()
+"""tuple: Заготовка связей DLX. Копируется для каждого решения вместо повторного построения"""
+
+
+class DancingLinks:
+    """
+    Решатель точного покрытия (Algorithm X, Dancing Links) для поля 9x9
+
+    Узлы хранятся в плоских списках целых чисел (соседи слева, справа, сверху,
+    снизу и номер столбца), поэтому на узел не создаётся отдельный Python-объект
+    """
+    __slots__ = ("left", "right", "up", "down", "column", "size", "solution", "conflict")
+
+    def __init__(self, cells):
+        """
+        :param cells: 81 значение клеток построчно (0 - пустая клетка)
+        """
+        left, right, up, down, column, size = _DLX_TEMPLATE
+        self.left = left[:]
+        self.right = right[:]
+        self.up = up[:]
+        self.down = down[:]
+        self.column = column
+        self.size = size[:]
+        self.solution = None
+        """list[tuple[int, int]] or None: Первое найденное решение как список (индекс клетки, цифра)"""
+
+        self.conflict = False
+        """bool: True, если исходные цифры противоречат друг другу"""
+
+        for index in range(81):
+            if cells[index]:
+                if not 1 <= cells[index] <= 9:
+                    self.conflict = True
+                    return
+                node = _DLX_FIRST_OPTION + (index * 9 + cells[index] - 1) * 4
+                for k in range(4):
+                    col = column[node + k]
+                    if self.right[self.left[col]] != col:
+                        self.conflict = True
+                        return
+                    self._cover(col)
+
+    def _cover(self, col):
+        """Исключает столбец и все пересекающиеся с ним строки-варианты"""
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        left[right[col]] = left[col]
+        right[left[col]] = right[col]
+        i = down[col]
+        while i != col:
+            j = right[i]
+            while j != i:
+                up[down[j]] = up[j]
+                down[up[j]] = down[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def _uncover(self, col):
+        """Возвращает столбец, отменяя _cover в обратном порядке"""
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        i = up[col]
+        while i != col:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                up[down[j]] = j
+                down[up[j]] = j
+                j = left[j]
+            i = up[i]
+        left[right[col]] = col
+        right[left[col]] = col
+
+    def search(self, limit=1, stats=None, rng=None):
+        """
+        Ищет решения, останавливаясь после limit штук
+
+        :param limit: Максимальное количество решений для подсчёта
+        :param stats: SolveStats для подсчёта узлов, откатов и глубины
+        :param rng: Источник случайности для порядка вариантов (None - детерминированный порядок)
+        :return: Количество найденных решений (не больше limit)
+        """
+        if self.conflict:
+            return 0
+        if stats is None:
+            stats = SolveStats()
+        return self._search([], limit, stats, rng)
+
+    def _search(self, partial, limit, stats, rng):
+        right, down, size = self.right, self.down, self.size
+        col = right[0]
+        if col == 0:
+            if self.solution is None:
+                self.solution = [divmod((node - _DLX_FIRST_OPTION) // 4, 9) for node in partial]
+            return 1
+
+        best = col
+        best_size = size[col]
+        while col and best_size > 1:
+            if size[col] < best_size:
+                best, best_size = col, size[col]
+            col = right[col]
+        if best_size == 0:
+            return 0
+
+        self._cover(best)
+        options = []
+        node = down[best]
+        while node != best:
+            options.append(node)
+            node = down[node]
+        if rng is not None:
+            rng.shuffle(options)
+
+        found = 0
+        if options and len(partial) >= stats.max_depth:
+            stats.max_depth = len(partial) + 1
+        for node in options:
+            stats.nodes += 1
+            partial.append(node)
+            j = right[node]
+            while j != node:
+                self._cover(self.column[j])
+                j = right[j]
+            found += self._search(partial, limit - found, stats, rng)
+            j = self.left[node]
+            while j != node:
+                self._uncover(self.column[j])
+                j = self.left[j]
+            partial.pop()
+            if found >= limit:
+                break
+            stats.backtracks += 1
+        self._uncover(best)
+        return found
+
+
+def _search_dlx(state, stats, rng):
+    """Движок 'dlx': точное покрытие Dancing Links, результат записывается в BoardState"""
+    links = DancingLinks(state.cells)
+    if not links.search(1, stats, rng):
+        return False
+    for index, digit in links.solution:
+        if not state.cells[index]:
+            state.place(ROW_OF[index], COL_OF[index], digit + 1)
+    return True
+
+
+def count_solutions(game_board, limit=2):
+    """
+    Считает решения головоломки, останавливаясь на limit
+
+    :param game_board: Поле 9x9 (Board или список списков)
+    :param limit: Порог подсчёта (для проверки единственности достаточно 2)
+    :return: Количество решений от 0 до limit
+    :raises ValueError: Если limit меньше 1
+    """
+    if limit < 1:
+        raise ValueError(f"Порог подсчёта решений должен быть не меньше 1, получено {limit}")
+    cells = game_board.cells if isinstance(game_board, Board) else BoardState(game_board).cells
+    return DancingLinks(cells).search(limit)
+
+
+SOLVER_ENGINES = {
+    "backtrack": _search_backtrack,
+    "mrv": _search_mrv,
+    "dlx": _search_dlx,
+}
+"""dict: Доступные движки решателя. Имя -> функция (state, stats, rng) -> bool"""
+
+
+SOLVE_CACHE_MAGIC = b"SDKC"
+"""bytes: Сигнатура файла сохранённого кэша решений"""
+
+SOLVE_CACHE_HEADER = struct.Struct("<4sHI")
+"""struct.Struct: Заголовок файла кэша решений: сигнатура, версия, количество записей"""
+
+SOLVE_CACHE_RECORD = struct.Struct("<16s?41s")
+"""struct.Struct: Запись файла кэша: ключ, есть ли решение, решение по 4 бита на клетку"""
+
+
+class SolveCache:
+    """
+    LRU-кэш результатов решателя: (движок, поле) -> решение или вердикт 'нет решения'
+
+    Ключ - 16 байт BLAKE2b от имени движка и 81 клетки. Значения хранятся как
+    неизменяемые bytes, а при попадании копируются в поле вызывающего, поэтому
+    изменения поля после solve не портят кэш. get, put и clear защищены блокировкой,
+    так как общий кэш используется и из потоков исполнителей
+    """
+
+    def __init__(self, capacity=4096, path=None):
+        """
+        :param capacity: Максимальное количество записей (0 - кэш отключён)
+        :param path: Файл для сохранения между запусками. Если он существует, записи загружаются сразу
+        """
+        self.capacity = capacity
+        """int: Предел количества записей, при превышении вытесняется давно не использованная"""
+
+        self.path = path
+        """str or None: Файл, в который сохраняет save()"""
+
+        self.hits = 0
+        """int: Количество попаданий в кэш"""
+
+        self.misses = 0
+        """int: Количество промахов"""
+
+        self.evictions = 0
+        """int: Количество вытесненных записей"""
+
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def key(game_board, engine):
+        """Компактный ключ поля и движка (16 байт)"""
+        cells = game_board.cells if isinstance(game_board, (Board, BoardState)) else Board(game_board).cells
+        return hashlib.blake2b(cells, digest_size=16, person=engine.encode()[:16]).digest()
+
+    def get(self, key):
+        """
+        Ищет результат по ключу
+
+        :return: (найдено, решение): решение - bytes из 81 клетки или None, если решения нет
+        """
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return True, self._results[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, solution):
+        """Запоминает решение (bytes или bytearray из 81 клетки) или None для поля без решения"""
+        if not self.capacity:
+            return
+        value = bytes(solution) if solution is not None else None
+        with self._lock:
+            self._results[key] = value
+            self._results.move_to_end(key)
+            while len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Возвращает dict с размером, счётчиками и долей попаданий"""
+        lookups = self.hits + self.misses
+        return {"size": len(self._results), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        """Очищает кэш и счётчики"""
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def save(self, path=None):
+        """
+        Сохраняет записи в файл (по умолчанию - в path из конструктора)
+
+        :return: Количество сохранённых записей
+        :raises ValueError: Если путь не задан
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("Не задан файл для сохранения кэша решений")
+        with self._lock:
+            results = list(self._results.items())
+        with open(path, "wb") as output:
+            output.write(SOLVE_CACHE_HEADER.pack(SOLVE_CACHE_MAGIC, 1, len(results)))
+            for key, solution in results:
+                packed = _pack_cells(Board(solution)) if solution is not None else bytes(PACK_CELLS_SIZE)
+                output.write(SOLVE_CACHE_RECORD.pack(key, solution is not None, packed))
+        return len(results)
+
+    def load(self, path):
+        """
+        Добавляет записи из файла save()
+
+        :return: Количество загруженных записей
+        :raises ValueError: Если файл не является кэшем решений
+        """
+        with open(path, "rb") as source:
+            data = source.read()
+        if len(data) < SOLVE_CACHE_HEADER.size:
+            raise ValueError(f"Файл {path} не является кэшем решений")
+        magic, version, count = SOLVE_CACHE_HEADER.unpack_from(data)
+        if magic != SOLVE_CACHE_MAGIC or version != 1 or len(data) != SOLVE_CACHE_HEADER.size + count * SOLVE_CACHE_RECORD.size:
+            raise ValueError(f"Файл {path} не является кэшем решений")
+        for number in range(count):
+            offset = SOLVE_CACHE_HEADER.size + number * SOLVE_CACHE_RECORD.size
+            key, solved, _ = SOLVE_CACHE_RECORD.unpack_from(data, offset)
+            solution = _unpack_cells(data, offset + 17).cells if solved else None
+            self.put(key, solution)
+        return count
+
+
+solve_cache = SolveCache()
+"""SolveCache: Общий кэш результатов solve для повторных проверок присланных полей (передаётся в solve явно)"""
+
+
+def solve(game_board, engine="backtrack", stats=None, rng=None, cache=None):
+    """
+    Решает доску выбранным движком
+
+    Кэш используется, только если передан: при попадании движок не запускается,
+    и stats и счётчики instrumentation остаются нулевыми, поэтому замеры и
+    сравнение движков идут без кэша. Кэшируется только детерминированное решение
+    (rng=None). Решение со случайным порядком цифр (генерация уровней) кэш не
+    трогает: такое поле почти никогда не повторяется
+
+    :param game_board: Поле для решения. При успехе решение записывается в него же
+    :param engine: Имя движка из SOLVER_ENGINES ('backtrack', 'mrv' или 'dlx')
+    :param stats: SolveStats, в который добавляются счётчики узлов и откатов
+    :param rng: Источник случайности для порядка цифр (например, модуль random). None - детерминированный порядок
+    :param cache: SolveCache для повторных проверок (например, общий solve_cache). None - без кэша. Не используется при rng
+    :return: Решенное поле или False
+    :raises SudokuError: Если движок не существует
+    """
+    if engine not in SOLVER_ENGINES:
+        raise SudokuError(f"Неизвестный движок решателя: {engine}. Доступны: {', '.join(SOLVER_ENGINES)}")
+    if stats is None:
+        stats = SolveStats()
+
+    state = BoardState(game_board)
+    key = None
+    if cache is not None and cache.capacity and rng is None:
+        key = SolveCache.key(state, engine)
+        found, solution = cache.get(key)
+        instrumentation.count("solve.cache_hits" if found else "solve.cache_misses")
+        if found and solution is None:
+            return False
+        if found:
+            state.cells[:] = solution
+            return state.write_to(game_board)
+
+    if instrumentation.enabled:
+        nodes, backtracks, empty_cells = stats.nodes, stats.backtracks, state.cells.count(0)
+        started = time.perf_counter()
+    previous_depth, stats.max_depth = stats.max_depth, 0
+    solved = SOLVER_ENGINES[engine](state, stats, rng)
+    depth, stats.max_depth = stats.max_depth, max(previous_depth, stats.max_depth)
+    if instrumentation.enabled:
+        instrumentation.observe(f"solve.{engine}", time.perf_counter() - started)
+        instrumentation.count(f"solve.{engine}.nodes", stats.nodes - nodes)
+        instrumentation.count(f"solve.{engine}.backtracks", stats.backtracks - backtracks)
+        instrumentation.count(f"solve.{engine}.empty_cells", empty_cells)
+        instrumentation.maximum(f"solve.{engine}.max_depth", depth)
+
+    if solved:
+        if key is not None:
+            cache.put(key, state.cells)
+        return state.write_to(game_board)
+    if key is not None:
+        cache.put(key, None)
+    return False
+
+
+def solved_board(game_board, engine="backtrack", rng=None):
+    """
+    Решает доску перебором с возвратом. Использует случайный порядок чисел для генерации
+
+    Поле переводится в BoardState, поэтому каждая проверка кандидата стоит O(1).
+    При успехе решение записывается в исходное поле, при неудаче поле не меняется
+
+    :param game_board: Поле для решения
+    :param engine: Имя движка из SOLVER_ENGINES
+    :param rng: Источник случайности (random.Random). None - глобальный модуль random
+    :return: Решенное поле или False
+    :raises SudokuError: Если движок не существует
+    """
+    return solve(game_board, engine, rng=rng or random)
+
+PEERS = tuple(
+    tuple(sorted({*UNITS[ROW_OF[index]], *UNITS[9 + COL_OF[index]], *UNITS[18 + BOX_OF[index]]} - {index}))
+    for index in range(81)
+)
+"""tuple: 20 соседей каждой клетки - клетки той же строки, столбца и блока"""
+
+PEER_SETS = tuple(frozenset(peers) for peers in PEERS)
+"""tuple: Соседи каждой клетки в виде frozenset для быстрых пересечений"""
+
+UNIT_NAMES = tuple([f"row {n}" for n in range(1, 10)] + [f"column {n}" for n in range(1, 10)]
+                   + [f"box {n}" for n in range(1, 10)])
+"""tuple: Названия групп UNITS для объяснений (на английском, как весь текст интерфейса)"""
+
+MASK_DIGITS = tuple(tuple(digit for digit in range(1, 10) if mask >> digit & 1) for mask in range(1 << 10))
+"""tuple: Цифры, входящие в маску кандидатов, для каждой маски 0..1023"""
+
+UNIT_BITS = tuple(sum(1 << index for index in unit) for unit in UNITS)
+"""tuple: Клетки каждой группы UNITS в виде 81-битной маски (бит index - клетка index)"""
+
+
+def _bit_indices(bits):
+    """Индексы установленных битов маски по возрастанию"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def _digit_boards(cands):
+    """
+    Раскладывает маски кандидатов по цифрам
+
+    :param cands: Маски кандидатов 81 клетки
+    :return: Список из 10 81-битных масок: бит index в элементе digit - digit есть среди кандидатов клетки index
+    """
+    boards = [0] * 10
+    for index in range(81):
+        for digit in MASK_DIGITS[cands[index]]:
+            boards[digit] |= 1 << index
+    return boards
+
+
+def cell_name(index):
+    """Имя клетки для объяснений: 'R1C1' ... 'R9C9'"""
+    return f"R{ROW_OF[index] + 1}C{COL_OF[index] + 1}"
+
+
+def find_conflicts(game_board):
+    """
+    Находит клетки, цифра которых повторяется у соседа по строке, столбцу или блоку
+
+    :param game_board: Поле 9x9 (Board или список списков)
+    :return: Отсортированный список индексов клеток (row * 9 + col)
+    """
+    cells = game_board.cells if isinstance(game_board, Board) else Board(game_board).cells
+    return [index for index in range(81)
+            if cells[index] and any(cells[peer] == cells[index] for peer in PEERS[index])]
+
+
+class CandidateGrid:
+    """
+    Поле с карандашными пометками: значение и маска кандидатов каждой клетки
+
+    В отличие от BoardState, маски кандидатов хранятся по клеткам, поэтому
+    логические приёмы могут вычёркивать кандидатов, не ставя цифр
+    """
+    __slots__ = ("values", "cands")
+
+    def __init__(self, game_board=None):
+        """
+        :param game_board: Поле 9x9 (Board или список списков). None - пустое поле
+        """
+        state = BoardState(game_board)
+        self.values = bytearray(state.cells)
+        """bytearray: Значения клеток (0 - пустая клетка)"""
+
+        self.cands = [0 if state.cells[index] else state.candidates(ROW_OF[index], COL_OF[index])
+                      for index in range(81)]
+        """list[int]: Маска кандидатов каждой клетки (0 у заполненных клеток)"""
+
+    def copy(self):
+        """Возвращает независимую копию"""
+        grid = CandidateGrid.__new__(CandidateGrid)
+        grid.values = bytearray(self.values)
+        grid.cands = self.cands[:]
+        return grid
+
+    def place(self, index, digit):
+        """Ставит цифру и вычёркивает её из кандидатов соседей"""
+        self.values[index] = digit
+        self.cands[index] = 0
+        keep = ~(1 << digit)
+        cands = self.cands
+        for peer in PEERS[index]:
+            cands[peer] &= keep
+
+    def apply(self, step):
+        """
+        Применяет найденный шаг: ставит цифры и вычёркивает кандидатов
+
+        :return: False, если шаг привёл к противоречию (клетка без кандидатов)
+        """
+        for index, digit in step.placements:
+            if not self.cands[index] >> digit & 1:
+                return False
+            self.place(index, digit)
+        for index, mask in step.eliminations:
+            self.cands[index] &= ~mask
+            if not self.values[index] and not self.cands[index]:
+                return False
+        return True
+
+
+class Step:
+    """Один логический шаг решения: приём, поставленные цифры и вычеркнутые кандидаты"""
+    __slots__ = ("technique", "placements", "eliminations", "detail")
+
+    def __init__(self, technique, placements, eliminations, detail):
+        self.technique = technique
+        """str: Имя приёма из TECHNIQUES"""
+
+        self.placements = placements
+        """list[tuple[int, int]]: Пары (индекс клетки, цифра), которые шаг ставит на поле"""
+
+        self.eliminations = eliminations
+        """list[tuple[int, int]]: Пары (индекс клетки, маска вычеркиваемых кандидатов)"""
+
+        self.detail = detail
+        """str: Описание найденной закономерности"""
+
+    def explain(self):
+        """Текст объяснения шага для игрока"""
+        return f"{TECHNIQUE_TITLES[self.technique]}: {self.detail}"
+
+    def __repr__(self):
+        return f"Step({self.explain()!r})"
+
+
+def _find_naked_single(grid):
+    """Голая одиночка: в клетке остался один кандидат"""
+    cands = grid.cands
+    for index in range(81):
+        mask = cands[index]
+        if mask and not mask & (mask - 1):
+            digit = mask.bit_length() - 1
+            return [(index, digit)], [], f"{cell_name(index)} can only be {digit}"
+    return None
+
+
+def _place_naked_singles(grid, changed):
+    """
+    Ставит все голые одиночки подряд, пока они не кончатся
+
+    Постановка цифры только вычёркивает кандидатов, поэтому голая одиночка
+    остаётся самым простым шагом до тех пор, пока такие клетки есть. Новые
+    одиночки появляются только в клетках, чьи кандидаты изменились, поэтому
+    проверяются только они, а не всё поле, как в next_step
+
+    :param grid: CandidateGrid
+    :param changed: Индексы клеток, кандидаты которых изменились после прошлого вызова
+    :return: Сколько цифр поставлено
+    """
+    cands = grid.cands
+    pending = [index for index in changed if cands[index] and not cands[index] & (cands[index] - 1)]
+    placed = 0
+    while pending:
+        index = pending.pop()
+        mask = cands[index]
+        if not mask or mask & (mask - 1):
+            continue
+        grid.values[index] = mask.bit_length() - 1
+        cands[index] = 0
+        placed += 1
+        for peer in PEERS[index]:
+            peer_mask = cands[peer]
+            if peer_mask & mask:
+                peer_mask &= ~mask
+                cands[peer] = peer_mask
+                if peer_mask and not peer_mask & (peer_mask - 1):
+                    pending.append(peer)
+    return placed
+
+
+def _find_hidden_single(grid):
+    """Скрытая одиночка: цифра помещается только в одну клетку группы"""
+    cands = grid.cands
+    for unit_index, unit in enumerate(UNITS):
+        once = twice = 0
+        for index in unit:
+            mask = cands[index]
+            twice |= once & mask
+            once |= mask
+        single = once & ~twice
+        if single:
+            bit = single & -single
+            for index in unit:
+                if cands[index] & bit:
+                    digit = bit.bit_length() - 1
+                    return [(index, digit)], [], f"{digit} fits only {cell_name(index)} in {UNIT_NAMES[unit_index]}"
+    return None
+
+
+def _find_pointing(grid):
+    """Указывающие кандидаты: цифра внутри блока лежит в одной строке (столбце) - вычеркнуть её из остальной линии"""
+    boards = _digit_boards(grid.cands)
+    for box in range(9):
+        box_bits = UNIT_BITS[18 + box]
+        for digit in range(1, 10):
+            where = boards[digit] & box_bits
+            if not where & (where - 1):
+                continue
+            first = (where & -where).bit_length() - 1
+            for line, offset, line_name in ((ROW_OF[first], 0, "row"), (COL_OF[first], 9, "column")):
+                line_bits = UNIT_BITS[offset + line]
+                if not where & ~line_bits:
+                    targets = boards[digit] & line_bits & ~box_bits
+                    if targets:
+                        bit = 1 << digit
+                        return ([], [(index, bit) for index in _bit_indices(targets)],
+                                f"{digit} in box {box + 1} is confined to {line_name} {line + 1}")
+    return None
+
+
+def _find_claiming(grid):
+    """Захват: цифра внутри строки (столбца) лежит в одном блоке - вычеркнуть её из остального блока"""
+    boards = _digit_boards(grid.cands)
+    for unit_index in range(18):
+        line_bits = UNIT_BITS[unit_index]
+        for digit in range(1, 10):
+            where = boards[digit] & line_bits
+            if not where & (where - 1):
+                continue
+            box = BOX_OF[(where & -where).bit_length() - 1]
+            box_bits = UNIT_BITS[18 + box]
+            if not where & ~box_bits:
+                targets = boards[digit] & box_bits & ~line_bits
+                if targets:
+                    bit = 1 << digit
+                    return ([], [(index, bit) for index in _bit_indices(targets)],
+                            f"{digit} in {UNIT_NAMES[unit_index]} is confined to box {box + 1}")
+    return None
+
+
+def _find_naked_subset(size, grid):
+    """Голые пары/тройки: size клеток группы содержат ровно size кандидатов - вычеркнуть их из остальных клеток"""
+    cands = grid.cands
+    for unit_index, unit in enumerate(UNITS):
+        open_cells = [index for index in unit if cands[index]]
+        if len(open_cells) <= size:
+            continue
+        small = [index for index in open_cells if BIT_COUNT[cands[index]] <= size]
+        for combo in itertools.combinations(small, size):
+            union = 0
+            for index in combo:
+                union |= cands[index]
+            if BIT_COUNT[union] != size:
+                continue
+            targets = [(index, union) for index in open_cells if index not in combo and cands[index] & union]
+            if targets:
+                digits = "".join(map(str, MASK_DIGITS[union]))
+                cells = ", ".join(cell_name(index) for index in combo)
+                return [], targets, f"{cells} hold only {digits} in {UNIT_NAMES[unit_index]}"
+    return None
+
+
+def _find_hidden_subset(size, grid):
+    """Скрытые пары/тройки: size цифр группы помещаются только в size клеток - прочие кандидаты этих клеток лишние"""
+    cands = grid.cands
+    for unit_index, unit in enumerate(UNITS):
+        open_cells = [index for index in unit if cands[index]]
+        if len(open_cells) <= size:
+            continue
+        positions = {}
+        for slot, index in enumerate(unit):
+            for digit in MASK_DIGITS[cands[index]]:
+                positions[digit] = positions.get(digit, 0) | (1 << slot)
+        digits = [digit for digit, where in positions.items() if 2 <= BIT_COUNT[where] <= size]
+        for combo in itertools.combinations(digits, size):
+            where = 0
+            keep = 0
+            for digit in combo:
+                where |= positions[digit]
+                keep |= 1 << digit
+            if BIT_COUNT[where] != size:
+                continue
+            cells = [unit[slot] for slot in range(9) if where >> slot & 1]
+            targets = [(index, cands[index] & ~keep) for index in cells if cands[index] & ~keep]
+            if targets:
+                names = ", ".join(cell_name(index) for index in cells)
+                return [], targets, (f"{''.join(map(str, combo))} fit only {names} "
+                                     f"in {UNIT_NAMES[unit_index]}")
+    return None
+
+
+def _find_fish(size, grid):
+    """X-Wing (size=2) и Swordfish (size=3): цифра в size строках лежит в тех же size столбцах (или наоборот)"""
+    cands = grid.cands
+    row_covers = [[0] * 9 for _ in range(10)]
+    col_covers = [[0] * 9 for _ in range(10)]
+    for index in range(81):
+        row, col = ROW_OF[index], COL_OF[index]
+        for digit in MASK_DIGITS[cands[index]]:
+            row_covers[digit][row] |= 1 << col
+            col_covers[digit][col] |= 1 << row
+    for digit in range(1, 10):
+        bit = 1 << digit
+        for by_rows in (True, False):
+            covers = row_covers[digit] if by_rows else col_covers[digit]
+            lines = [(line, where) for line, where in enumerate(covers) if 2 <= BIT_COUNT[where] <= size]
+            for combo in itertools.combinations(lines, size):
+                union = 0
+                for _, where in combo:
+                    union |= where
+                if BIT_COUNT[union] != size:
+                    continue
+                base = {line for line, _ in combo}
+                targets = []
+                for cover in range(9):
+                    if not union >> cover & 1:
+                        continue
+                    for line in range(9):
+                        index = line * 9 + cover if by_rows else cover * 9 + line
+                        if line not in base and cands[index] & bit:
+                            targets.append((index, bit))
+                if targets:
+                    base_name = "rows" if by_rows else "columns"
+                    base_text = ", ".join(str(line + 1) for line in sorted(base))
+                    return [], targets, f"{digit} in {base_name} {base_text} is locked to {size} lines"
+    return None
+
+
+def _find_xy_wing(grid):
+    """XY-Wing: опорная клетка {a,b} и две клетки-клешни {a,c} и {b,c} - c вычёркивается из общих соседей клешней"""
+    cands = grid.cands
+    for pivot in range(81):
+        pivot_mask = cands[pivot]
+        if BIT_COUNT[pivot_mask] != 2:
+            continue
+        wings = [peer for peer in PEERS[pivot]
+                 if BIT_COUNT[cands[peer]] == 2 and BIT_COUNT[cands[peer] & pivot_mask] == 1]
+        for first, second in itertools.combinations(wings, 2):
+            first_mask = cands[first]
+            second_mask = cands[second]
+            shared = first_mask & second_mask & ~pivot_mask
+            if (BIT_COUNT[shared] != 1 or (first_mask & pivot_mask) == (second_mask & pivot_mask)):
+                continue
+            targets = [(index, shared) for index in PEER_SETS[first] & PEER_SETS[second]
+                       if index != pivot and cands[index] & shared]
+            if targets:
+                digit = shared.bit_length() - 1
+                return [], targets, (f"pivot {cell_name(pivot)} with wings {cell_name(first)} and "
+                                     f"{cell_name(second)} removes {digit}")
+    return None
+
+
+def _find_simple_coloring(grid):
+    """Раскраска (цепочки одной цифры): сопряжённые пары красятся в два цвета, противоречия дают вычёркивания"""
+    cands = grid.cands
+    boards = _digit_boards(cands)
+    for digit in range(1, 10):
+        bit = 1 << digit
+        links = {}
+        for unit_bits in UNIT_BITS:
+            where = boards[digit] & unit_bits
+            rest = where & (where - 1)
+            if rest and not rest & (rest - 1):
+                cells = ((where & -where).bit_length() - 1, rest.bit_length() - 1)
+                links.setdefault(cells[0], []).append(cells[1])
+                links.setdefault(cells[1], []).append(cells[0])
+
+        colors = {}
+        for root in links:
+            if root in colors:
+                continue
+            colors[root] = 0
+            component = [root]
+            queue = [root]
+            while queue:
+                index = queue.pop()
+                for neighbour in links[index]:
+                    if neighbour not in colors:
+                        colors[neighbour] = 1 - colors[index]
+                        component.append(neighbour)
+                        queue.append(neighbour)
+            if len(component) < 3:
+                continue
+
+            groups = ([index for index in component if colors[index] == 0],
+                      [index for index in component if colors[index] == 1])
+            for color, group in enumerate(groups):
+                for first, second in itertools.combinations(group, 2):
+                    if second in PEER_SETS[first]:
+                        targets = [(index, bit) for index in group]
+                        return [], targets, (f"chain of {digit} puts two cells of one colour in sight of "
+                                             f"each other ({cell_name(first)}, {cell_name(second)})")
+            members = set(component)
+            for index in range(81):
+                if index in members or not cands[index] & bit:
+                    continue
+                peers = PEER_SETS[index]
+                if any(cell in peers for cell in groups[0]) and any(cell in peers for cell in groups[1]):
+                    return [], [(index, bit)], f"{cell_name(index)} sees both colours of the {digit} chain"
+    return None
+
+
+TECHNIQUES = (
+    ("naked_single", 1, _find_naked_single),
+    ("hidden_single", 2, _find_hidden_single),
+    ("pointing", 10, _find_pointing),
+    ("claiming", 10, _find_claiming),
+    ("naked_pair", 15, functools.partial(_find_naked_subset, 2)),
+    ("hidden_pair", 20, functools.partial(_find_hidden_subset, 2)),
+    ("naked_triple", 25, functools.partial(_find_naked_subset, 3)),
+    ("hidden_triple", 30, functools.partial(_find_hidden_subset, 3)),
+    ("x_wing", 50, functools.partial(_find_fish, 2)),
+    ("swordfish", 80, functools.partial(_find_fish, 3)),
+    ("xy_wing", 100, _find_xy_wing),
+    ("simple_coloring", 120, _find_simple_coloring),
+)
+"""tuple: Логические приёмы от простых к сложным: (имя, вес в оценке, функция поиска шага). Из цепочек есть только раскраска одной цифры (simple_coloring) и XY-Wing - головоломки, которым нужны X/XY-цепочки, получают 'guess'"""
+
+TECHNIQUE_TITLES = {
+    "naked_single": "Naked single", "hidden_single": "Hidden single",
+    "pointing": "Pointing", "claiming": "Claiming",
+    "naked_pair": "Naked pair", "hidden_pair": "Hidden pair",
+    "naked_triple": "Naked triple", "hidden_triple": "Hidden triple",
+    "x_wing": "X-Wing", "swordfish": "Swordfish",
+    "xy_wing": "XY-Wing", "simple_coloring": "Simple coloring",
+    "guess": "Guess",
+}
+"""dict: Названия приёмов для объяснений игроку"""
+
+TECHNIQUE_WEIGHTS = {name: weight for name, weight, _ in TECHNIQUES}
+"""dict: Вес каждого приёма в оценке сложности"""
+
+GUESS_WEIGHT = 500
+"""int: Вес перебора, когда логических приёмов не хватает"""
+
+TECHNIQUE_WEIGHTS["guess"] = GUESS_WEIGHT
+
+GRADE_TECHNIQUES = TECHNIQUES[1:]
+"""tuple: Приёмы, которые grade_puzzle ищет через next_step (голые одиночки ставит _place_naked_singles)"""
+
+SCORE_BAND_ATTEMPTS = 50
+"""int: Сколько головоломок генерируется в поисках попадания в диапазон оценки (см. generate_board)"""
+
+
+def next_step(grid, techniques=TECHNIQUES):
+    """
+    Находит самый простой логический шаг на поле с пометками
+
+    :param grid: CandidateGrid
+    :param techniques: Приёмы в порядке возрастания сложности (часть TECHNIQUES)
+    :return: Step или None, если ни один приём не применим
+    """
+    for name, _, finder in techniques:
+        found = finder(grid)
+        if found is not None:
+            return Step(name, *found)
+    return None
+
+
+class GradeResult:
+    """Результат оценки сложности головоломки логическим решателем"""
+    __slots__ = ("techniques", "score", "solved", "steps")
+
+    def __init__(self, techniques, score, solved, steps):
+        self.techniques = techniques
+        """dict: Имя приёма -> сколько раз он понадобился"""
+
+        self.score = score
+        """int: Числовая сложность - сумма весов всех применённых шагов"""
+
+        self.solved = solved
+        """bool: True, если головоломка решена без перебора"""
+
+        self.steps = steps
+        """int: Количество логических шагов"""
+
+    @property
+    def hardest(self):
+        """Самый сложный понадобившийся приём (None для заполненного поля)"""
+        if not self.techniques:
+            return None
+        return max(self.techniques, key=TECHNIQUE_WEIGHTS.__getitem__)
+
+    def __repr__(self):
+        return f"GradeResult(score={self.score}, hardest={self.hardest!r}, solved={self.solved})"
+
+
+def grade_puzzle(game_board):
+    """
+    Решает головоломку логическими приёмами от простых к сложным и оценивает сложность
+
+    На каждом шаге применяется самый простой из подходящих приёмов. Если ни один
+    приём не помогает, решение прекращается, а в результат добавляется 'guess'
+
+    Голые одиночки ставятся пачкой (_place_naked_singles), остальные приёмы
+    ищутся через next_step по всему полю. Одно ядро оценивает порядка 13-20 тыс.
+    головоломок в секунду на уровне 1, 10-12 тыс. на уровне 2 и 1.3-1.7 тыс. на
+    уровне 3: там цепочка приёмов проходится заново после каждого шага, и
+    скорость ограничена поиском скрытых одиночек и подмножеств (bench grade)
+
+    :param game_board: Поле 9x9 (Board или список списков)
+    :return: GradeResult
+    """
+    grid = CandidateGrid(game_board)
+    techniques = {}
+    score = 0
+    steps = 0
+    solved = True
+    single_weight = TECHNIQUE_WEIGHTS["naked_single"]
+    changed = range(81)
+    while True:
+        singles = _place_naked_singles(grid, changed)
+        if singles:
+            techniques["naked_single"] = techniques.get("naked_single", 0) + singles
+            score += singles * single_weight
+            steps += singles
+        if not grid.values.count(0):
+            break
+        step = next_step(grid, GRADE_TECHNIQUES)
+        if step is None or not grid.apply(step):
+            techniques["guess"] = 1
+            score += GUESS_WEIGHT
+            solved = False
+            break
+        techniques[step.technique] = techniques.get(step.technique, 0) + 1
+        score += TECHNIQUE_WEIGHTS[step.technique]
+        steps += 1
+        changed = [index for index, _ in step.eliminations]
+        changed.extend(peer for index, _ in step.placements for peer in PEERS[index])
+    return GradeResult(techniques, score, solved, steps)
+
+
+def grade_many(boards, workers=None, chunk_size=64):
+    """
+    Оценивает много головоломок на нескольких ядрах
+
+    Запуск пула spawn стоит десятые доли секунды, поэтому при одном ядре или
+    пачке не больше chunk_size поля оцениваются в текущем процессе
+
+    :param boards: Список полей
+    :param workers: Количество процессов (1 - без пула процессов, None - по числу ядер)
+    :param chunk_size: Сколько полей отправлять процессу за раз
+    :return: Список GradeResult в порядке полей
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(boards) <= chunk_size:
+        return [grade_puzzle(board) for board in boards]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(grade_puzzle, boards, chunksize=chunk_size))
+
+
+class HintEngine:
+    """
+    Подсказки следующего логического шага для живого поля партии
+
+    Кандидаты хранятся в CandidateGrid и обновляются по одной клетке при каждом
+    ходе (set_cell, clear_cell), поэтому поиск шага не решает поле заново.
+    Вычеркивания, найденные приёмами, запоминаются в excluded: для головоломки
+    с единственным решением они верны при любом дальнейшем ходе игрока
+    """
+    __slots__ = ("candidates", "excluded", "used")
+
+    def __init__(self, game_board=None):
+        """
+        :param game_board: Начальное поле (None - пустое)
+        """
+        self.reset(game_board)
+
+    def reset(self, game_board=None):
+        """Пересчитывает кандидатов для нового поля и забывает вычеркивания"""
+        self.candidates = CandidateGrid(game_board)
+        """CandidateGrid: Текущие значения и кандидаты клеток"""
+
+        self.excluded = [0] * 81
+        """list[int]: Маски кандидатов каждой клетки, вычеркнутых логическими приёмами"""
+
+        self.used = []
+        """list[str]: Приёмы вычеркивания, понадобившиеся при последнем вызове next_step"""
+
+    def set_cell(self, index, digit):
+        """Ставит цифру в клетку (ход игрока или подсказка)"""
+        if self.candidates.values[index]:
+            self.clear_cell(index)
+        self.candidates.place(index, digit)
+
+    def clear_cell(self, index):
+        """Очищает клетку и возвращает её цифру в кандидаты соседей, где она больше ничем не закрыта"""
+        values = self.candidates.values
+        cands = self.candidates.cands
+        digit = values[index]
+        if not digit:
+            return
+        values[index] = 0
+        seen = 0
+        for peer in PEERS[index]:
+            seen |= 1 << values[peer]
+        cands[index] = FULL_MASK & ~seen & ~self.excluded[index]
+
+        bit = 1 << digit
+        for peer in PEERS[index]:
+            if values[peer] or self.excluded[peer] & bit:
+                continue
+            if not any(values[other] == digit for other in PEERS[peer]):
+                cands[peer] |= bit
+
+    def sync(self, game_board):
+        """Приводит кандидатов к полю game_board (Board), обновляя только отличающиеся клетки"""
+        values = self.candidates.values
+        cells = game_board.cells
+        for index in range(81):
+            if values[index] != cells[index]:
+                if cells[index]:
+                    self.set_cell(index, cells[index])
+                else:
+                    self.clear_cell(index)
+
+    def next_step(self):
+        """
+        Находит самый простой шаг, ставящий цифру
+
+        Шаги, которые только вычёркивают кандидатов, применяются сразу, а их
+        приёмы сохраняются в used
+
+        :return: Step с постановкой цифры или None, если логики не хватает
+        """
+        self.used = []
+        grid = self.candidates
+        while True:
+            step = next_step(grid)
+            if step is None or step.placements:
+                return step
+            for index, mask in step.eliminations:
+                self.excluded[index] |= mask
+                grid.cands[index] &= ~mask
+            if step.technique not in self.used:
+                self.used.append(step.technique)
+
+    def cell_step(self, index):
+        """
+        Объясняет клетку, если её цифра видна сразу (голая или скрытая одиночка)
+
+        :return: Step или None
+        """
+        cands = self.candidates.cands
+        mask = cands[index]
+        if mask and not mask & (mask - 1):
+            digit = mask.bit_length() - 1
+            return Step("naked_single", [(index, digit)], [], f"{cell_name(index)} can only be {digit}")
+        for unit_index in (ROW_OF[index], 9 + COL_OF[index], 18 + BOX_OF[index]):
+            others = 0
+            for other in UNITS[unit_index]:
+                if other != index:
+                    others |= cands[other]
+            single = mask & ~others
+            if single and not single & (single - 1):
+                digit = single.bit_length() - 1
+                return Step("hidden_single", [(index, digit)], [],
+                            f"{digit} fits only {cell_name(index)} in {UNIT_NAMES[unit_index]}")
+        return None
+
+
+class TimingStats:
+    """Накопительная статистика длительностей: количество, сумма и максимум"""
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        """int: Количество замеров"""
+
+        self.total = 0.0
+        """float: Суммарное время в секундах"""
+
+        self.max = 0.0
+        """float: Самый долгий замер в секундах"""
+
+    def add(self, seconds):
+        """Добавляет один замер"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        """Возвращает статистику в виде словаря (время в миллисекундах)"""
+        mean = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "total_ms": self.total * 1000, "mean_ms": mean * 1000, "max_ms": self.max * 1000}
+
+
+generation_timings = {}
+"""dict: Статистика генерации уровней. (difficulty, этап) -> TimingStats. Этапы: 'fill' - построение решения, 'dig' и 'dig_unique' - удаление клеток"""
+
+
+def get_generation_timings():
+    """
+    Возвращает накопленное время генерации по сложностям
+
+    :return: dict {difficulty: {этап: {'count', 'total_ms', 'mean_ms', 'max_ms'}}}
+    """
+    report = {}
+    for (difficulty, stage), stats in sorted(generation_timings.items()):
+        report.setdefault(difficulty, {})[stage] = stats.as_dict()
+    return report
+
+
+def _record_generation_time(difficulty, stage, seconds):
+    """Добавляет замер этапа генерации в generation_timings"""
+    key = (difficulty, stage)
+    if key not in generation_timings:
+        generation_timings[key] = TimingStats()
+    generation_timings[key].add(seconds)
+
+
+class TimingHistogram(TimingStats):
+    """TimingStats с гистограммой: корзина k содержит замеры от 2^(k-1) до 2^k микросекунд"""
+    __slots__ = ("buckets",)
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = [0] * 32
+        """list[int]: Количество замеров в каждой корзине"""
+
+    def add(self, seconds):
+        """Добавляет один замер"""
+        super().add(seconds)
+        self.buckets[min(int(seconds * 1e6).bit_length(), 31)] += 1
+
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает перцентиль fraction (0..1), в миллисекундах"""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for bucket, amount in enumerate(self.buckets):
+            seen += amount
+            if seen >= threshold:
+                return (1 << bucket) / 1000
+        return self.max * 1000
+
+    def as_dict(self):
+        """Статистика в виде словаря: к TimingStats.as_dict добавляются p50, p99 и непустые корзины"""
+        result = super().as_dict()
+        result["p50_ms"] = self.percentile(0.5)
+        result["p99_ms"] = self.percentile(0.99)
+        result["buckets_us"] = {1 << bucket: amount for bucket, amount in enumerate(self.buckets) if amount}
+        return result
+
+
+INSTRUMENT_ENV = "SUDOKU_INSTRUMENT"
+"""str: Переменная окружения, включающая инструментирование (значение '1')"""
+
+
+class Instrumentation:
+    """
+    Необязательный сбор счётчиков и гистограмм времени горячих участков
+
+    Пока enabled равен False, count и observe сразу возвращаются, а обёртки timed
+    вызывают функцию напрямую после одной проверки флага
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        """bool: Включён ли сбор"""
+
+        self.counters = {}
+        """dict: Имя -> значение счётчика"""
+
+        self.histograms = {}
+        """dict: Имя -> TimingHistogram"""
+
+    def count(self, name, amount=1):
+        """Увеличивает счётчик"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def maximum(self, name, value):
+        """Запоминает в счётчике наибольшее из наблюдавшихся значений (например, глубину рекурсии)"""
+        if self.enabled and value > self.counters.get(name, 0):
+            self.counters[name] = value
+
+    def observe(self, name, seconds):
+        """Добавляет замер времени в гистограмму"""
+        if self.enabled:
+            if name not in self.histograms:
+                self.histograms[name] = TimingHistogram()
+            self.histograms[name].add(seconds)
+
+    def timed(self, name):
+        """Декоратор: время каждого вызова функции попадает в гистограмму name"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Возвращает счётчики и гистограммы в виде словаря"""
+        return {"counters": dict(sorted(self.counters.items())),
+                "histograms": {name: stats.as_dict() for name, stats in sorted(self.histograms.items())}}
+
+    def dump(self, path):
+        """Записывает snapshot в JSON-файл"""
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(self.snapshot(), output, indent=2)
+
+    def reset(self):
+        """Обнуляет собранные данные"""
+        self.counters.clear()
+        self.histograms.clear()
+
+
+instrumentation = Instrumentation(os.environ.get(INSTRUMENT_ENV) == "1")
+"""Instrumentation: Общий сбор счётчиков и времени. Включается переменной SUDOKU_INSTRUMENT=1 или флагом --instrument"""
+
+
+def profile_call(path, func, *args, **kwargs):
+    """
+    Выполняет func(*args, **kwargs) под cProfile и сохраняет профиль в файл (формат pstats)
+
+    :param path: Файл профиля, его можно открыть через python -m pstats или snakeviz
+    :return: Результат func
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
+
+
+def _dig_unique(board, target_deleted, rng=None):
+    """
+    Удаляет клетки симметричными парами, сохраняя единственность решения
+
+    Пара (index, 80 - index) симметрична относительно центра поля. Пара удаляется,
+    только если count_solutions с порогом 2 подтверждает единственное решение.
+    Каждая пара пробуется один раз, поэтому удалено может быть меньше target_deleted
+
+    :param board: Решённое поле Board, из которого удаляются клетки (меняется на месте)
+    :param target_deleted: Желаемое количество пустых клеток
+    :param rng: Источник случайности (random.Random). None - глобальный модуль random
+    :return: Количество удалённых клеток
+    """
+    cells = board.cells
+    pairs = [(index, 80 - index) if index != 40 else (40,) for index in range(41)]
+    (rng or random).shuffle(pairs)
+    deleted = 0
+    for pair in pairs:
+        if deleted + len(pair) > target_deleted:
+            continue
+        instrumentation.count("generate.dig_attempts")
+        saved = [cells[index] for index in pair]
+        for index in pair:
+            cells[index] = 0
+        if count_solutions(board, 2) == 1:
+            deleted += len(pair)
+            if deleted == target_deleted:
+                break
+        else:
+            instrumentation.count("generate.dig_rejected")
+            for index, value in zip(pair, saved):
+                cells[index] = value
+    instrumentation.count("generate.dig_deleted", deleted)
+    return deleted
+
+
+def generate_board(difficulty, engine="backtrack", unique=False, pack=None, score_band=None, seed=None,
+                   solution_source="search"):
+    """
+    Генерирует игровое поле и решение
+
+    Генерация использует собственный random.Random(seed), поэтому одно и то же зерно
+    даёт один и тот же уровень в любом процессе (см. также make_puzzle_id).
+    Время этапов генерации накапливается в generation_timings (см. get_generation_timings)
+
+    :param difficulty: Сложность (1, 2 или 3)
+    :param engine: Движок решателя для построения решения (см. SOLVER_ENGINES)
+    :param unique: Если True, клетки удаляются симметрично и только пока решение остаётся единственным
+    :param pack: PuzzlePack, из которого берётся готовый уровень вместо генерации
+    :param score_band: Пара (min, max) оценки grade_puzzle. Поле генерируется с единственным решением,
+        до SCORE_BAND_ATTEMPTS попыток; если ни одна не попала в диапазон, возвращается ближайшая
+    :param seed: Зерно генерации (int или str). None - зерно берётся из глобального модуля random
+    :param solution_source: 'search' - решение строится решателем engine с пустого поля,
+        'transform' - случайным преобразованием одного из base_solutions (без перебора)
+    :return: (game_board, solution_board, hints, mistakes)
+    :raises SudokuError: Если сложность или движок указаны неверно, или в наборе нет уровней этой сложности
+    :raises ValueError: Если диапазон оценки пуст или источник решения неизвестен
+    """
+    hints_map = {1: 6, 2: 4, 3: 2}
+
+    if difficulty not in hints_map:
+        raise SudokuError(f"Неверный уровень сложности: {difficulty}. Ожидался 1, 2 или 3 (Easy, Medium, Hard)")
+
+    if solution_source not in ("search", "transform"):
+        raise ValueError(f"Неизвестный источник решения: {solution_source}. Ожидался 'search' или 'transform'")
+
+    hints_left = hints_map[difficulty]
+    mistakes_left = hints_map[difficulty] - 1
+    rng = random.Random(random.getrandbits(64) if seed is None else seed)
+
+    if score_band is not None:
+        low, high = score_band
+        if low > high:
+            raise ValueError(f"Пустой диапазон оценки: {score_band}")
+        best = None
+        best_distance = None
+        for _ in range(SCORE_BAND_ATTEMPTS):
+            puzzle, solution, _, _ = generate_board(difficulty, engine, unique=True, seed=rng.getrandbits(64),
+                                                    solution_source=solution_source)
+            score = grade_puzzle(puzzle).score
+            distance = max(low - score, score - high, 0)
+            if best is None or distance < best_distance:
+                best = puzzle, solution
+                best_distance = distance
+            if not distance:
+                break
+        return best[0], best[1], hints_left, mistakes_left
+
+    if pack is not None:
+        puzzle, solution = pack.random_puzzle(difficulty, rng)
+        return puzzle, solution, hints_left, mistakes_left
+
+    started = time.perf_counter()
+    if solution_source == "transform":
+        puzzle = Board(apply_transform(rng.choice(base_solutions()), random_transform(rng)))
+    else:
+        puzzle = Board()
+        solved_board(puzzle, engine, rng)
+    filled = time.perf_counter()
+    _record_generation_time(difficulty, "fill", filled - started)
+
+    solution = puzzle
+    copied_board = puzzle.copy()
+    cells = copied_board.cells
+    target_deleted = difficulty * 20
+
+    if unique:
+        _dig_unique(copied_board, target_deleted, rng)
+        _record_generation_time(difficulty, "dig_unique", time.perf_counter() - filled)
+        return copied_board, solution, hints_left, mistakes_left
+
+    for index in rng.sample(range(81), target_deleted):
+        cells[index] = 0
+    # Выборка без повторов: каждая попытка удаляет клетку, отклонённых попыток не бывает
+    instrumentation.count("generate.dig_attempts", target_deleted)
+    instrumentation.count("generate.dig_deleted", target_deleted)
+
+    _record_generation_time(difficulty, "dig", time.perf_counter() - filled)
+    return copied_board, solution, hints_left, mistakes_left
+
+
+PUZZLE_ID_ENGINES = {"backtrack": "b", "mrv": "m", "dlx": "d"}
+"""dict: Буква движка решателя в идентификаторе уровня"""
+
+PUZZLE_ID_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+"""str: Алфавит записи зерна в идентификаторе уровня (основание 36)"""
+
+
+def make_puzzle_id(difficulty, seed=None, unique=True, engine="backtrack"):
+    """
+    Составляет короткий идентификатор уровня, по которому generate_by_id всегда строит одно и то же поле
+
+    Формат: '<сложность><движок><u|r>-<зерно в base36>', например '3bu-2kf9xq1c7m0'
+
+    :param difficulty: Сложность (1, 2 или 3)
+    :param seed: Целое неотрицательное зерно. None - случайное 64-битное
+    :param unique: Режим генерации с единственным решением
+    :param engine: Движок решателя из PUZZLE_ID_ENGINES
+    :return: Строка идентификатора
+    :raises ValueError: Если параметры не помещаются в идентификатор
+    """
+    if difficulty not in (1, 2, 3) or engine not in PUZZLE_ID_ENGINES:
+        raise ValueError(f"Неверная сложность или движок для идентификатора: {difficulty}, {engine}")
+    if seed is None:
+        seed = random.getrandbits(64)
+    if not isinstance(seed, int) or seed < 0:
+        raise ValueError(f"Зерно идентификатора должно быть неотрицательным целым, получено {seed!r}")
+    digits = ""
+    while True:
+        seed, rest = divmod(seed, 36)
+        digits = PUZZLE_ID_ALPHABET[rest] + digits
+        if not seed:
+            break
+    return f"{difficulty}{PUZZLE_ID_ENGINES[engine]}{'u' if unique else 'r'}-{digits}"
+
+
+def parse_puzzle_id(puzzle_id):
+    """
+    Разбирает идентификатор make_puzzle_id
+
+    :return: (difficulty, seed, unique, engine)
+    :raises ValueError: Если строка не является идентификатором уровня
+    """
+    head, _, digits = puzzle_id.strip().lower().partition("-")
+    engines = {letter: name for name, letter in PUZZLE_ID_ENGINES.items()}
+    if (len(head) != 3 or head[0] not in "123" or head[1] not in engines or head[2] not in "ur"
+            or not digits or any(char not in PUZZLE_ID_ALPHABET for char in digits)):
+        raise ValueError(f"Неверный идентификатор уровня: {puzzle_id!r}")
+    return int(head[0]), int(digits, 36), head[2] == "u", engines[head[1]]
+
+
+def generate_by_id(puzzle_id):
+    """
+    Строит уровень по идентификатору (см. make_puzzle_id)
+
+    :return: (game_board, solution_board, hints, mistakes)
+    :raises ValueError: Если идентификатор неверен
+    """
+    difficulty, seed, unique, engine = parse_puzzle_id(puzzle_id)
+    return generate_board(difficulty, engine, unique=unique, seed=seed)
+
+
+BASE_SOLUTION_COUNT = 16
+"""int: Количество базовых решённых полей, из которых преобразованиями строятся новые решения"""
+
+
+@functools.lru_cache(maxsize=None)
+def base_solutions():
+    """
+    Базовые решённые поля для режима solution_source='transform'
+
+    Строятся один раз с фиксированными зёрнами, поэтому одинаковы в любом процессе
+
+    :return: Кортеж bytes по 81 клетке
+    """
+    grids = []
+    for index in range(BASE_SOLUTION_COUNT):
+        grid = Board()
+        solve(grid, "mrv", rng=random.Random(index))
+        grids.append(bytes(grid.cells))
+    return tuple(grids)
+
+
+def _shuffled_lines(rng):
+    """Случайная перестановка 9 строк (или столбцов), сохраняющая полосы 3x3: полосы и строки внутри полос"""
+    bands = [0, 1, 2]
+    rng.shuffle(bands)
+    lines = []
+    for band in bands:
+        inner = [0, 1, 2]
+        rng.shuffle(inner)
+        lines.extend(band * 3 + line for line in inner)
+    return lines
+
+
+def random_transform(rng=None):
+    """
+    Случайное преобразование, сохраняющее правила Судоку
+
+    :param rng: random.Random или модуль random (None - модуль random)
+    :return: (transposed, rows, cols, digits): транспонирование, перестановки строк и столбцов
+        (новая строка r берётся из строки rows[r]) и перенумерация цифр digits[old] -> new (digits[0] = 0)
+    """
+    rng = rng or random
+    digits = list(range(1, 10))
+    rng.shuffle(digits)
+    return rng.random() < 0.5, _shuffled_lines(rng), _shuffled_lines(rng), [0] + digits
+
+
+def apply_transform(cells, transform):
+    """
+    Применяет преобразование random_transform к полю
+
+    :param cells: 81 значение клеток (bytes, bytearray или Board.cells). Пустые клетки остаются пустыми
+    :return: bytes преобразованного поля
+    """
+    transposed, rows, cols, digits = transform
+    if transposed:
+        return bytes(digits[cells[cols[col] * 9 + rows[row]]] for row in range(9) for col in range(9))
+    return bytes(digits[cells[rows[row] * 9 + cols[col]]] for row in range(9) for col in range(9))
+
+
+def _numpy():
+    """
+    Ленивый импорт numpy для пакетных преобразований
+
+    :raises SudokuError: Если numpy не установлен
+    """
+    try:
+        import numpy
+    except ImportError as error:
+        raise SudokuError("Для пакетных преобразований нужен numpy: pip install numpy") from error
+    return numpy
+
+
+def _random_line_permutations(numpy, generator, count):
+    """Массив (count, 9) случайных перестановок строк с сохранением полос"""
+    bands = generator.permuted(numpy.tile(numpy.arange(3), (count, 1)), axis=1)
+    inner = generator.permuted(numpy.tile(numpy.arange(3), (count * 3, 1)), axis=1).reshape(count, 3, 3)
+    return (bands[:, :, None] * 3 + inner).reshape(count, 9)
+
+
+def transform_batch(grids, seed=None):
+    """
+    Применяет к каждому полю пачки своё случайное преобразование (векторно на numpy)
+
+    :param grids: Массив (N, 81) или (N, 9, 9) значений клеток либо список bytes по 81 клетке
+    :param seed: Зерно numpy.random.Generator
+    :return: Массив uint8 (N, 81)
+    :raises SudokuError: Если numpy не установлен
+    """
+    numpy = _numpy()
+    generator = numpy.random.default_rng(seed)
+    if isinstance(grids, (list, tuple)) and grids and isinstance(grids[0], (bytes, bytearray)):
+        grids = numpy.frombuffer(b"".join(grids), dtype=numpy.uint8)
+    grids = numpy.asarray(grids, dtype=numpy.uint8).reshape(-1, 81)
+    count = len(grids)
+
+    rows = _random_line_permutations(numpy, generator, count)
+    cols = _random_line_permutations(numpy, generator, count)
+    transposed = (generator.random(count) < 0.5)[:, None, None]
+    positions = numpy.where(transposed, cols[:, None, :] * 9 + rows[:, :, None], rows[:, :, None] * 9 + cols[:, None, :])
+    moved = numpy.take_along_axis(grids, positions.reshape(count, 81), axis=1)
+
+    digits = numpy.zeros((count, 10), dtype=numpy.uint8)
+    digits[:, 1:] = generator.permuted(numpy.tile(numpy.arange(1, 10, dtype=numpy.uint8), (count, 1)), axis=1)
+    return numpy.take_along_axis(digits, moved.astype(numpy.intp), axis=1)
+
+
+def solution_batch(count, seed=None):
+    """
+    Строит count решённых полей преобразованиями базовых решений без перебора
+
+    :return: Массив uint8 (count, 81)
+    :raises SudokuError: Если numpy не установлен
+    """
+    numpy = _numpy()
+    generator = numpy.random.default_rng(seed)
+    bases = numpy.frombuffer(b"".join(base_solutions()), dtype=numpy.uint8).reshape(-1, 81)
+    return transform_batch(bases[generator.integers(0, len(bases), count)], generator)
+
+
+VALIDATE_CHUNK = 2048
+"""int: Сколько полей validate_batch обрабатывает за один векторный проход (подобрано под кэш процессора)"""
+
+CELL_UNITS = tuple((ROW_OF[index], 9 + COL_OF[index], 18 + BOX_OF[index]) for index in range(81))
+"""tuple: Номера трёх групп UNITS (строка, столбец, блок) для каждой клетки"""
+
+DIGIT_NIBBLES = 0x1111111110
+"""int: Младшие биты 4-битных счётчиков цифр 1..9 в упакованной сумме группы"""
+
+class BatchValidation:
+    """Результат пакетной проверки полей validate_batch. Все поля - массивы numpy по числу досок"""
+    __slots__ = ("valid", "complete", "conflicts")
+
+    def __init__(self, valid, complete, conflicts):
+        self.valid = valid
+        """numpy.ndarray: bool (N,) - ни одна цифра не повторяется в строке, столбце или блоке"""
+
+        self.complete = complete
+        """numpy.ndarray: bool (N,) - пустых клеток не осталось"""
+
+        self.conflicts = conflicts
+        """numpy.ndarray: bool (N, 9, 9) - клетки, цифра которых повторяется у соседа"""
+
+    @property
+    def solved(self):
+        """numpy.ndarray: bool (N,) - поле заполнено и без конфликтов, то есть решено"""
+        return self.valid & self.complete
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __repr__(self):
+        return (f"BatchValidation(boards={len(self)}, valid={int(self.valid.sum())}, "
+                f"solved={int(self.solved.sum())})")
+
+
+def _batch_array(numpy, boards):
+    """Приводит пачку полей к массиву uint8 (N, 81) и проверяет значения клеток"""
+    if isinstance(boards, (list, tuple)) and boards and isinstance(boards[0], (bytes, bytearray)):
+        boards = numpy.frombuffer(b"".join(boards), dtype=numpy.uint8)
+    boards = numpy.asarray(boards)
+    if boards.size % 81:
+        raise ValueError(f"Ожидались поля по 81 клетке, получен массив формы {boards.shape}")
+    boards = boards.reshape(-1, 81)
+    if boards.size and (boards.min() < 0 or boards.max() > 9):
+        raise ValueError("Значения клеток должны быть от 0 до 9")
+    return boards.astype(numpy.uint8, copy=False)
+
+
+def validate_batch(boards, chunk_size=VALIDATE_CHUNK):
+    """
+    Векторно проверяет пачку полей: конфликты в строках, столбцах и блоках и заполненность
+
+    Каждая цифра v кодируется как 1 << 4v, и сумма кодов группы хранит в uint64 сразу
+    десять 4-битных счётчиков цифр (больше 9 в группе не бывает). Цифра повторяется в
+    группе, если в её счётчике выставлен любой бит старше младшего. Клетка конфликтует,
+    если её цифра повторяется хотя бы в одной из трёх её групп. Циклов Python по полям
+    нет, только по частям пачки размером chunk_size
+
+    :param boards: Массив (N, 9, 9) или (N, 81) значений 0..9 либо список bytes по 81 клетке
+    :param chunk_size: Полей в одном векторном проходе
+    :return: BatchValidation
+    :raises ValueError: Если форма массива или значения клеток неверны
+    :raises SudokuError: Если numpy не установлен
+    """
+    numpy = _numpy()
+    boards = _batch_array(numpy, boards)
+    units = numpy.array(UNITS, dtype=numpy.intp)
+    cell_units = numpy.array(CELL_UNITS, dtype=numpy.intp)
+    codes = numpy.uint64(1) << numpy.arange(0, 40, 4, dtype=numpy.uint64)
+    one, two, three = numpy.uint64(1), numpy.uint64(2), numpy.uint64(3)
+    conflicts = numpy.empty(boards.shape, dtype=bool)
+    for start in range(0, len(boards), chunk_size):
+        cells = codes[boards[start:start + chunk_size]]
+        sums = cells[:, units].sum(axis=2)
+        repeated = ((sums >> one) | (sums >> two) | (sums >> three)) & numpy.uint64(DIGIT_NIBBLES)
+        around = repeated[:, cell_units]
+        conflicts[start:start + chunk_size] = ((around[:, :, 0] | around[:, :, 1] | around[:, :, 2]) & cells) != 0
+    return BatchValidation(~conflicts.any(axis=1), boards.all(axis=1), conflicts.reshape(-1, 9, 9))
+
+
+def validate_moves(boards, moves):
+    """
+    Векторно проверяет поток ходов, как is_valid_move, но для многих ходов сразу
+
+    Каждый ход проверяется относительно переданного состояния своего поля и не
+    применяется к нему: клетка должна быть пустой, а цифры не должно быть в её
+    строке, столбце и блоке
+
+    :param boards: Массив (N, 9, 9) или (N, 81) значений 0..9
+    :param moves: Массив (M, 4) ходов (номер поля, строка, столбец, цифра 1..9)
+    :return: Массив bool (M,) - допустим ли каждый ход
+    :raises ValueError: Если номер поля, координаты или цифра вне диапазона
+    :raises SudokuError: Если numpy не установлен
+    """
+    numpy = _numpy()
+    boards = _batch_array(numpy, boards)
+    moves = numpy.asarray(moves, dtype=numpy.intp).reshape(-1, 4)
+    board, row, col, digit = moves.T
+    if len(moves) and not ((0 <= board).all() and (board < len(boards)).all() and (0 <= row).all()
+                           and (row < 9).all() and (0 <= col).all() and (col < 9).all()
+                           and (1 <= digit).all() and (digit <= 9).all()):
+        raise ValueError("Номер поля, координаты или цифра хода вне диапазона")
+    peers = numpy.array(PEERS, dtype=numpy.intp)
+    cell = row * 9 + col
+    seen = numpy.take_along_axis(boards[board], peers[cell], axis=1)
+    return (boards[board, cell] == 0) & ~(seen == digit[:, None]).any(axis=1)
+
+
+@functools.lru_cache(maxsize=None)
+def _column_permutations():
+    """Все 1296 перестановок столбцов, сохраняющих стопки: массив (1296, 9)"""
+    numpy = _numpy()
+    triples = list(itertools.permutations(range(3)))
+    return numpy.array([[stack * 3 + inner[stack_index][line]
+                         for stack_index, stack in enumerate(stacks) for line in range(3)]
+                        for stacks in triples for inner in itertools.product(triples, repeat=3)], dtype=numpy.intp)
+
+
+_BAND_MATES = ((1, 2), (0, 2), (0, 1), (4, 5), (3, 5), (3, 4), (7, 8), (6, 8), (6, 7))
+"""tuple: Две другие строки полосы для каждой строки 0..8"""
+
+
+def _canonical_search(cells):
+    """
+    Поиск канонической формы решённого поля и всех преобразований, которые к ней приводят
+
+    Кандидаты - 18 вариантов верхней строки (9 строк, с транспонированием и без) на
+    1296 перестановок столбцов, сохраняющих стопки. Цифры перенумеровываются так,
+    чтобы верхняя строка стала 123456789. Сначала для всех 23328 кандидатов векторно
+    считаются только две другие строки верхней полосы (после сортировки это строки 2 и 3
+    результата), и дальше проверяются лишь кандидаты с минимальной парой. У них строки
+    сортируются внутри полос, а полосы - по первой строке
+
+    :return: (canonical, transforms) - bytes канонического поля и список преобразований
+        в формате random_transform, переводящих поле в canonical (больше одного при симметрии поля)
+    """
+    numpy = _numpy()
+    grid = numpy.frombuffer(bytes(cells), dtype=numpy.uint8).reshape(9, 9)
+    if grid.size != 81 or not grid.all():
+        raise ValueError("Каноническая форма строится только для полностью заполненного поля")
+    columns = _column_permutations()
+    weights = 10 ** numpy.arange(8, -1, -1, dtype=numpy.int64)
+
+    permuted = numpy.stack([grid, grid.T])[:, :, columns].transpose(0, 2, 1, 3).reshape(-1, 9, 9).astype(numpy.intp)
+    tops = numpy.repeat(numpy.arange(9), len(permuted))
+    sources = numpy.tile(numpy.arange(len(permuted)), 9)
+    relabel = numpy.zeros((len(tops), 10), dtype=numpy.int64)
+    numpy.put_along_axis(relabel, permuted[sources, tops], numpy.arange(1, 10), axis=1)
+
+    mates = permuted[sources[:, None], numpy.array(_BAND_MATES)[tops]]
+    mate_keys = numpy.sort(numpy.take_along_axis(relabel[:, None, :], mates, axis=2) @ weights, axis=1)
+    survivors = numpy.flatnonzero(mate_keys[:, 0] == mate_keys[:, 0].min())
+    survivors = survivors[mate_keys[survivors, 1] == mate_keys[survivors, 1].min()]
+
+    best = None
+    transforms = []
+    for candidate in survivors:
+        top = int(tops[candidate])
+        source = int(sources[candidate])
+        digits = relabel[candidate]
+        keys = [int(key) for key in digits[permuted[source]] @ weights]
+        band = top // 3
+        order = [top] + sorted(_BAND_MATES[top], key=keys.__getitem__)
+        others = [sorted(range(other * 3, other * 3 + 3), key=keys.__getitem__) for other in range(3) if other != band]
+        others.sort(key=lambda rows: keys[rows[0]])
+        order += others[0] + others[1]
+        result = [keys[row] for row in order]
+        if best is None or result < best:
+            best = result
+            transforms = []
+        if result == best:
+            transforms.append((source >= len(columns), order, [int(col) for col in columns[source % len(columns)]],
+                               [int(digit) for digit in digits]))
+    return b"".join(bytes(int(digit) for digit in f"{key:09d}") for key in best), transforms
+
+
+def canonical_form(cells):
+    """
+    Каноническая форма решённого поля: лексикографический минимум по всем преобразованиям
+
+    Эквивалентные поля дают одинаковую форму, поэтому дубликаты находятся по хешу bytes
+
+    :param cells: 81 значение клеток заполненного поля (bytes, bytearray, Board.cells)
+    :return: bytes канонического поля
+    :raises SudokuError: Если numpy не установлен
+    :raises ValueError: Если поле заполнено не полностью
+    """
+    return _canonical_search(cells)[0]
+
+
+def canonical_puzzle(puzzle, solution=None):
+    """
+    Каноническая форма головоломки: минимальный представитель среди всех ей эквивалентных
+
+    Решение головоломки единственно, поэтому любое преобразование головоломки переводит
+    и её решение. Берутся все преобразования, приводящие решение к canonical_form,
+    и из их образов головоломки выбирается лексикографически минимальный
+
+    :param puzzle: Головоломка (Board или 81 значение клеток)
+    :param solution: Её решение. None - решается движком 'dlx'
+    :return: bytes канонической головоломки (81 клетка, 0 - пустая)
+    :raises ValueError: Если у головоломки нет единственного решения
+    :raises SudokuError: Если numpy не установлен
+    """
+    puzzle = puzzle if isinstance(puzzle, Board) else Board(bytes(puzzle))
+    if solution is None:
+        if count_solutions(puzzle) != 1:
+            raise ValueError("Каноническая форма определена только для головоломки с единственным решением")
+        solution = solve(puzzle.copy(), "dlx")
+    solution_cells = solution.cells if isinstance(solution, Board) else bytes(solution)
+    _, transforms = _canonical_search(solution_cells)
+    return min(apply_transform(puzzle.cells, transform) for transform in transforms)
+
+
+GRID_SIZES = (4, 9, 16, 25)
+"""tuple: Поддерживаемые размеры поля NxN для обобщённого движка (N - квадрат стороны блока)"""
+
+
+class GridGeometry:
+    """
+    Таблицы клеток поля NxN с блоками box x box (N = box * box)
+
+    Обобщение ROW_OF, COL_OF, BOX_OF, UNITS и PEERS для любого размера.
+    Объект неизменяем, общий для всех полей одного размера (см. grid_geometry)
+    """
+    __slots__ = ("box", "size", "cell_count", "row_of", "col_of", "box_of", "units", "peers", "full_mask")
+
+    def __init__(self, box):
+        size = box * box
+        cell_count = size * size
+
+        self.box = box
+        """int: Сторона блока"""
+
+        self.size = size
+        """int: Сторона поля и количество цифр"""
+
+        self.cell_count = cell_count
+        """int: Количество клеток поля"""
+
+        self.row_of = tuple(index // size for index in range(cell_count))
+        """tuple: Номер строки каждой клетки"""
+
+        self.col_of = tuple(index % size for index in range(cell_count))
+        """tuple: Номер столбца каждой клетки"""
+
+        self.box_of = tuple((index // size) // box * box + (index % size) // box for index in range(cell_count))
+        """tuple: Номер блока каждой клетки"""
+
+        self.units = tuple(
+            [tuple(row * size + col for col in range(size)) for row in range(size)]
+            + [tuple(row * size + col for row in range(size)) for col in range(size)]
+            + [tuple(index for index in range(cell_count) if self.box_of[index] == number) for number in range(size)]
+        )
+        """tuple: 3N групп клеток (строки, столбцы, блоки)"""
+
+        self.peers = tuple(
+            tuple(sorted({*self.units[self.row_of[index]], *self.units[size + self.col_of[index]],
+                          *self.units[2 * size + self.box_of[index]]} - {index}))
+            for index in range(cell_count)
+        )
+        """tuple: Соседи каждой клетки"""
+
+        self.full_mask = ((1 << size) - 1) << 1
+        """int: Маска всех цифр 1..N (бит 0 не используется, как в FULL_MASK)"""
+
+
+@functools.lru_cache(maxsize=None)
+def grid_geometry(size):
+    """
+    Возвращает таблицы для поля size x size
+
+    :raises ValueError: Если размер не из GRID_SIZES
+    """
+    if size not in GRID_SIZES:
+        raise ValueError(f"Неподдерживаемый размер поля: {size}. Доступны: {', '.join(map(str, GRID_SIZES))}")
+    return GridGeometry(int(size ** 0.5))
+
+
+class GridBoard:
+    """
+    Поле NxN в одном bytearray (цифры до 25 помещаются в байт)
+
+    Доступ по board[row, col]. Для N = 9 это тот же формат клеток, что у Board
+    """
+    __slots__ = ("geometry", "cells")
+
+    def __init__(self, size, cells=None):
+        """
+        :param size: Сторона поля из GRID_SIZES
+        :param cells: Значения клеток построчно (bytes, bytearray или список списков). None - пустое поле
+        :raises ValueError: Если размер не поддерживается или количество клеток не совпадает
+        """
+        self.geometry = grid_geometry(size)
+        """GridGeometry: Таблицы клеток этого размера"""
+
+        if cells is None:
+            self.cells = bytearray(self.geometry.cell_count)
+        elif isinstance(cells, (bytes, bytearray)):
+            self.cells = bytearray(cells)
+        else:
+            self.cells = bytearray(value for line in cells for value in line)
+        """bytearray: Значения клеток построчно (0 - пустая клетка)"""
+
+        if len(self.cells) != self.geometry.cell_count:
+            raise ValueError(f"Ожидалось {self.geometry.cell_count} значений клеток, получено {len(self.cells)}")
+
+    @property
+    def size(self):
+        """Сторона поля"""
+        return self.geometry.size
+
+    def copy(self):
+        """Возвращает независимую копию поля"""
+        return GridBoard(self.geometry.size, self.cells)
+
+    def __reduce__(self):
+        return GridBoard, (self.geometry.size, bytes(self.cells))
+
+    def __getitem__(self, key):
+        row, col = key
+        size = self.geometry.size
+        if not (0 <= row < size and 0 <= col < size):
+            raise IndexError(f"Координаты ({row}, {col}) выходят за пределы поля {size}x{size}")
+        return self.cells[row * size + col]
+
+    def __setitem__(self, key, value):
+        row, col = key
+        size = self.geometry.size
+        if not (0 <= row < size and 0 <= col < size):
+            raise IndexError(f"Координаты ({row}, {col}) выходят за пределы поля {size}x{size}")
+        self.cells[row * size + col] = value
+
+    def __eq__(self, other):
+        if isinstance(other, GridBoard):
+            return self.geometry is other.geometry and self.cells == other.cells
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.geometry.size, bytes(self.cells)))
+
+    def __repr__(self):
+        return f"GridBoard({self.geometry.size}, {bytes(self.cells)!r})"
+
+    def to_lists(self):
+        """Возвращает поле в виде списка списков"""
+        size = self.geometry.size
+        return [list(self.cells[row * size:row * size + size]) for row in range(size)]
+
+
+class GridState:
+    """Состояние поля NxN с масками цифр строк, столбцов и блоков в int (работает для любого N)"""
+    __slots__ = ("geometry", "cells", "rows", "cols", "boxes")
+
+    def __init__(self, game_board):
+        """
+        :param game_board: GridBoard с исходными цифрами
+        :raises ValueError: Если исходные цифры противоречат друг другу или выходят за 1..N
+        """
+        geometry = game_board.geometry
+        self.geometry = geometry
+        """GridGeometry: Таблицы клеток"""
+
+        self.cells = bytearray(geometry.cell_count)
+        """bytearray: Значения клеток"""
+
+        self.rows = [0] * geometry.size
+        """list[int]: Маски цифр каждой строки"""
+
+        self.cols = [0] * geometry.size
+        """list[int]: Маски цифр каждого столбца"""
+
+        self.boxes = [0] * geometry.size
+        """list[int]: Маски цифр каждого блока"""
+
+        for index, num in enumerate(game_board.cells):
+            if not num:
+                continue
+            if num > geometry.size or not self.is_valid(index, num):
+                raise ValueError(f"Цифра {num} в клетке {index} нарушает правила поля {geometry.size}x{geometry.size}")
+            self.place(index, num)
+
+    def place(self, index, num):
+        """Ставит цифру в пустую клетку и обновляет маски"""
+        geometry = self.geometry
+        bit = 1 << num
+        self.cells[index] = num
+        self.rows[geometry.row_of[index]] |= bit
+        self.cols[geometry.col_of[index]] |= bit
+        self.boxes[geometry.box_of[index]] |= bit
+
+    def remove(self, index):
+        """Очищает клетку и снимает её цифру с масок"""
+        geometry = self.geometry
+        bit = ~(1 << self.cells[index])
+        self.cells[index] = 0
+        self.rows[geometry.row_of[index]] &= bit
+        self.cols[geometry.col_of[index]] &= bit
+        self.boxes[geometry.box_of[index]] &= bit
+
+    def candidates(self, index):
+        """Маска цифр, которые можно поставить в клетку"""
+        geometry = self.geometry
+        return ~(self.rows[geometry.row_of[index]] | self.cols[geometry.col_of[index]]
+                 | self.boxes[geometry.box_of[index]]) & geometry.full_mask
+
+    def is_valid(self, index, num):
+        """True, если цифры num нет в строке, столбце и блоке клетки"""
+        return bool(self.candidates(index) >> num & 1)
+
+
+def _propagate_grid(state, trail):
+    """
+    Голые и скрытые одиночки до неподвижной точки на поле NxN (аналог _propagate)
+
+    :return: False, если найдено противоречие
+    """
+    geometry = state.geometry
+    cells = state.cells
+    full_mask = geometry.full_mask
+    candidates = state.candidates
+    changed = True
+    while changed:
+        changed = False
+        for index in range(geometry.cell_count):
+            if cells[index]:
+                continue
+            free = candidates(index)
+            if not free:
+                return False
+            if not free & (free - 1):
+                state.place(index, free.bit_length() - 1)
+                trail.append(index)
+                changed = True
+        if changed:
+            continue
+
+        for unit in geometry.units:
+            used = 0
+            seen_once = 0
+            seen_twice = 0
+            for index in unit:
+                if cells[index]:
+                    used |= 1 << cells[index]
+                    continue
+                free = candidates(index)
+                seen_twice |= seen_once & free
+                seen_once |= free
+            if (seen_once | used) & full_mask != full_mask:
+                return False
+            singles = seen_once & ~seen_twice
+            if not singles:
+                continue
+            for index in unit:
+                if cells[index]:
+                    continue
+                single = candidates(index) & singles
+                if not single:
+                    continue
+                if single & (single - 1):
+                    return False
+                state.place(index, single.bit_length() - 1)
+                trail.append(index)
+                changed = True
+    return True
+
+
+def _search_grid(state, limit, stats, rng, solutions, max_nodes=None, depth=1):
+    """
+    Перебор MRV с распространением одиночек на поле NxN
+
+    Состояние всегда возвращается к исходному, найденные решения копируются в solutions
+
+    :param limit: Остановиться после limit решений
+    :param solutions: Список, в который добавляются решения (bytes)
+    :param max_nodes: Предел stats.nodes. При превышении поиск прерывается и возвращает limit
+    :param depth: Глубина пробных цифр, которые ставит этот вызов
+    :return: Количество найденных решений
+    """
+    if max_nodes is not None and stats.nodes >= max_nodes:
+        return limit
+    trail = []
+    found = 0
+    if _propagate_grid(state, trail):
+        cells = state.cells
+        best = -1
+        best_free = 0
+        best_count = state.geometry.size + 1
+        for index in range(state.geometry.cell_count):
+            if cells[index]:
+                continue
+            free = state.candidates(index)
+            count = bin(free).count("1")
+            if count < best_count:
+                best, best_free, best_count = index, free, count
+                if count == 2:
+                    break
+        if best < 0:
+            solutions.append(bytes(cells))
+            found = 1
+        else:
+            digits = [num for num in range(1, state.geometry.size + 1) if best_free >> num & 1]
+            if rng is not None:
+                rng.shuffle(digits)
+            if digits and depth > stats.max_depth:
+                stats.max_depth = depth
+            for num in digits:
+                stats.nodes += 1
+                state.place(best, num)
+                found += _search_grid(state, limit - found, stats, rng, solutions, max_nodes, depth + 1)
+                state.remove(best)
+                if found >= limit:
+                    break
+                stats.backtracks += 1
+
+    for index in reversed(trail):
+        state.remove(index)
+    return found
+
+
+def solve_grid(game_board, stats=None, rng=None):
+    """
+    Решает поле NxN (GridBoard) перебором MRV с int-масками
+
+    :param game_board: GridBoard. При успехе решение записывается в него же
+    :param stats: SolveStats для счётчиков узлов и откатов
+    :param rng: Источник случайности для порядка цифр. None - по возрастанию
+    :return: Решенное поле или False
+    :raises ValueError: Если исходные цифры противоречат правилам
+    """
+    solutions = []
+    _search_grid(GridState(game_board), 1, stats or SolveStats(), rng, solutions)
+    if not solutions:
+        return False
+    game_board.cells[:] = solutions[0]
+    return game_board
+
+
+def count_grid_solutions(game_board, limit=2):
+    """
+    Считает решения поля NxN, останавливаясь на limit
+
+    :raises ValueError: Если limit меньше 1 или исходные цифры противоречат правилам
+    """
+    if limit < 1:
+        raise ValueError(f"Порог подсчёта решений должен быть не меньше 1, получено {limit}")
+    return _search_grid(GridState(game_board), limit, SolveStats(), None, [])
+
+
+GRID_UNIQUE_NODE_LIMIT = 100
+"""int: Предел узлов перебора на одну проверку единственности в generate_grid. Превышение считается вторым решением"""
+
+
+def _has_other_solution(puzzle, removed, saved):
+    """
+    Проверяет, есть ли у поля решение, отличное от известного в удалённых клетках
+
+    Ветвление идёт прямо по удалённым клеткам: сначала первая клетка перебирает
+    все цифры, кроме прежней, затем она фиксируется прежней цифрой и так далее.
+    Каждая ветвь ищет одно решение, поэтому проверка дешевле подсчёта до двух
+
+    :param puzzle: GridBoard с уже очищенными клетками removed
+    :param removed: Индексы удалённых клеток
+    :param saved: Их цифры в известном решении
+    :return: True, если другое решение найдено или проверка превысила GRID_UNIQUE_NODE_LIMIT
+    """
+    state = GridState(puzzle)
+    stats = SolveStats()
+    placed = []
+    try:
+        for index, value in zip(removed, saved):
+            free = state.candidates(index) & ~(1 << value)
+            for num in range(1, state.geometry.size + 1):
+                if not free >> num & 1:
+                    continue
+                state.place(index, num)
+                found = _search_grid(state, 1, stats, None, [], GRID_UNIQUE_NODE_LIMIT)
+                state.remove(index)
+                if found:
+                    return True
+            state.place(index, value)
+            placed.append(index)
+        return False
+    finally:
+        for index in placed:
+            state.remove(index)
+
+
+def _solution_pattern(size, rng):
+    """
+    Случайное решённое поле NxN за O(N^2) без перебора
+
+    Базовый шаблон (box * (row % box) + row // box + col) % N всегда корректен;
+    перестановки строк внутри полос, самих полос, столбцов внутри стопок,
+    стопок и цифр сохраняют корректность и дают случайное решение
+    """
+    geometry = grid_geometry(size)
+    box = geometry.box
+
+    def shuffled_lines():
+        groups = list(range(box))
+        rng.shuffle(groups)
+        lines = []
+        for group in groups:
+            inner = list(range(box))
+            rng.shuffle(inner)
+            lines.extend(group * box + line for line in inner)
+        return lines
+
+    rows = shuffled_lines()
+    cols = shuffled_lines()
+    digits = list(range(1, size + 1))
+    rng.shuffle(digits)
+    return GridBoard(size, bytes(digits[(box * (row % box) + row // box + col) % size]
+                                 for row in rows for col in cols))
+
+
+def generate_grid(size, difficulty, unique=True, rng=None):
+    """
+    Генерирует головоломку NxN и её решение
+
+    Решение строится перестановками шаблона (см. _solution_pattern), затем клетки
+    удаляются симметричными парами. С unique=True пара удаляется, только если
+    решение остаётся единственным; на 25x25 без проверки это заметно быстрее.
+    Центральная клетка (есть только при нечётном числе клеток, 25x25) пробуется
+    последней и только при нечётной цели удаления. У полей 4x4 и 16x16 её нет,
+    поэтому нечётная цель округляется вниз до чётной
+
+    :param size: Сторона поля из GRID_SIZES
+    :param difficulty: Сложность 1, 2 или 3 - доля пустых клеток как у поля 9x9 (20, 40, 60 из 81)
+    :param unique: Проверять единственность решения
+    :param rng: random.Random или модуль random
+    :return: (puzzle, solution) - два GridBoard
+    :raises ValueError: Если размер не поддерживается
+    :raises SudokuError: Если сложность указана неверно
+    """
+    if difficulty not in (1, 2, 3):
+        raise SudokuError(f"Неверный уровень сложности: {difficulty}. Ожидался 1, 2 или 3 (Easy, Medium, Hard)")
+    rng = rng or random
+    solution = _solution_pattern(size, rng)
+    puzzle = solution.copy()
+    cells = puzzle.cells
+    last = len(cells) - 1
+    target_deleted = len(cells) * difficulty * 20 // 81
+    if len(cells) % 2 == 0:
+        target_deleted -= target_deleted % 2
+
+    pairs = [(index, last - index) for index in range(len(cells) // 2)]
+    rng.shuffle(pairs)
+    if target_deleted % 2:
+        pairs.append((len(cells) // 2,))
+    deleted = 0
+    for pair in pairs:
+        if deleted + len(pair) > target_deleted:
+            continue
+        saved = [cells[index] for index in pair]
+        for index in pair:
+            cells[index] = 0
+        if not unique or not _has_other_solution(puzzle, pair, saved):
+            deleted += len(pair)
+            if deleted == target_deleted:
+                break
+        else:
+            for index, value in zip(pair, saved):
+                cells[index] = value
+    return puzzle, solution
+
+
+class PuzzlePool:
+    """
+    Пул заранее сгенерированных уровней для каждой сложности
+
+    Уровни генерируются в фоне в пуле процессов, поэтому выбор сложности в меню
+    просто забирает готовое поле. Синхронная генерация выполняется, только если
+    для этой сложности готовых уровней нет. Если исполнитель остановлен или
+    сломан, ошибка запоминается в error, и дальше уровни только генерируются
+    синхронно - сообщать о ней должен вызывающий код
+    """
+
+    def __init__(self, depth=2, workers=None, difficulties=(1, 2, 3), executor=None):
+        """
+        :param depth: Сколько готовых уровней держать для каждой сложности
+        :param workers: Количество процессов генерации (None - по числу ядер)
+        :param difficulties: Сложности, для которых поддерживается запас
+        :param executor: Готовый concurrent.futures.Executor вместо собственного пула процессов
+        """
+        self.depth = depth
+        """int: Целевое количество готовых уровней на сложность"""
+
+        self.hits = 0
+        """int: Сколько раз уровень был взят из пула"""
+
+        self.misses = 0
+        """int: Сколько раз пул был пуст и уровень генерировался синхронно"""
+
+        self.refill_latency = TimingStats()
+        """TimingStats: Время от постановки фоновой генерации в очередь до готового уровня"""
+
+        self.error = None
+        """RuntimeError or None: Ошибка исполнителя, после которой фоновая генерация больше не запускается"""
+
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._executor = executor
+        self._ready = {difficulty: deque() for difficulty in difficulties}
+        self._pending = {difficulty: 0 for difficulty in difficulties}
+        self._lock = threading.Lock()
+        self._closed = False
+
+        for difficulty in difficulties:
+            self._refill(difficulty)
+
+    def _refill(self, difficulty):
+        """Ставит в очередь столько фоновых генераций, сколько не хватает до depth"""
+        with self._lock:
+            if self._closed or self.error is not None:
+                return
+            missing = self.depth - len(self._ready[difficulty]) - self._pending[difficulty]
+            self._pending[difficulty] += max(missing, 0)
+        for submitted_count in range(missing):
+            submitted = time.perf_counter()
+            try:
+                future = self._executor.submit(generate_board, difficulty, "backtrack", True)
+            except RuntimeError as error:
+                # Пул процессов остановлен или сломан: дальше уровни генерируются синхронно в get()
+                with self._lock:
+                    self._pending[difficulty] -= missing - submitted_count
+                    self.error = error
+                return
+            future.add_done_callback(functools.partial(self._on_ready, difficulty, submitted))
+
+    def _on_ready(self, difficulty, submitted, future):
+        """Кладёт готовый уровень в пул (вызывается из потока исполнителя)"""
+        with self._lock:
+            self._pending[difficulty] -= 1
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._ready[difficulty].append(future.result())
+            self.refill_latency.add(time.perf_counter() - submitted)
+
+    def get(self, difficulty):
+        """
+        Возвращает уровень заданной сложности и запускает пополнение пула
+
+        :param difficulty: Сложность (1, 2 или 3)
+        :return: (game_board, solution_board, hints, mistakes), как у generate_board
+        :raises SudokuError: Если сложность указана неверно
+        """
+        if difficulty not in self._ready:
+            return generate_board(difficulty, unique=True)
+
+        with self._lock:
+            game_data = self._ready[difficulty].popleft() if self._ready[difficulty] else None
+            if game_data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if game_data is None:
+            game_data = generate_board(difficulty, unique=True)
+        self._refill(difficulty)
+        return game_data
+
+    def stats(self):
+        """
+        Возвращает состояние пула
+
+        :return: dict с ключами 'ready' и 'pending' (по сложностям), 'hits', 'misses', 'refill' (задержка пополнения)
+            и 'broken' (фоновая генерация остановлена ошибкой исполнителя)
+        """
+        with self._lock:
+            return {
+                "ready": {difficulty: len(ready) for difficulty, ready in self._ready.items()},
+                "pending": dict(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refill": self.refill_latency.as_dict(),
+                "broken": self.error is not None,
+            }
+
+    def close(self):
+        """Останавливает фоновую генерацию. Собственный пул процессов завершается без ожидания"""
+        with self._lock:
+            self._closed = True
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def board_to_string(game_board):
+    """
+    Переводит поле 9x9 в строку из 81 цифры (0 - пустая клетка)
+
+    :param game_board: Поле 9x9 (Board или список списков)
+    :return: Строка из 81 символа
+    """
+    if isinstance(game_board, Board):
+        return bytes(num + 48 for num in game_board.cells).decode("ascii")
+    return "".join(str(game_board[row][col]) for row in range(9) for col in range(9))
+
+
+def board_from_string(text):
+    """
+    Переводит строку из 81 символа в поле 9x9
+
+    :param text: Строка из цифр, точка или 0 - пустая клетка
+    :return: Поле Board
+    :raises ValueError: Если длина строки не 81 или в ней есть посторонние символы
+    """
+    if len(text) != 81 or any(char not in ".0123456789" for char in text):
+        raise ValueError(f"Ожидалась строка из 81 цифры, получено: {text!r}")
+    return Board(bytes(0 if char == "." else int(char) for char in text))
+
+
+def _generate_chunk(seed, count, difficulty, unique):
+    """
+    Задача для процесса-исполнителя: генерирует пачку уровней с собственным зерном
+
+    :param seed: Зерно пачки. Одинаковое зерно даёт одинаковые уровни в любом процессе
+    :param count: Количество уровней в пачке
+    :param difficulty: Сложность (1, 2 или 3)
+    :param unique: Режим генерации с единственным решением
+    :return: Список кортежей (game_board, solution_board, hints, mistakes)
+    """
+    rng = random.Random(seed)
+    return [generate_board(difficulty, unique=unique, seed=rng.getrandbits(64)) for _ in range(count)]
+
+
+def generate_many(count, difficulty, workers=None, seed=0, unique=True, chunk_size=64):
+    """
+    Генерирует много уровней на нескольких ядрах и отдаёт их по мере готовности
+
+    Работа делится на пачки по chunk_size уровней. Пачка с номером i всегда
+    генерируется с зерном f"{seed}:{i}", а пачки выдаются по порядку, поэтому
+    результат воспроизводим при любом количестве процессов. Одновременно в работе
+    держится не больше двух пачек на процесс, так что память не растёт с count
+
+    :param count: Общее количество уровней
+    :param difficulty: Сложность (1, 2 или 3)
+    :param workers: Количество процессов (None - по числу ядер, 1 - без пула процессов)
+    :param seed: Базовое зерно
+    :param unique: Генерировать уровни с единственным решением
+    :param chunk_size: Размер пачки одной задачи
+    :return: Итератор кортежей (game_board, solution_board, hints, mistakes)
+    :raises SudokuError: Если сложность указана неверно
+    """
+    if difficulty not in (1, 2, 3):
+        raise SudokuError(f"Неверный уровень сложности: {difficulty}. Ожидался 1, 2 или 3 (Easy, Medium, Hard)")
+    chunks = [(f"{seed}:{index}", min(chunk_size, count - start))
+              for index, start in enumerate(range(0, count, chunk_size))]
+    return _iter_generated(chunks, difficulty, unique, workers)
+
+
+def _iter_generated(chunks, difficulty, unique, workers):
+    """Выполняет пачки generate_many в пуле процессов и выдаёт уровни в порядке пачек"""
+    if workers == 1:
+        for chunk_seed, size in chunks:
+            yield from _generate_chunk(chunk_seed, size, difficulty, unique)
+        return
+
+    window = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        for chunk_seed, size in chunks:
+            pending.append(executor.submit(_generate_chunk, chunk_seed, size, difficulty, unique))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_puzzles(path, games):
+    """
+    Потоково записывает уровни в текстовый файл: строка 'головоломка решение'
+
+    :param path: Путь к файлу
+    :param games: Итерируемый набор кортежей (game_board, solution_board, ...)
+    :return: Количество записанных уровней
+    """
+    written = 0
+    with open(path, "w", encoding="utf-8") as output:
+        for game_data in games:
+            output.write(f"{board_to_string(game_data[0])} {board_to_string(game_data[1])}\n")
+            written += 1
+    return written
+
+
+PACK_MAGIC = b"SDKP"
+"""bytes: Сигнатура файла набора уровней"""
+
+PACK_VERSION = 1
+"""int: Версия формата набора уровней"""
+
+PACK_HEADER = struct.Struct("<4sHHQQ3I")
+"""struct.Struct: Заголовок набора: сигнатура, версия, размер записи, число записей, смещение индекса, число записей каждой сложности"""
+
+PACK_HEADER_SIZE = 64
+"""int: Место под заголовок в начале файла (остаток заполнен нулями)"""
+
+PACK_CELLS_SIZE = 41
+"""int: Размер упакованного поля: 81 клетка по 4 бита"""
+
+PACK_RECORD_SIZE = PACK_CELLS_SIZE * 2 + 1
+"""int: Размер записи: головоломка, решение и байт сложности"""
+
+_NIBBLES = tuple((byte >> 4, byte & 0x0F) for byte in range(256))
+"""tuple: Распаковка байта в две клетки (старшие и младшие 4 бита)"""
+
+
+def _pack_cells(game_board):
+    """Упаковывает поле 9x9 в 41 байт, по 4 бита на клетку"""
+    values = list(game_board.cells if isinstance(game_board, Board) else Board(game_board).cells)
+    values.append(0)
+    return bytes((values[i] << 4) | values[i + 1] for i in range(0, 82, 2))
+
+
+def _unpack_cells(data, offset):
+    """Распаковывает 41 байт начиная с offset в поле Board"""
+    values = bytearray()
+    for byte in data[offset:offset + PACK_CELLS_SIZE]:
+        values.extend(_NIBBLES[byte])
+    return Board(values[:81])
+
+
+class PuzzlePackWriter:
+    """
+    Потоковая запись набора уровней в бинарный файл
+
+    Формат: заголовок (PACK_HEADER_SIZE байт), затем записи фиксированного размера
+    PACK_RECORD_SIZE, затем индекс - для каждой сложности массив номеров записей uint32.
+    Заголовок и индекс дописываются при закрытии
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Путь к создаваемому файлу
+        """
+        self._file = open(path, "wb")
+        self._file.write(bytes(PACK_HEADER_SIZE))
+        self._index = {difficulty: array("I") for difficulty in (1, 2, 3)}
+        self.count = 0
+        """int: Количество записанных уровней"""
+
+    def add(self, puzzle, solution, difficulty):
+        """
+        Добавляет уровень в конец набора
+
+        :raises SudokuError: Если сложность указана неверно
+        """
+        if difficulty not in self._index:
+            raise SudokuError(f"Неверный уровень сложности: {difficulty}. Ожидался 1, 2 или 3 (Easy, Medium, Hard)")
+        self._file.write(_pack_cells(puzzle) + _pack_cells(solution) + bytes((difficulty,)))
+        self._index[difficulty].append(self.count)
+        self.count += 1
+
+    def close(self):
+        """Записывает индекс и заголовок и закрывает файл"""
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        for difficulty in (1, 2, 3):
+            self._file.write(self._index[difficulty].tobytes())
+        self._file.seek(0)
+        self._file.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, PACK_RECORD_SIZE, self.count, index_offset,
+                                          *(len(self._index[difficulty]) for difficulty in (1, 2, 3))))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PuzzlePack:
+    """
+    Набор уровней, открытый через mmap
+
+    Чтение уровня по номеру вычисляет смещение записи и распаковывает только её,
+    поэтому стоит O(1) независимо от размера файла
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Путь к файлу набора
+        :raises ValueError: Если файл не является набором уровней
+        """
+        self._file = open(path, "rb")
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Файл {path} пуст и не является набором уровней")
+        if len(self._data) < PACK_HEADER_SIZE:
+            self.close()
+            raise ValueError(f"Файл {path} не является набором уровней")
+        magic, version, record_size, count, index_offset, *counts = PACK_HEADER.unpack_from(self._data, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION or record_size != PACK_RECORD_SIZE:
+            self.close()
+            raise ValueError(f"Файл {path} не является набором уровней версии {PACK_VERSION}")
+
+        self._count = count
+        self._index_start = {}
+        """dict: Сложность -> (смещение массива номеров записей, количество записей)"""
+        for difficulty, difficulty_count in zip((1, 2, 3), counts):
+            self._index_start[difficulty] = (index_offset, difficulty_count)
+            index_offset += difficulty_count * 4
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, number):
+        """
+        Читает уровень по номеру
+
+        :return: (puzzle, solution, difficulty)
+        :raises IndexError: Если номера нет в наборе
+        """
+        if number < 0:
+            number += self._count
+        if not 0 <= number < self._count:
+            raise IndexError(f"Уровня #{number} нет в наборе из {self._count}")
+        offset = PACK_HEADER_SIZE + number * PACK_RECORD_SIZE
+        return (_unpack_cells(self._data, offset), _unpack_cells(self._data, offset + PACK_CELLS_SIZE),
+                self._data[offset + PACK_RECORD_SIZE - 1])
+
+    def count(self, difficulty):
+        """Возвращает количество уровней заданной сложности"""
+        return self._index_start.get(difficulty, (0, 0))[1]
+
+    def number_for(self, difficulty, position):
+        """Возвращает номер записи для position-го уровня заданной сложности (по индексу)"""
+        offset, difficulty_count = self._index_start[difficulty]
+        if not 0 <= position < difficulty_count:
+            raise IndexError(f"Уровня сложности {difficulty} с номером {position} нет в наборе")
+        return struct.unpack_from("<I", self._data, offset + position * 4)[0]
+
+    def random_puzzle(self, difficulty, rng=None):
+        """
+        Выбирает случайный уровень заданной сложности
+
+        :param difficulty: Уровень сложности (1, 2 или 3)
+        :param rng: Источник случайности (random.Random). None - глобальный модуль random
+        :return: (puzzle, solution)
+        :raises SudokuError: Если уровней такой сложности в наборе нет
+        """
+        if not self.count(difficulty):
+            raise SudokuError(f"В наборе нет уровней сложности {difficulty}")
+        number = (rng or random).randrange(self.count(difficulty))
+        puzzle, solution, _ = self[self.number_for(difficulty, number)]
+        return puzzle, solution
+
+    def close(self):
+        """Закрывает отображение и файл"""
+        if getattr(self, "_data", None) is not None:
+            self._data.close()
+            self._data = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_pack(path, games, difficulty):
+    """
+    Потоково записывает уровни одной сложности в бинарный набор
+
+    :param path: Путь к файлу
+    :param games: Итерируемый набор кортежей (game_board, solution_board, ...)
+    :param difficulty: Сложность уровней
+    :return: Количество записанных уровней
+    """
+    with PuzzlePackWriter(path) as writer:
+        for game_data in games:
+            writer.add(game_data[0], game_data[1], difficulty)
+    return writer.count
+
+
+def puzzle_fingerprint(puzzle, solution=None):
+    """
+    Отпечаток головоломки: 16 байт BLAKE2b от canonical_puzzle
+
+    Эквивалентные головоломки (перенумерация цифр, перестановки, транспонирование) дают один отпечаток
+
+    :return: bytes длиной 16
+    """
+    return hashlib.blake2b(canonical_puzzle(puzzle, solution), digest_size=16).digest()
+
+
+class PuzzleIndex:
+    """
+    Хранимое на диске множество отпечатков головоломок (sqlite)
+
+    Таблица с первичным ключом по отпечатку, поэтому проверка и вставка стоят
+    O(log n) и не требуют держать множество в памяти. Вставки подтверждаются
+    пачками по commit_every
+    """
+
+    def __init__(self, path=":memory:", commit_every=10000):
+        """
+        :param path: Файл базы (':memory:' - только в памяти)
+        :param commit_every: Сколько вставок накапливать до подтверждения транзакции
+        """
+        self.path = path
+        """str: Путь к файлу базы"""
+
+        self.commit_every = commit_every
+        """int: Размер пачки вставок в одной транзакции"""
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS puzzles (fingerprint BLOB PRIMARY KEY) WITHOUT ROWID")
+        self._uncommitted = 0
+
+    def add(self, fingerprint):
+        """
+        Добавляет отпечаток
+
+        :return: True, если отпечатка ещё не было
+        """
+        cursor = self._connection.execute("INSERT OR IGNORE INTO puzzles VALUES (?)", (fingerprint,))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+        return cursor.rowcount == 1
+
+    def add_puzzle(self, puzzle, solution=None):
+        """Добавляет головоломку по её отпечатку. :return: True, если эквивалентной ещё не было"""
+        return self.add(puzzle_fingerprint(puzzle, solution))
+
+    def __contains__(self, fingerprint):
+        return self._connection.execute("SELECT 1 FROM puzzles WHERE fingerprint = ?", (fingerprint,)).fetchone() is not None
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM puzzles").fetchone()[0]
+
+    def commit(self):
+        """Подтверждает накопленные вставки"""
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """Подтверждает вставки и закрывает базу"""
+        if self._connection is not None:
+            self.commit()
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def dedupe_pack(source_path, output_path, index):
+    """
+    Потоково копирует набор уровней, пропуская головоломки, эквивалентные уже встреченным
+
+    Записи читаются по одной через mmap, отпечатки хранятся в PuzzleIndex на диске,
+    поэтому память не зависит от размера набора. Один индекс можно использовать для
+    нескольких наборов, тогда повторы между ними тоже отбрасываются
+
+    :param source_path: Исходный набор PuzzlePack
+    :param output_path: Файл для набора без повторов
+    :param index: PuzzleIndex
+    :return: (оставлено, отброшено)
+    """
+    kept = 0
+    dropped = 0
+    with PuzzlePack(source_path) as pack, PuzzlePackWriter(output_path) as writer:
+        for number in range(len(pack)):
+            puzzle, solution, difficulty = pack[number]
+            if index.add_puzzle(puzzle, solution):
+                writer.add(puzzle, solution, difficulty)
+                kept += 1
+            else:
+                dropped += 1
+    index.commit()
+    return kept, dropped
+
+
+GAME_COLORS = (WHITE, GREEN, RED, YELLOW)
+"""tuple: Цвета цифр и панели статистики, для которых глифы готовятся заранее"""
+
+
+def font_path(name=FONT_NAME, cache_path=FONT_CACHE_PATH):
+    """
+    Путь к файлу системного шрифта с кэшем между запусками
+
+    pygame.font.match_font при первом вызове перебирает все шрифты системы, поэтому
+    найденный путь сохраняется в cache_path и в следующих запусках берётся оттуда.
+    Неудачный поиск не кэшируется: шрифт, установленный позже, будет найден
+
+    :param name: Имя шрифта
+    :param cache_path: JSON-файл кэша (None - не использовать кэш)
+    :return: Путь к файлу шрифта или None, если шрифт не найден (тогда используется встроенный шрифт pygame)
+    """
+    cache = {}
+    if cache_path is not None:
+        try:
+            with open(cache_path, encoding="utf-8") as source:
+                cache = json.load(source)
+        except (OSError, ValueError):
+            cache = {}
+        if not isinstance(cache, dict):
+            cache = {}
+        path = cache.get(name)
+        if path and os.path.exists(path):
+            return path
+
+    path = pygame.font.match_font(name)
+    if cache_path is not None and path:
+        cache[name] = path
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            with open(cache_path, "w", encoding="utf-8") as output:
+                json.dump(cache, output)
+        except OSError:
+            pass
+    return path
+
+
+def init_display(font_cache=FONT_CACHE_PATH):
+    """
+    Открывает окно игры и загружает шрифты
+
+    Инициализируются только подсистемы display и font, а не все модули pygame.
+    Заполняет глобальные screen, font, small_font и clock
+
+    :param font_cache: Файл кэша путей к шрифтам (см. font_path)
+    :return: Поверхность окна
+    :raises SudokuError: Если pygame не установлен
+    :raises pygame.error: Если окно не удалось открыть
+    """
+    global screen, font, small_font, clock
+    if pygame is None:
+        raise SudokuError("Для окна игры нужен pygame: pip install pygame")
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Sudoku")
+    path = font_path(FONT_NAME, font_cache)
+    font = pygame.font.Font(path, 40)
+    small_font = pygame.font.Font(path, 18)
+    glyph_cache.clear()
+    glyph_cache.prewarm()
+    clock = pygame.time.Clock()
+    return screen
+
+
+class GlyphCache:
+    """
+    LRU-кэш отрисованного текста: (текст, цвет, шрифт) -> pygame.Surface
+
+    font.render растеризует TrueType-глифы при каждом вызове, поэтому одинаковые
+    цифры и надписи рисуются один раз и затем берутся из кэша
+    """
+
+    def __init__(self, capacity=256):
+        """
+        :param capacity: Максимальное количество хранимых поверхностей
+        """
+        self.capacity = capacity
+        """int: Предел размера кэша, при превышении вытесняется давно не использованный текст"""
+
+        self.hits = 0
+        """int: Количество попаданий в кэш"""
+
+        self.misses = 0
+        """int: Количество растеризаций (промахов кэша)"""
 
-GRAY = (128, 128, 128)
-"""tuple: Серый цвет. Фоновая заливка игрового поля"""
+        self._surfaces = OrderedDict()
 
-GREEN = (0, 255, 0)
-"""tuple: Зеленый цвет. Используется для правильных ответов и кнопок"""
+    def get(self, text, color, text_font=None):
+        """
+        Возвращает поверхность с текстом, растеризуя её только при промахе
 
-RED = (255, 0, 0)
-"""tuple: Красный цвет. Используется для ошибок, выделения и кнопок"""
+        :param text: Строка
+        :param color: Цвет (r, g, b)
+        :param text_font: Шрифт (по умолчанию - глобальный font)
+        :return: pygame.Surface
+        """
+        if text_font is None:
+            text_font = font
+        key = (text, color, text_font)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
 
-YELLOW = (255, 255, 0)
-"""tuple: Желтый цвет. Используется для подсказок и таймера"""
+        self.misses += 1
+        surface = text_font.render(text, True, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.capacity:
+            self._surfaces.popitem(last=False)
+        return surface
 
-screen = None
-"""pygame.Surface: Основная поверхность окна, на которой происходит отрисовка"""
+    def prewarm(self, text_font=None):
+        """Заранее растеризует цифры 1-9 во всех цветах игры"""
+        for digit in range(1, 10):
+            for color in GAME_COLORS:
+                self.get(str(digit), color, text_font)
 
-font = None
-"""pygame.font.Font: Шрифт для отрисовки текста и цифр"""
+    def draw_text(self, surface, parts, position, color, text_font=None):
+        """
+        Рисует строку, составленную из кэшированных частей, одну за другой
 
-clock = None
-"""pygame.time.Clock: Объект для контроля FPS (кадров в секунду)"""
-#Заимствованный код (снизу, источник: https://habr.com/ru/companies/otus/articles/746408/)
-def is_valid_move(game_board, row, col, num):
-    """
-    Проверяет валидность хода по правилам Судоку
+        Неизменная подпись ('Time: ') и меняющееся значение ('01') кэшируются
+        отдельно, поэтому новые значения не требуют растеризации всей строки
 
-    :param game_board: Текущее поле 9x9
-    :param row: Индекс строки
-    :param col: Индекс столбца
-    :param num: Число для проверки
-    :return: True, если ход возможен
-    :raises ValueError: Если индексы вне диапазона
-    """
-    if not (0 <= row < 9 and 0 <= col < 9):
-        raise ValueError(f"Координаты ({row}, {col}) выходят за пределы поля")
+        :param parts: Последовательность строк
+        :param position: (x, y) левого верхнего угла
+        :return: x правого края нарисованного текста
+        """
+        x, y = position
+        for part in parts:
+            glyph = self.get(part, color, text_font)
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return x
 
-    if num in game_board[row]:
-        return False
+    def stats(self):
+        """Возвращает dict с размером кэша и счётчиками попаданий и промахов"""
+        return {"size": len(self._surfaces), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
 
-    for i in range(9):
-        if game_board[i][col] == num:
-            return False
+    def clear(self):
+        """Очищает кэш (например, после смены шрифта)"""
+        self._surfaces.clear()
 
-    start_row = (row // 3) * 3
-    start_col = (col // 3) * 3
-    for i in range(3):
-        for j in range(3):
-            if game_board[start_row + i][start_col + j] == num:
-                return False
-    return True
 
-def solved_board(game_board):
-    """
-    Рекурсивно решает доску. Использует случайный порядок чисел для генерации
+glyph_cache = GlyphCache()
+"""GlyphCache: Общий кэш отрисованного текста для всех функций рисования"""
 
-    :param game_board: Поле для решения
-    :return: Решенное поле или False
-    """
-    for i in range(9):
-        for j in range(9):
-            if game_board[i][j] == 0:
-                random_numbers = list(range(1, 10))
-                random.shuffle(random_numbers)
-                for key in random_numbers:
-                    try:
-                        if is_valid_move(game_board, i, j, key):
-                            game_board[i][j] = key
-                            if solved_board(game_board):
-                                return game_board
-                            else:
-                                game_board[i][j] = 0
-                    except ValueError as error:
-                        print(f"Внутренняя ошибка валидации: {error}")
-                        return False
-                return False
-    return game_board
-#Заимствованный код (сверху, источник: https://habr.com/ru/companies/otus/articles/746408/)
 
-def generate_board(difficulty):
+class NoteGlyphCache:
     """
-    Генерирует игровое поле и решение
+    Кэш отрисованных заметок: маска кандидатов клетки -> прозрачная поверхность CELL_SIZE x CELL_SIZE
 
-    :param difficulty: Сложность (1, 2 или 3)
-    :return: (game_board, solution_board, hints, mistakes)
-    :raises SudokuError: Если сложность указана неверно
+    Цифры заметок растеризуются мелким шрифтом один раз и раскладываются сеткой 3x3
+    (1 - левый верхний угол, 9 - правый нижний). Поверхность для маски собирается
+    из них при первом запросе, поэтому клетка с заметками рисуется одним blit
     """
-    hints_map = {1: 6, 2: 4, 3: 2}
 
-    if difficulty not in hints_map:
-        raise SudokuError(f"Неверный уровень сложности: {difficulty}. Ожидался 1, 2 или 3 (Easy, Medium, Hard)")
+    def __init__(self):
+        self.hits = 0
+        """int: Количество попаданий в кэш"""
 
-    hints_left = hints_map[difficulty]
-    mistakes_left = hints_map[difficulty] - 1
+        self.misses = 0
+        """int: Количество собранных поверхностей (промахов кэша)"""
 
-    puzzle = [[0] * 9 for _ in range(9)]
-    solved_board(puzzle)
+        self._surfaces = {}
+        self._digits = {}
 
-    solution = copy.deepcopy(puzzle)
-    copied_board = copy.deepcopy(puzzle)
+    def get(self, mask, text_font=None):
+        """
+        Возвращает поверхность с заметками клетки
 
-    counter_of_deleted_elements = 0
-    target_deleted = difficulty * 20
+        :param mask: Маска кандидатов: бит 1 << digit для каждой цифры 1-9
+        :param text_font: Шрифт (по умолчанию - small_font, а если его нет - font)
+        :return: pygame.Surface с прозрачным фоном
+        :raises ValueError: Если маска содержит биты вне цифр 1-9
+        """
+        if mask & ~FULL_MASK:
+            raise ValueError(f"Маска заметок {mask:#x} содержит биты вне цифр 1-9")
+        if text_font is None:
+            text_font = small_font or font
+        key = (mask, text_font)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
 
-    while counter_of_deleted_elements != target_deleted:
-        row = random.randint(0, 8)
-        col = random.randint(0, 8)
+        self.misses += 1
+        if text_font not in self._digits:
+            self._digits[text_font] = [None] + [text_font.render(str(digit), True, BLACK) for digit in range(1, 10)]
+        digits = self._digits[text_font]
+        step = CELL_SIZE // 3
+        surface = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
+        for digit in MASK_DIGITS[mask]:
+            glyph = digits[digit]
+            surface.blit(glyph, ((digit - 1) % 3 * step + (step - glyph.get_width()) // 2,
+                                 (digit - 1) // 3 * step + (step - glyph.get_height()) // 2))
+        self._surfaces[key] = surface
+        return surface
 
-        if copied_board[row][col] != 0:
-            copied_board[row][col] = 0
-            counter_of_deleted_elements += 1
+    def clear(self):
+        """Очищает кэш (например, после смены шрифта)"""
+        self._surfaces.clear()
+        self._digits.clear()
 
-    return copied_board, solution, hints_left, mistakes_left
+
+note_glyphs = NoteGlyphCache()
+"""NoteGlyphCache: Общий кэш отрисованных заметок"""
 
 
 def draw_selected_cell(surface, row, col):
@@ -145,26 +3525,43 @@ def draw_selected_cell(surface, row, col):
             raise AttributeError("Не удалось нарисовать рамку")
 
 
-def draw_numbers(surface, game_board, original_grid, solution_grid, mistake_number=None):
-    """Отрисовывает числа на доске с учетом цветов и подсветки ошибок"""
+def number_color(val, original_val, solution_val, mistake_number=None):
+    """
+    Выбирает цвет цифры в клетке
+
+    :return: WHITE для исходных цифр, GREEN для верных, RED для ошибочных и подсвеченных
+    """
+    color = RED
+    if original_val != 0:
+        color = WHITE
+    elif val == solution_val:
+        color = GREEN
+    if val == mistake_number:
+        color = RED
+    return color
+
+
+@instrumentation.timed("draw.numbers")
+def draw_numbers(surface, game_board, original_grid, solution_grid, mistake_number=None, notes=None):
+    """
+    Отрисовывает числа на доске с учетом цветов и подсветки ошибок
+
+    :param notes: Маски заметок 81 клетки (array('H')). Рисуются в пустых клетках
+    """
     for row in range(9):
         for col in range(9):
             val = game_board[row][col]
-            if val != 0:
-                color = RED
-                if original_grid[row][col] != 0:
-                    color = WHITE
-                elif val == solution_grid[row][col]:
-                    color = GREEN
-                if val == mistake_number:
-                    color = RED
-
-                text_layer = font.render(str(val), True, color)
+            if val == 0 and notes is not None and notes[row * 9 + col]:
+                surface.blit(note_glyphs.get(notes[row * 9 + col]), (col * CELL_SIZE, row * CELL_SIZE))
+            elif val != 0:
+                color = number_color(val, original_grid[row][col], solution_grid[row][col], mistake_number)
+                text_layer = glyph_cache.get(str(val), color)
                 coord_x = col * CELL_SIZE + (CELL_SIZE - text_layer.get_width()) // 2
                 coord_y = row * CELL_SIZE + (CELL_SIZE - text_layer.get_height()) // 2
                 surface.blit(text_layer, (coord_x, coord_y))
 
 
+@instrumentation.timed("draw.board")
 def draw_board(surface):
     """Рисует сетку поля (линии)"""
     surface.fill(GRAY)
@@ -174,21 +3571,174 @@ def draw_board(surface):
         pygame.draw.line(surface, BLACK, (0, i * CELL_SIZE), (540, i * CELL_SIZE), line_width)
 
 
-def draw_game_info(surface, hints, time_ms, mistakes):
-    """Рисует нижнюю панель статистики"""
+grid_fonts = {}
+"""dict: Шрифты цифр для полей NxN, по размеру поля (создаются при первой отрисовке)"""
+
+
+def draw_grid_board(surface, game_board, original_grid=None, area=540):
+    """
+    Рисует поле NxN (GridBoard) целиком: сетку с толстыми линиями блоков и цифры
+
+    Размер клетки и шрифта выбирается по стороне поля, глифы берутся из glyph_cache
+
+    :param surface: Поверхность для отрисовки
+    :param game_board: GridBoard
+    :param original_grid: GridBoard с исходными цифрами (рисуются WHITE, остальные - GREEN). None - все исходные
+    :param area: Сторона квадрата поля в пикселях
+    """
+    geometry = game_board.geometry
+    size = geometry.size
+    cell = area // size
+    if size not in grid_fonts:
+        grid_fonts[size] = pygame.font.Font(font_path(), cell * 2 // 3)
+    grid_font = grid_fonts[size]
+
+    pygame.draw.rect(surface, GRAY, (0, 0, cell * size, cell * size))
+    for i in range(size + 1):
+        line_width = 3 if i % geometry.box == 0 else 1
+        pygame.draw.line(surface, BLACK, (i * cell, 0), (i * cell, cell * size), line_width)
+        pygame.draw.line(surface, BLACK, (0, i * cell), (cell * size, i * cell), line_width)
+
+    original = original_grid.cells if original_grid is not None else game_board.cells
+    for index, val in enumerate(game_board.cells):
+        if not val:
+            continue
+        color = WHITE if original[index] else GREEN
+        text_layer = glyph_cache.get(str(val), color, grid_font)
+        surface.blit(text_layer, (geometry.col_of[index] * cell + (cell - text_layer.get_width()) // 2,
+                                  geometry.row_of[index] * cell + (cell - text_layer.get_height()) // 2))
+
+
+@instrumentation.timed("draw.game_info")
+def draw_game_info(surface, hints, time_ms, mistakes, message=None, notes_mode=False):
+    """
+    Рисует нижнюю панель статистики и, если задано, объяснение подсказки мелким шрифтом
+
+    :param notes_mode: Показать пометку 'Notes', что цифры вводятся как заметки
+    """
     minutes = (time_ms // 1000) // 60
     seconds = (time_ms // 1000) % 60
-    text_hints = font.render(f"Hints left: {hints}", True, YELLOW)
-    time_info = font.render(f"Time: {minutes:02}:{seconds:02}", True, YELLOW)
-    game_mistakes_info = font.render(f"Mistakes left: {mistakes}", True, RED)
-    surface.blit(text_hints, (10, 540))
-    surface.blit(time_info, (340, 540))
-    surface.blit(game_mistakes_info, (130, 590))
+    glyph_cache.draw_text(surface, ("Hints left: ", str(hints)), (10, 540), YELLOW)
+    glyph_cache.draw_text(surface, ("Time: ", f"{minutes:02}", ":", f"{seconds:02}"), (340, 540), YELLOW)
+    glyph_cache.draw_text(surface, ("Mistakes left: ", str(mistakes)), (130, 590), RED)
+    if message and small_font is not None:
+        surface.blit(small_font.render(message, True, YELLOW), (10, 638))
+    if notes_mode and small_font is not None:
+        glyph_cache.draw_text(surface, ("Notes",), (470, 600), YELLOW, small_font)
+
+def draw_debug_overlay(surface, lines=12):
+    """
+    Рисует поверх экрана полупрозрачную панель со счётчиками и временем из instrumentation
+
+    :param lines: Максимальное количество строк
+    :return: pygame.Rect панели
+    """
+    text_font = small_font or font
+    rows = [f"{name}: n={stats.count} p50={stats.percentile(0.5):.2f}ms p99={stats.percentile(0.99):.2f}ms"
+            for name, stats in sorted(instrumentation.histograms.items())]
+    rows += [f"{name}: {value}" for name, value in sorted(instrumentation.counters.items())]
+    rows = rows[:lines] or ["instrumentation: no data"]
+    line_height = text_font.get_linesize()
+    panel = pygame.Surface((WIDTH, line_height * len(rows) + 8), pygame.SRCALPHA)
+    panel.fill((0, 0, 0, 180))
+    for number, row in enumerate(rows):
+        panel.blit(text_font.render(row, True, YELLOW), (6, 4 + number * line_height))
+    surface.blit(panel, (0, 0))
+    return panel.get_rect()
+
+
+INFO_PANEL_RECT = (0, 540, WIDTH, HEIGHT - 540)
+"""tuple: Прямоугольник нижней панели статистики (x, y, ширина, высота)"""
+
+
+class BoardRenderer:
+    """
+    Инкрементальная отрисовка игрового экрана по изменившимся прямоугольникам
+
+    Сетка рисуется один раз на фоновую поверхность. Для каждой клетки хранится
+    то, что было нарисовано в прошлом кадре (цифра, цвет, заметки, выделение), поэтому
+    перерисовываются только изменившиеся клетки и панель статистики, когда
+    меняются подсказки, ошибки или секунда таймера
+    """
+
+    def __init__(self):
+        self.background = None
+        """pygame.Surface or None: Кэш статичной сетки поля"""
+
+        self._drawn_cells = [None] * 81
+        self._drawn_info = None
+        self._full_redraw = True
+
+    def invalidate(self):
+        """Требует полной перерисовки в следующем кадре (например, после смены экрана)"""
+        self._full_redraw = True
+
+    def _ensure_background(self, surface):
+        """Строит фон с сеткой при первом вызове или при смене размера поверхности"""
+        if self.background is None or self.background.get_size() != surface.get_size():
+            self.background = pygame.Surface(surface.get_size())
+            draw_board(self.background)
+            self._full_redraw = True
+
+    @instrumentation.timed("draw.renderer")
+    def render(self, surface, game_board, original_grid, solution_grid, selected, mistake_number,
+               hints, time_ms, mistakes, message=None, notes=None, notes_mode=False):
+        """
+        Дорисовывает изменения с прошлого кадра
+
+        :param surface: Поверхность экрана
+        :param selected: (row, col) выбранной клетки или (None, None)
+        :param message: Объяснение подсказки для панели статистики
+        :param notes: Маски заметок 81 клетки (array('H')) или None
+        :param notes_mode: Включён ли ввод заметок (пометка в панели статистики)
+        :return: Список изменённых прямоугольников для pygame.display.update
+        """
+        self._ensure_background(surface)
+        dirty = []
+        if self._full_redraw:
+            surface.blit(self.background, (0, 0))
+            self._drawn_cells = [None] * 81
+            self._drawn_info = None
+            self._full_redraw = False
+            dirty.append(surface.get_rect())
+
+        selected_index = selected[0] * 9 + selected[1] if None not in selected else -1
+        for index in range(81):
+            row = ROW_OF[index]
+            col = COL_OF[index]
+            val = game_board[row][col]
+            color = number_color(val, original_grid[row][col], solution_grid[row][col], mistake_number) if val else None
+            mask = notes[index] if notes is not None and not val else 0
+            drawn = (val, color, mask, index == selected_index)
+            if drawn == self._drawn_cells[index]:
+                continue
+            self._drawn_cells[index] = drawn
+            cell_rect = pygame.Rect(col * CELL_SIZE, row * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+            surface.blit(self.background, cell_rect, cell_rect)
+            if val:
+                text_layer = glyph_cache.get(str(val), color)
+                surface.blit(text_layer, (cell_rect.x + (CELL_SIZE - text_layer.get_width()) // 2,
+                                          cell_rect.y + (CELL_SIZE - text_layer.get_height()) // 2))
+            elif mask:
+                surface.blit(note_glyphs.get(mask), cell_rect)
+            if index == selected_index:
+                pygame.draw.rect(surface, RED, cell_rect, 3)
+            dirty.append(cell_rect)
+
+        info = (hints, time_ms // 1000, mistakes, message, notes_mode)
+        if info != self._drawn_info:
+            self._drawn_info = info
+            panel_rect = pygame.Rect(INFO_PANEL_RECT)
+            surface.blit(self.background, panel_rect, panel_rect)
+            draw_game_info(surface, hints, time_ms, mistakes, message, notes_mode)
+            dirty.append(panel_rect)
+        return dirty
+
 
 def draw_restart_offer(surface):
     """Рисует кнопку 'Restart'"""
     try:
-        restart_text = font.render("Restart", True, BLACK)
+        restart_text = glyph_cache.get("Restart", BLACK)
         rect_width = restart_text.get_width() + 20
         rect_height = restart_text.get_height() + 10
         rect_x = (WIDTH - rect_width) // 2
@@ -204,71 +3754,665 @@ def draw_intro(surface):
         pygame.draw.rect(surface, GREEN, (0, 0, 180, HEIGHT))
         pygame.draw.rect(surface, YELLOW, (180, 0, 360, HEIGHT))
         pygame.draw.rect(surface, RED, (360, 0, 540, HEIGHT))
-        easy_level = font.render("Easy", True, BLACK)
-        medium_level = font.render("Medium", True, BLACK)
-        hard_level = font.render("Hard", True, BLACK)
+        easy_level = glyph_cache.get("Easy", BLACK)
+        medium_level = glyph_cache.get("Medium", BLACK)
+        hard_level = glyph_cache.get("Hard", BLACK)
         surface.blit(easy_level, (WIDTH // 12, HEIGHT // 2))
         surface.blit(medium_level, (WIDTH // 2.7, HEIGHT // 2))
         surface.blit(hard_level, (WIDTH // 1.3, HEIGHT // 2))
     except (AttributeError, TypeError):
         raise AttributeError("Ошибка отрисовки кнопки рестарта: неверная поверхность или шрифт")
 
-def main():
-    """Основная функция, содержащая игровой цикл"""
+RESTART_BUTTON_RECT = (170, 395, 200, 50)
+"""tuple: Область кнопки перезапуска (x, y, ширина, высота) для обработки кликов мыши"""
 
-    game_state = "start"
-    """str: Текущее состояние игры. Возможные значения: 'start', 'playing', 'win', 'lose'"""
 
-    done = False
-    """bool: Флаг управления главным циклом. Если True, программа завершается"""
+def _monotonic_ms():
+    """Время монотонных часов в миллисекундах (часы партии по умолчанию)"""
+    return int(time.monotonic() * 1000)
+
+
+def _generate_unique(difficulty):
+    """Источник уровней по умолчанию: генерация с единственным решением"""
+    return generate_board(difficulty, unique=True)
+
+
+JOURNAL_MAGIC = b"SDKJ"
+"""bytes: Сигнатура файла журнала ходов"""
+
+JOURNAL_HEADER = struct.Struct("<4sHHI")
+"""struct.Struct: Заголовок файла журнала: сигнатура, версия, интервал контрольных точек, количество записей"""
+
+JOURNAL_RECORD = struct.Struct("<BBBBI")
+"""struct.Struct: Запись журнала (8 байт): клетка, старое значение, новое значение, вид, мс от прошлой записи"""
+
+JOURNAL_KINDS = ("digit", "delete", "hint", "solve", "undo", "redo")
+"""tuple: Виды записей журнала. В записи хранится индекс вида"""
+
+JOURNAL_GROUPED = 0x80
+"""int: Флаг вида записи - продолжение того же действия (например, заполнение поля решением)"""
+
+JOURNAL_CHECKPOINT_EVERY = 64
+"""int: Через сколько записей журнал сохраняет копию поля для быстрой перемотки"""
+
+
+class MoveJournal:
+    """
+    Журнал ходов партии: только дописывание, по 8 байт на изменённую клетку
+
+    Каждая запись - изменение одной клетки. Действие из нескольких клеток (solve)
+    записывается группой: у всех записей, кроме первой, в виде выставлен флаг
+    JOURNAL_GROUPED. Отмена и повтор тоже дописываются в журнал (виды 'undo' и 'redo'),
+    поэтому журнал - полная история партии, а стеки отмены хранят только номера
+    первых записей действий. Каждые checkpoint_every записей сохраняется копия поля
+    (81 байт), и board_at перематывает партию не больше чем через checkpoint_every записей
+    """
+
+    def __init__(self, cells, started=0, checkpoint_every=JOURNAL_CHECKPOINT_EVERY):
+        """
+        :param cells: Исходное поле (81 значение клеток: bytes, bytearray или Board.cells)
+        :param started: Время начала партии в мс. От него считается задержка первой записи
+        :param checkpoint_every: Интервал контрольных точек в записях
+        :raises ValueError: Если поле не из 81 клетки или интервал не положителен
+        """
+        if len(cells) != 81:
+            raise ValueError(f"Журнал ведётся для поля из 81 клетки, получено {len(cells)}")
+        if not 0 < checkpoint_every <= 0xFFFF:
+            raise ValueError(f"Интервал контрольных точек должен быть от 1 до 65535, получено {checkpoint_every}")
+        self.checkpoint_every = checkpoint_every
+        """int: Интервал контрольных точек в записях"""
+
+        self.last_time = started
+        """int: Время последней записи в мс"""
+
+        self._records = bytearray()
+        self._cells = bytearray(cells)
+        self._checkpoints = [bytes(cells)]
+        self._undo = array("I")
+        self._redo = array("I")
+
+    def __len__(self):
+        return len(self._records) // JOURNAL_RECORD.size
+
+    @property
+    def can_undo(self):
+        """True, если есть действие для отмены"""
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        """True, если есть отменённое действие для повтора"""
+        return bool(self._redo)
+
+    @property
+    def next_undo(self):
+        """Номер первой записи действия, которое отменит undo (None, если отменять нечего)"""
+        return self._undo[-1] if self._undo else None
+
+    @property
+    def next_redo(self):
+        """Номер первой записи действия, которое повторит redo (None, если повторять нечего)"""
+        return self._redo[-1] if self._redo else None
+
+    @property
+    def nbytes(self):
+        """Память под записи и контрольные точки в байтах"""
+        return len(self._records) + 81 * len(self._checkpoints)
+
+    def record(self, cell, old, new, kind, now, grouped=False):
+        """
+        Дописывает изменение клетки
+
+        :param cell: Индекс клетки (row * 9 + col)
+        :param old: Значение до хода
+        :param new: Значение после хода
+        :param kind: Вид записи из JOURNAL_KINDS ('digit', 'delete', 'hint' или 'solve')
+        :param now: Текущее время в мс
+        :param grouped: True - продолжение предыдущего действия, а не новое действие
+        :raises ValueError: Если вид записи неизвестен
+        """
+        if kind not in JOURNAL_KINDS[:4]:
+            raise ValueError(f"Неизвестный вид записи журнала: {kind!r}")
+        self._append(cell, old, new, JOURNAL_KINDS.index(kind) | (JOURNAL_GROUPED if grouped else 0), now)
+
+    def _append(self, cell, old, new, code, now):
+        """Дописывает упакованную запись, обновляет поле, стеки отмены и контрольные точки"""
+        delta = min(max(now - self.last_time, 0), 0xFFFFFFFF)
+        self.last_time = now
+        position = len(self)
+        self._records += JOURNAL_RECORD.pack(cell, old, new, code, delta)
+        self._cells[cell] = new
+        if not code & JOURNAL_GROUPED:
+            kind = JOURNAL_KINDS[code]
+            if kind == "undo":
+                self._redo.append(self._undo.pop())
+            elif kind == "redo":
+                self._undo.append(self._redo.pop())
+            else:
+                self._undo.append(position)
+                del self._redo[:]
+        if (position + 1) % self.checkpoint_every == 0:
+            self._checkpoints.append(bytes(self._cells))
 
-    grid = None
-    """list[list[int]]: Текущее состояние игрового поля 9x9, которое видит и меняет игрок"""
+    def _group(self, start):
+        """Записи действия, начинающегося с записи start: список (клетка, старое, новое)"""
+        changes = []
+        offset = start * JOURNAL_RECORD.size
+        while True:
+            cell, old, new, _, _ = JOURNAL_RECORD.unpack_from(self._records, offset)
+            changes.append((cell, old, new))
+            offset += JOURNAL_RECORD.size
+            if offset >= len(self._records) or not self._records[offset + 3] & JOURNAL_GROUPED:
+                return changes
 
-    solution_grid = None
-    """list[list[int]]: Полностью решенное поле 9x9, используется для проверки ответов"""
+    def undo(self, now):
+        """
+        Отменяет последнее действие и дописывает в журнал записи 'undo'
 
-    original_grid = None
-    """list[list[int]]: Исходное состояние поля при генерации. Используется для определения неизменяемых клеток"""
+        :param now: Текущее время в мс
+        :return: Список (клетка, значение), которые нужно выставить на поле. Пустой, если отменять нечего
+        """
+        if not self._undo:
+            return []
+        changes = [(cell, old, new) for cell, new, old in reversed(self._group(self._undo[-1]))]
+        return self._apply(changes, "undo", now)
 
-    hints_count = 0
-    """int: Количество доступных подсказок у игрока"""
+    def redo(self, now):
+        """
+        Повторяет последнее отменённое действие и дописывает в журнал записи 'redo'
 
-    mistakes_left = 0
-    """int: Количество оставшихся жизней (прав на ошибку)"""
+        :param now: Текущее время в мс
+        :return: Список (клетка, значение), которые нужно выставить на поле. Пустой, если повторять нечего
+        """
+        if not self._redo:
+            return []
+        return self._apply(self._group(self._redo[-1]), "redo", now)
 
-    start_game_time = 0
-    """int: Время системного таймера (в мс) в момент начала партии. Точка отсчета для секундомера"""
+    def _apply(self, changes, kind, now):
+        """Дописывает группу записей отмены или повтора"""
+        code = JOURNAL_KINDS.index(kind)
+        for number, (cell, old, new) in enumerate(changes):
+            self._append(cell, old, new, code | (JOURNAL_GROUPED if number else 0), now)
+        return [(cell, new) for cell, _, new in changes]
 
-    game_time = 0
-    """int: Текущее время игры в миллисекундах (разница между текущим временем и start_game_time)"""
+    def records(self):
+        """Итератор записей: (клетка, старое, новое, вид, сгруппирована, мс от прошлой записи)"""
+        for cell, old, new, code, delta in JOURNAL_RECORD.iter_unpack(self._records):
+            yield cell, old, new, JOURNAL_KINDS[code & ~JOURNAL_GROUPED], bool(code & JOURNAL_GROUPED), delta
 
-    game_data = None
-    """tuple: Кортеж данных от генератора уровня, содержащий (grid, solution, hints, mistakes)"""
+    def board_at(self, position=None):
+        """
+        Поле после первых position записей (по умолчанию - текущее)
 
-    selected_row = None
-    """int or None: Индекс строки (0-8) текущей выбранной клетки"""
+        Перемотка начинается с ближайшей контрольной точки
 
-    selected_col = None
-    """int or None: Индекс столбца (0-8) текущей выбранной клетки"""
+        :return: Board
+        :raises IndexError: Если position вне диапазона 0..len(journal)
+        """
+        if position is None:
+            return Board(self._cells)
+        if not 0 <= position <= len(self):
+            raise IndexError(f"Позиция журнала {position} вне диапазона 0..{len(self)}")
+        checkpoint = position // self.checkpoint_every
+        cells = bytearray(self._checkpoints[checkpoint])
+        start = checkpoint * self.checkpoint_every * JOURNAL_RECORD.size
+        for offset in range(start, position * JOURNAL_RECORD.size, JOURNAL_RECORD.size):
+            cells[self._records[offset]] = self._records[offset + 2]
+        return Board(cells)
 
-    pos = None
-    """tuple[int, int]: Координаты курсора мыши (x, y) в момент события клика"""
+    def save(self, path):
+        """
+        Сохраняет журнал в двоичный файл: заголовок, исходное поле и записи
 
-    col = 0
-    """int: Индекс столбца, рассчитанный на основе координат клика мыши"""
+        :return: Количество сохранённых записей
+        """
+        with open(path, "wb") as output:
+            output.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, 1, self.checkpoint_every, len(self)))
+            output.write(self._checkpoints[0])
+            output.write(self._records)
+        return len(self)
 
-    row = 0
-    """int: Индекс строки, рассчитанный на основе координат клика мыши"""
+    @classmethod
+    def load(cls, path, started=0):
+        """
+        Загружает журнал из файла save(), восстанавливая стеки отмены и контрольные точки
 
-    digit = 0
-    """int: Цифра (1-9), введенная пользователем с клавиатуры"""
+        :return: MoveJournal
+        :raises ValueError: Если файл не является журналом ходов
+        """
+        with open(path, "rb") as source:
+            data = source.read()
+        if len(data) < JOURNAL_HEADER.size + 81:
+            raise ValueError(f"Файл {path} не является журналом ходов")
+        magic, version, checkpoint_every, count = JOURNAL_HEADER.unpack_from(data)
+        if (magic != JOURNAL_MAGIC or version != 1
+                or len(data) != JOURNAL_HEADER.size + 81 + count * JOURNAL_RECORD.size):
+            raise ValueError(f"Файл {path} не является журналом ходов")
+        journal = cls(data[JOURNAL_HEADER.size:JOURNAL_HEADER.size + 81], started, checkpoint_every)
+        now = started
+        for cell, old, new, code, delta in JOURNAL_RECORD.iter_unpack(data[JOURNAL_HEADER.size + 81:]):
+            if cell > 80 or new > 9 or code & ~JOURNAL_GROUPED >= len(JOURNAL_KINDS):
+                raise ValueError(f"Файл {path} содержит повреждённую запись журнала")
+            now += delta
+            try:
+                journal._append(cell, old, new, code, now)
+            except IndexError:
+                raise ValueError(f"Файл {path} содержит отмену без соответствующего хода") from None
+        return journal
 
-    mistake_number_reasoner = None
-    """int or None: Цифра (1-9), которая была введена неверно. Используется для подсветки всех таких цифр на поле"""
 
-    restart_button_rect = pygame.Rect(170, 395, 200, 50)
-    """pygame.Rect: Область кнопки перезапуска игры для обработки кликов мыши"""
+class GameSession:
+    """
+    Состояние партии и обработка ходов без привязки к pygame
+
+    Хранит конечный автомат игры ('start', 'playing', 'win', 'lose'), поле и счётчики.
+    Ввод передаётся вызовами методов (click, enter_digit, delete, hint, solve) или
+    сценарием действий через handle/replay, поэтому партию можно проигрывать без
+    окна и очереди событий
+    """
+
+    def __init__(self, puzzle_source=None, clock=None):
+        """
+        :param puzzle_source: Функция difficulty -> (grid, solution, hints, mistakes). По умолчанию генерация уникального уровня
+        :param clock: Функция без аргументов, возвращающая текущее время в мс (например, pygame.time.get_ticks)
+        """
+        self.puzzle_source = puzzle_source or _generate_unique
+        """callable: Источник новых уровней"""
+
+        self.clock = clock or _monotonic_ms
+        """callable: Часы партии в миллисекундах"""
+
+        self.state = "start"
+        """str: Текущее состояние игры. Возможные значения: 'start', 'playing', 'win', 'lose'"""
+
+        self.grid = None
+        """Board: Текущее состояние игрового поля 9x9, которое видит и меняет игрок"""
+
+        self.solution_grid = None
+        """Board: Полностью решенное поле 9x9, используется для проверки ответов"""
+
+        self.original_grid = None
+        """Board: Исходное состояние поля при генерации. Используется для определения неизменяемых клеток"""
+
+        self.hints_count = 0
+        """int: Количество доступных подсказок у игрока"""
+
+        self.mistakes_left = 0
+        """int: Количество оставшихся жизней (прав на ошибку)"""
+
+        self.start_game_time = 0
+        """int: Время часов (в мс) в момент начала партии. Точка отсчета для секундомера"""
+
+        self.game_time = 0
+        """int: Текущее время игры в миллисекундах"""
+
+        self.selected_row = None
+        """int or None: Индекс строки (0-8) текущей выбранной клетки"""
+
+        self.selected_col = None
+        """int or None: Индекс столбца (0-8) текущей выбранной клетки"""
+
+        self.mistake_number = None
+        """int or None: Цифра (1-9), которая была введена неверно. Используется для подсветки всех таких цифр на поле"""
+
+        self.moves = 0
+        """int: Количество ходов, изменивших поле, за партию"""
+
+        self.hint_engine = HintEngine()
+        """HintEngine: Кандидаты живого поля для подсказок следующего шага"""
+
+        self.hint_message = None
+        """str or None: Объяснение последней подсказки для панели статистики"""
+
+        self.journal = None
+        """MoveJournal or None: Журнал ходов текущей партии для отмены, повтора и перемотки"""
+
+        self.notes = array("H", bytes(162))
+        """array: Заметки игрока - маска кандидатов (бит 1 << digit) для каждой из 81 клетки"""
+
+        self.notes_mode = False
+        """bool: True - цифры вводятся как заметки, а не как ответ"""
+
+        self.note_changes = {}
+        """dict: Номер первой записи действия в журнале -> список (клетка, маска заметок до действия), которые действие изменило"""
+
+        self.auto_prune = True
+        """bool: Убирать цифру из заметок строки, столбца и блока, когда она ставится на поле"""
+
+    def start(self, difficulty):
+        """
+        Начинает партию заданной сложности
+
+        :raises SudokuError: Если сложность указана неверно
+        """
+        grid, solution, hints, mistakes = self.puzzle_source(difficulty)
+        self.grid = Board(grid)
+        self.solution_grid = Board(solution)
+        self.original_grid = self.grid.copy()
+        self.hints_count = hints
+        self.mistakes_left = mistakes
+        self.start_game_time = self.clock()
+        self.game_time = 0
+        self.selected_row, self.selected_col = None, None
+        self.mistake_number = None
+        self.moves = 0
+        self.hint_engine.reset(self.grid)
+        self.hint_message = None
+        self.journal = MoveJournal(self.grid.cells, self.start_game_time)
+        self.notes = array("H", bytes(162))
+        self.notes_mode = False
+        self.note_changes = {}
+        self.state = "playing"
+
+    def restart(self):
+        """Возвращает игру в стартовое меню"""
+        self.state = "start"
+        self.selected_col, self.selected_row = None, None
+        self.mistake_number = None
+        self.hint_message = None
+
+    def tick(self):
+        """Обновляет время партии по часам"""
+        if self.state == "playing":
+            self.game_time = self.clock() - self.start_game_time
+
+    def click(self, x, y):
+        """
+        Обрабатывает клик в точке (x, y) в зависимости от состояния игры
+
+        В меню выбирает сложность по горизонтали, в игре выделяет клетку,
+        на экранах победы и поражения нажимает кнопку перезапуска
+        """
+        if self.state == "start":
+            if 0 <= x <= 180:
+                difficulty = 1
+            elif 180 <= x <= 360:
+                difficulty = 2
+            else:
+                difficulty = 3
+            try:
+                self.start(difficulty)
+            except SudokuError as error:
+                print(f"Ошибка при создании уровня: {error}")
+
+        elif self.state == "playing":
+            if 0 <= x <= WIDTH and 0 <= y <= HEIGHT:
+                self.select(y // CELL_SIZE, x // CELL_SIZE)
+
+        elif self.state in ("lose", "win"):
+            rect_x, rect_y, rect_width, rect_height = RESTART_BUTTON_RECT
+            if rect_x <= x < rect_x + rect_width and rect_y <= y < rect_y + rect_height:
+                self.restart()
+
+    def select(self, row, col):
+        """Выделяет клетку, если она лежит на поле"""
+        if self.state == "playing" and 0 <= row <= 8 and 0 <= col <= 8:
+            self.selected_row = row
+            self.selected_col = col
+
+    def _can_edit(self):
+        """True, если идёт партия и выбрана клетка"""
+        return self.state == "playing" and self.selected_row is not None and self.selected_col is not None
+
+    def toggle_notes(self):
+        """Переключает ввод цифр между ответами и заметками"""
+        if self.state == "playing":
+            self.notes_mode = not self.notes_mode
+
+    def toggle_note(self, digit):
+        """
+        Ставит или снимает заметку digit в выбранной пустой клетке
+
+        :return: True, если заметки изменились
+        """
+        if not self._can_edit() or self.grid[self.selected_row][self.selected_col]:
+            return False
+        self.notes[self.selected_row * 9 + self.selected_col] ^= 1 << digit
+        return True
+
+    def _prune_notes(self, index, digit):
+        """
+        Снимает заметки клетки index и, если включено auto_prune, цифру digit из заметок её соседей
+
+        :return: Список (клетка, прежняя маска) изменённых заметок для note_changes
+        """
+        notes = self.notes
+        changed = [(index, notes[index])] if notes[index] else []
+        notes[index] = 0
+        if self.auto_prune:
+            bit = 1 << digit
+            for peer in PEERS[index]:
+                if notes[peer] & bit:
+                    changed.append((peer, notes[peer]))
+                    notes[peer] ^= bit
+        return changed
+
+    def enter_digit(self, digit):
+        """
+        Ставит цифру в выбранную клетку. Неверная цифра отнимает жизнь.
+        В режиме заметок вместо этого переключает заметку (toggle_note)
+
+        :return: True, если поле (или заметки) изменились
+        """
+        if self.notes_mode:
+            return self.toggle_note(digit)
+        if not self._can_edit():
+            return False
+        row, col = self.selected_row, self.selected_col
+        if self.original_grid[row][col] != 0 or self.grid[row][col] == digit:
+            return False
+        if digit != self.solution_grid[row][col]:
+            self.mistakes_left -= 1
+            self.mistake_number = digit
+        position = len(self.journal)
+        self.journal.record(row * 9 + col, self.grid[row][col], digit, "digit", self.clock())
+        self.grid[row][col] = digit
+        self.hint_engine.set_cell(row * 9 + col, digit)
+        self.note_changes[position] = self._prune_notes(row * 9 + col, digit)
+        return self._after_move()
+
+    def delete(self):
+        """
+        Очищает выбранную клетку, если она не исходная
+
+        :return: True, если ход выполнен
+        """
+        if not self._can_edit() or self.original_grid[self.selected_row][self.selected_col] != 0:
+            return False
+        if self.grid[self.selected_row][self.selected_col]:
+            self.journal.record(self.selected_row * 9 + self.selected_col,
+                                self.grid[self.selected_row][self.selected_col], 0, "delete", self.clock())
+        self.grid[self.selected_row][self.selected_col] = 0
+        self.notes[self.selected_row * 9 + self.selected_col] = 0
+        self.hint_engine.clear_cell(self.selected_row * 9 + self.selected_col)
+        self.mistake_number = None
+        return self._after_move()
+
+    def hint(self):
+        """
+        Подсказка за одну единицу hints_count, объяснение попадает в hint_message
+
+        Если выбрана пустая клетка, в неё ставится верная цифра. Иначе HintEngine
+        находит самый простой логический шаг, и его клетка выделяется и заполняется.
+        Пока на поле есть неверная цифра, подсказка только указывает на неё
+
+        :return: True, если подсказка использована
+        """
+        if self.state != "playing" or self.hints_count <= 0:
+            return False
+        cells = self.grid.cells
+        solution = self.solution_grid.cells
+        for index in range(81):
+            if cells[index] and cells[index] != solution[index]:
+                self.select(ROW_OF[index], COL_OF[index])
+                self.hint_message = f"{cell_name(index)} does not match the solution"
+                return False
+
+        if self._can_edit() and not self.grid[self.selected_row][self.selected_col]:
+            index = self.selected_row * 9 + self.selected_col
+            step = self.hint_engine.cell_step(index)
+            self.hint_message = step.explain() if step else f"{cell_name(index)} is {solution[index]}"
+        else:
+            step = self.hint_engine.next_step()
+            if step is None:
+                index = cells.index(0)
+                self.hint_message = f"No logical step found: {cell_name(index)} is {solution[index]}"
+            else:
+                index = step.placements[0][0]
+                used = ", ".join(TECHNIQUE_TITLES[name] for name in self.hint_engine.used)
+                self.hint_message = f"After {used}. {step.explain()}" if used else step.explain()
+            self.select(ROW_OF[index], COL_OF[index])
+
+        position = len(self.journal)
+        self.journal.record(index, 0, solution[index], "hint", self.clock())
+        cells[index] = solution[index]
+        self.hint_engine.set_cell(index, solution[index])
+        self.note_changes[position] = self._prune_notes(index, solution[index])
+        self.hints_count -= 1
+        return self._after_move()
+
+    def solve(self):
+        """
+        Заполняет поле решением целиком (клавиша Enter)
+
+        :return: True, если ход выполнен
+        """
+        if not self._can_edit():
+            return False
+        now = self.clock()
+        self.note_changes[len(self.journal)] = [(index, mask) for index, mask in enumerate(self.notes) if mask]
+        changed = [index for index in range(81) if self.grid.cells[index] != self.solution_grid.cells[index]]
+        for number, index in enumerate(changed):
+            self.journal.record(index, self.grid.cells[index], self.solution_grid.cells[index], "solve", now,
+                                grouped=number > 0)
+        self.grid = self.solution_grid.copy()
+        self.hint_engine.sync(self.grid)
+        self.notes = array("H", bytes(162))
+        return self._after_move()
+
+    def undo(self):
+        """
+        Отменяет последнее действие по журналу. Потраченные жизни и подсказки не возвращаются.
+        Заметки, снятые действием, возвращаются из note_changes
+
+        :return: True, если поле изменилось
+        """
+        if self.state != "playing":
+            return False
+        position = self.journal.next_undo
+        return self._restore(self.journal.undo(self.clock()), position, True)
+
+    def redo(self):
+        """
+        Повторяет последнее отменённое действие
+
+        :return: True, если поле изменилось
+        """
+        if self.state != "playing":
+            return False
+        position = self.journal.next_redo
+        return self._restore(self.journal.redo(self.clock()), position, False)
+
+    def _restore(self, changes, position, undo):
+        """
+        Выставляет на поле значения клеток из журнала и выделяет последнюю изменённую клетку
+
+        При отмене заметки возвращаются к маскам до действия position, при повторе
+        снимаются заново, и изменённые маски снова запоминаются в note_changes
+        """
+        if not changes:
+            return False
+        pruned = []
+        for index, value in changes:
+            self.grid.cells[index] = value
+            if value:
+                self.hint_engine.set_cell(index, value)
+                if undo:
+                    self.notes[index] = 0
+                else:
+                    pruned += self._prune_notes(index, value)
+            else:
+                self.hint_engine.clear_cell(index)
+        if undo:
+            for cell, mask in reversed(self.note_changes.pop(position, ())):
+                self.notes[cell] = mask
+        else:
+            self.note_changes[position] = pruned
+        self.select(ROW_OF[index], COL_OF[index])
+        self.mistake_number = None
+        return self._after_move()
+
+    def _after_move(self):
+        """Проверяет победу и поражение. Вызывается только после хода"""
+        self.moves += 1
+        if self.mistakes_left <= 0:
+            self.state = "lose"
+        if self.grid == self.solution_grid:
+            self.state = "win"
+        return True
+
+    def handle(self, action, *args):
+        """
+        Выполняет одно действие сценария
+
+        :param action: 'click', 'select', 'digit', 'delete', 'hint', 'solve', 'undo', 'redo', 'notes', 'note',
+            'start', 'restart' или 'tick'
+        :param args: Аргументы действия, например ('click', x, y) или ('digit', 5)
+        :return: Результат соответствующего метода
+        :raises SudokuError: Если действие неизвестно
+        """
+        handlers = {
+            "click": self.click, "select": self.select, "digit": self.enter_digit,
+            "delete": self.delete, "hint": self.hint, "solve": self.solve, "undo": self.undo, "redo": self.redo,
+            "notes": self.toggle_notes, "note": self.toggle_note,
+            "start": self.start, "restart": self.restart, "tick": self.tick,
+        }
+        if action not in handlers:
+            raise SudokuError(f"Неизвестное действие сценария: {action}")
+        return handlers[action](*args)
+
+    def replay(self, script):
+        """
+        Проигрывает сценарий - последовательность кортежей (действие, *аргументы)
+
+        :return: Количество выполненных действий
+        """
+        count = 0
+        for step in script:
+            self.handle(*step)
+            count += 1
+        return count
+
+
+IDLE_TIMEOUT_MS = 1000
+"""int: Максимальное время ожидания события в событийном режиме игрового цикла (мс)"""
+
+
+def main(event_driven=True):
+    """
+    Основная функция, содержащая игровой цикл
+
+    Логика партии находится в GameSession, здесь события pygame переводятся
+    в её действия и выполняется отрисовка. Клавиша F3 показывает панель отладки
+    поверх экрана и, пока панель видна, включает сбор instrumentation. U и R
+    отменяют и повторяют ход по журналу, N переключает ввод заметок
+
+    :param event_driven: True - цикл спит в pygame.event.wait и просыпается только от ввода
+        или ежесекундного тика таймера, кадр рисуется только после изменений.
+        False - прежний опрос событий и перерисовка 60 раз в секунду
+    """
+
+    done = False
+    """bool: Флаг управления главным циклом. Если True, программа завершается"""
+
+    puzzle_pool = None
+    """PuzzlePool or None: Запас готовых уровней в фоновых процессах. Запускается после первого кадра, чтобы не задерживать его"""
+
+    session = GameSession()
+    """GameSession: Состояние партии и обработка ходов. Источник уровней - puzzle_pool, когда он запущен"""
+
+    previous_state = session.state
+    """str: Состояние игры до обработки событий итерации. Нужно, чтобы включать и выключать таймер"""
 
     text = None
     """pygame.Surface: Объект отрисованного текста (для заголовков Win/Lose)"""
@@ -276,6 +4420,36 @@ def main():
     text_rect = None
     """pygame.Rect: Прямоугольник, содержащий координаты и размер заголовка текста"""
 
+    renderer = BoardRenderer()
+    """BoardRenderer: Инкрементальная отрисовка игрового поля"""
+
+    drawn_state = None
+    """str or None: Состояние игры, нарисованное в прошлом кадре. При смене экрана поле перерисовывается целиком"""
+
+    dirty_rects = None
+    """list[pygame.Rect] or None: Изменённые за кадр области экрана. None - обновить экран целиком"""
+
+    timer_event = pygame.USEREVENT + 1
+    """int: Тип события ежесекундного тика таймера партии"""
+
+    events = []
+    """list[pygame.event.Event]: События, полученные за одну итерацию цикла"""
+
+    needs_redraw = True
+    """bool: Нужно ли рисовать кадр в событийном режиме"""
+
+    redraw_events = {pygame.QUIT, pygame.VIDEOEXPOSE, pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN, timer_event}
+    """set: Типы событий, после которых нужен новый кадр. Остальные (движение мыши, фокус окна) кадр не рисуют"""
+
+    show_overlay = False
+    """bool: Показывать ли панель отладки instrumentation (F3)"""
+
+    instrumentation_requested = instrumentation.enabled
+    """bool: Сбор включён переменной SUDOKU_INSTRUMENT или флагом --instrument. Сюда сбор возвращается, когда F3 скрывает панель"""
+
+    frame_started = 0.0
+    """float: Время начала отрисовки кадра (perf_counter) для гистограммы 'frame'"""
+
     numbers_map = {
         pygame.K_KP1: 1, pygame.K_1: 1, pygame.K_KP2: 2, pygame.K_2: 2,
         pygame.K_KP3: 3, pygame.K_3: 3, pygame.K_KP4: 4, pygame.K_4: 4,
@@ -285,120 +4459,103 @@ def main():
     }
     """dict: Словарь сопоставления клавиш клавиатуры (основных и numpad) с целыми числами 1-9"""
 
+    key_actions = {
+        pygame.K_BACKSPACE: "delete", pygame.K_DELETE: "delete",
+        pygame.K_RETURN: "solve", pygame.K_h: "hint", pygame.K_u: "undo", pygame.K_r: "redo",
+        pygame.K_n: "notes",
+    }
+    """dict: Клавиши управления и соответствующие им действия GameSession"""
+
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
     try:
         while not done:
-            if game_state == "playing":
-                game_time = pygame.time.get_ticks() - start_game_time
-                if mistakes_left <= 0:
-                    game_state = "lose"
-                if grid == solution_grid:
-                    game_state = "win"
-
-            for event in pygame.event.get():
+            if event_driven:
+                events = [pygame.event.wait(IDLE_TIMEOUT_MS)] + pygame.event.get()
+            else:
+                events = pygame.event.get()
+
+            previous_state = session.state
+            session.tick()
+
+            for event in events:
+                if event.type not in redraw_events:
+                    continue
+                needs_redraw = True
+
                 if event.type == pygame.QUIT:
                     done = True
 
-                if game_state == "start":
-                        if event.type == pygame.MOUSEBUTTONDOWN:
-                            pos = pygame.mouse.get_pos()
-                            try:
-                                difficulty = 0
-                                if 0 <= pos[0] <= 180:
-                                    difficulty = 1
-                                elif 180 <= pos[0] <= 360:
-                                    difficulty = 2
-                                else:
-                                    difficulty = 3
-
-                                game_data = generate_board(difficulty)
-                                grid = game_data[0]
-                                solution_grid = game_data[1]
-                                hints_count = game_data[2]
-                                mistakes_left = game_data[3]
-                                original_grid = copy.deepcopy(grid)
-
-                                start_game_time = pygame.time.get_ticks()
-                                game_state = "playing"
-                            except SudokuError as error:
-                                print(f"Ошибка при создании уровня: {error}")
-
-                elif game_state == "playing":
-                    if event.type == pygame.MOUSEBUTTONDOWN:
-                        pos = pygame.mouse.get_pos()
-                        if 0 <= pos[0] <= WIDTH and 0 <= pos[1] <= HEIGHT:
-                            col = pos[0] // CELL_SIZE
-                            row = pos[1] // CELL_SIZE
-                            if 0 <= row <= 8 and 0 <= col <= 8:
-                                selected_row = row
-                                selected_col = col
-
-                    if selected_col is not None and selected_row is not None:
-                        if event.type == pygame.KEYDOWN:
-                            if event.key in numbers_map:
-                                digit = numbers_map[event.key]
-
-                                if original_grid[selected_row][selected_col] == 0:
-                                    if grid[selected_row][selected_col] == 0 or grid[selected_row][
-                                        selected_col] != digit:
-                                        if digit != solution_grid[selected_row][selected_col]:
-                                            mistakes_left -= 1
-                                            grid[selected_row][selected_col] = digit
-                                            mistake_number_reasoner = digit
-                                        else:
-                                            grid[selected_row][selected_col] = digit
-
-                            elif event.key == pygame.K_BACKSPACE or event.key == pygame.K_DELETE:
-                                if original_grid[selected_row][selected_col] == 0:
-                                    grid[selected_row][selected_col] = 0
-                                    mistake_number_reasoner = None
-
-
-                            elif event.key == pygame.K_RETURN:
-                                grid = copy.deepcopy(solution_grid)
-
-                            elif event.key == pygame.K_h:
-                                if hints_count > 0:
-                                    if grid[selected_row][selected_col] == 0:
-                                        grid[selected_row][selected_col] = solution_grid[selected_row][selected_col]
-                                        hints_count -= 1
-
-                elif game_state in ("lose", "win"):
-                    if event.type == pygame.MOUSEBUTTONDOWN:
-                        pos = pygame.mouse.get_pos()
-                        if restart_button_rect.collidepoint(pos):
-                            game_state = "start"
-                            selected_col, selected_row = None, None
-                            mistake_number_reasoner = None
-
-            if game_state == "start":
+                elif event.type == pygame.VIDEOEXPOSE:
+                    renderer.invalidate()
+
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    session.click(*event.pos)
+
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_F3:
+                        show_overlay = not show_overlay
+                        instrumentation.enabled = instrumentation_requested or show_overlay
+                        renderer.invalidate()
+                    elif event.key in numbers_map:
+                        session.enter_digit(numbers_map[event.key])
+                    elif event.key in key_actions:
+                        session.handle(key_actions[event.key])
+
+            if session.state != previous_state:
+                if session.state == "playing":
+                    pygame.time.set_timer(timer_event, 1000)
+                elif previous_state == "playing":
+                    pygame.time.set_timer(timer_event, 0)
+
+            if event_driven and not needs_redraw and session.state == drawn_state:
+                continue
+            needs_redraw = False
+            frame_started = time.perf_counter()
+
+            dirty_rects = None
+            if session.state != drawn_state or show_overlay:
+                renderer.invalidate()
+                drawn_state = session.state
+
+            if session.state == "start":
                 draw_intro(screen)
 
-            elif game_state == "playing":
-                draw_board(screen)
-                draw_selected_cell(screen, selected_row, selected_col)
-                if grid:
-                    draw_numbers(screen, grid, original_grid, solution_grid, mistake_number_reasoner)
-                    draw_game_info(screen, hints_count, game_time, mistakes_left)
+            elif session.state == "playing":
+                dirty_rects = renderer.render(screen, session.grid, session.original_grid, session.solution_grid,
+                                              (session.selected_row, session.selected_col), session.mistake_number,
+                                              session.hints_count, session.game_time, session.mistakes_left,
+                                              session.hint_message, session.notes, session.notes_mode)
 
-            elif game_state == "lose":
+            elif session.state == "lose":
                 screen.fill(BLACK)
-                text = font.render("Game Over", True, RED)
+                text = glyph_cache.get("Game Over", RED)
                 text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
                 screen.blit(text, text_rect)
-                if grid:
-                    draw_game_info(screen, hints_count, game_time, mistakes_left)
+                if session.grid:
+                    draw_game_info(screen, session.hints_count, session.game_time, session.mistakes_left)
                 draw_restart_offer(screen)
 
-            elif game_state == "win":
+            elif session.state == "win":
                 screen.fill(BLACK)
-                text = font.render("You won!", True, GREEN)
+                text = glyph_cache.get("You won!", GREEN)
                 text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
                 screen.blit(text, text_rect)
-                if grid:
-                    draw_game_info(screen, hints_count, game_time, mistakes_left)
+                if session.grid:
+                    draw_game_info(screen, session.hints_count, session.game_time, session.mistakes_left)
                 draw_restart_offer(screen)
 
-            pygame.display.flip()
+            instrumentation.observe("frame", time.perf_counter() - frame_started)
+            if show_overlay:
+                draw_debug_overlay(screen)
+                dirty_rects = None
+
+            if dirty_rects is None:
+                pygame.display.flip()
+            elif dirty_rects:
+                pygame.display.update(dirty_rects)
+            if puzzle_pool is None:
+                puzzle_pool = PuzzlePool()
+                session.puzzle_source = puzzle_pool.get
             clock.tick(60)
 
     except KeyboardInterrupt:
@@ -406,17 +4563,102 @@ def main():
     except Exception as error:
         print(f"Критическая ошибка в главном цикле: {error}")
     finally:
+        if puzzle_pool is not None:
+            puzzle_pool.close()
         pygame.quit()
 
+def command_generate(arguments):
+    """Подкоманда 'generate': пакетная генерация уровней в файл"""
+    started = time.perf_counter()
+    games = generate_many(arguments.count, arguments.difficulty, arguments.workers, arguments.seed,
+                          not arguments.random_removal)
+    if arguments.format == "pack":
+        written = write_pack(arguments.output, games, arguments.difficulty)
+    else:
+        written = write_puzzles(arguments.output, games)
+    elapsed = time.perf_counter() - started
+    print(f"Сгенерировано уровней: {written} за {elapsed:.1f} с ({written / elapsed:.1f} в секунду) -> {arguments.output}")
+
+
+def command_dedupe(arguments):
+    """Подкоманда 'dedupe': копирование набора без эквивалентных головоломок"""
+    started = time.perf_counter()
+    index_path = arguments.index or f"{arguments.output}.index.sqlite"
+    try:
+        with PuzzleIndex(index_path) as index:
+            kept, dropped = dedupe_pack(arguments.input, arguments.output, index)
+    finally:
+        if arguments.index is None:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(index_path + suffix):
+                    os.remove(index_path + suffix)
+    elapsed = time.perf_counter() - started
+    print(f"Оставлено уровней: {kept}, отброшено повторов: {dropped} за {elapsed:.1f} с -> {arguments.output}")
+
+
+def parse_args(argv=None):
+    """
+    Разбирает аргументы командной строки. Без подкоманды запускается игра
+
+    :param argv: Список аргументов (None - sys.argv)
+    :return: argparse.Namespace, поле command содержит имя подкоманды или None
+    """
+    parser = argparse.ArgumentParser(description="Судоку на pygame")
+    parser.add_argument("--poll", action="store_true",
+                        help="Опрашивать события и перерисовывать экран 60 раз в секунду вместо ожидания ввода")
+    parser.add_argument("--instrument", action="store_true",
+                        help=f"Собирать счётчики и время горячих участков (как {INSTRUMENT_ENV}=1)")
+    parser.add_argument("--instrument-json", default=None, help="Записать собранные счётчики в JSON-файл при выходе")
+    parser.add_argument("--profile", default=None, help="Выполнить запуск под cProfile и сохранить профиль в файл")
+    commands = parser.add_subparsers(dest="command")
+
+    generate = commands.add_parser("generate", help="Пакетная генерация уровней на нескольких ядрах")
+    generate.add_argument("--count", type=int, required=True, help="Количество уровней")
+    generate.add_argument("--difficulty", type=int, choices=(1, 2, 3), default=2, help="Сложность")
+    generate.add_argument("--workers", type=int, default=None, help="Количество процессов (по умолчанию - по числу ядер)")
+    generate.add_argument("--seed", type=int, default=0, help="Базовое зерно для воспроизводимого результата")
+    generate.add_argument("--output", default="puzzles.txt", help="Файл для записи уровней")
+    generate.add_argument("--format", choices=("text", "pack"), default="text",
+                          help="Формат файла: текстовые строки или бинарный набор PuzzlePack")
+    generate.add_argument("--random-removal", action="store_true", help="Не проверять единственность решения")
+    generate.set_defaults(handler=command_generate)
+
+    dedupe = commands.add_parser("dedupe", help="Удаление эквивалентных головоломок из набора PuzzlePack")
+    dedupe.add_argument("input", help="Исходный набор")
+    dedupe.add_argument("output", help="Набор без повторов")
+    dedupe.add_argument("--index", default=None,
+                        help="Файл индекса отпечатков, сохраняемый между запусками (по умолчанию - временный)")
+    dedupe.set_defaults(handler=command_dedupe)
+
+    return parser.parse_args(argv)
+
+
+def run_instrumented(arguments, func, *args):
+    """Выполняет func с учётом флагов --instrument, --instrument-json и --profile"""
+    if arguments.instrument or arguments.instrument_json:
+        instrumentation.enabled = True
+    try:
+        if arguments.profile:
+            return profile_call(arguments.profile, func, *args)
+        return func(*args)
+    finally:
+        if arguments.instrument_json:
+            instrumentation.dump(arguments.instrument_json)
+
+
 if __name__ == "__main__":
-    pygame.init()
+    arguments = parse_args()
+    if arguments.command is not None:
+        run_instrumented(arguments, arguments.handler, arguments)
+        exit(0)
+
     try:
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("Sudoku")
-        font = pygame.font.SysFont("Times New Roman", 40)
+        init_display()
+    except SudokuError as error:
+        print(error)
+        exit(1)
     except pygame.error as error:
         print(f"Ошибка графики: {error}")
         exit(1)
 
-    clock = pygame.time.Clock()
-    main()
\ No newline at end of file
+    run_instrumented(arguments, main, not arguments.poll)
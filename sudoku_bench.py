@@ -0,0 +1,828 @@
+"""
+Бенчмарки производительности игры Судоку
+
+Запуск: python sudoku_bench.py <имя бенчмарка> [параметры]
+Список бенчмарков: python sudoku_bench.py --help
+"""
+import argparse
+import asyncio
+import copy
+import random
+import time
+from array import array
+
+import sudoku
+import sudoku_server
+
+
+def _legacy_is_valid_move(game_board, row, col, num):
+    """Исходная проверка хода линейным просмотром строки, столбца и блока (эталон для сравнения)"""
+    if num in game_board[row]:
+        return False
+    for i in range(9):
+        if game_board[i][col] == num:
+            return False
+    start_row = (row // 3) * 3
+    start_col = (col // 3) * 3
+    for i in range(3):
+        for j in range(3):
+            if game_board[start_row + i][start_col + j] == num:
+                return False
+    return True
+
+
+def _legacy_solved_board(game_board):
+    """Исходный рекурсивный решатель, который на каждом уровне сканирует поле с (0, 0)"""
+    for i in range(9):
+        for j in range(9):
+            if game_board[i][j] == 0:
+                random_numbers = list(range(1, 10))
+                random.shuffle(random_numbers)
+                for key in random_numbers:
+                    if _legacy_is_valid_move(game_board, i, j, key):
+                        game_board[i][j] = key
+                        if _legacy_solved_board(game_board):
+                            return game_board
+                        game_board[i][j] = 0
+                return False
+    return game_board
+
+
+def _legacy_generate_board(difficulty):
+    """Исходный генератор: решение с нуля и удаление difficulty * 20 клеток случайным подбором"""
+    puzzle = [[0] * 9 for _ in range(9)]
+    _legacy_solved_board(puzzle)
+    solution = copy.deepcopy(puzzle)
+    copied_board = copy.deepcopy(puzzle)
+    deleted = 0
+    while deleted != difficulty * 20:
+        row = random.randint(0, 8)
+        col = random.randint(0, 8)
+        if copied_board[row][col] != 0:
+            copied_board[row][col] = 0
+            deleted += 1
+    return copied_board, solution
+
+
+def make_corpus(count, difficulty, seed):
+    """
+    Строит фиксированный набор головоломок для сравнения решателей
+
+    :param count: Количество головоломок
+    :param difficulty: Сложность (1, 2 или 3)
+    :param seed: Зерно генератора случайных чисел
+    :return: Список полей 9x9
+    """
+    random.seed(seed)
+    return [_legacy_generate_board(difficulty)[0] for _ in range(count)]
+
+
+HARD_PUZZLES = (
+    "..............3.85..1.2.......5.7.....4...1...9.......5......73..2.1........4...9",
+    "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+    "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+)
+"""tuple: Известные трудные для перебора головоломки (точка - пустая клетка)"""
+
+
+def parse_puzzle(text):
+    """Переводит строку из 81 символа в поле 9x9 (точка или 0 - пустая клетка)"""
+    values = [0 if char in ".0" else int(char) for char in text]
+    return [values[row * 9:row * 9 + 9] for row in range(9)]
+
+
+def measure(func, items):
+    """
+    Прогоняет функцию по всем элементам и замеряет время
+
+    :return: (секунды, операций в секунду)
+    """
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(items) / elapsed if elapsed else float("inf")
+
+
+def report(title, elapsed, rate, unit):
+    """Печатает одну строку результата"""
+    print(f"{title:<36} {elapsed:8.3f} s {rate:12.1f} {unit}/s")
+
+
+def bench_bitmask(args):
+    """Сравнение исходного решателя и генератора с версией на битовых масках (BoardState)"""
+    corpus = make_corpus(args.count, args.difficulty, args.seed)
+
+    random.seed(args.seed)
+    elapsed, rate = measure(lambda board: _legacy_solved_board(copy.deepcopy(board)), corpus)
+    report("solve: linear scan (before)", elapsed, rate, "boards")
+
+    random.seed(args.seed)
+    elapsed, rate = measure(lambda board: sudoku.solved_board(copy.deepcopy(board)), corpus)
+    report("solve: BoardState bitmask (after)", elapsed, rate, "boards")
+
+    random.seed(args.seed)
+    elapsed, rate = measure(_legacy_generate_board, [args.difficulty] * args.count)
+    report("generate: linear scan (before)", elapsed, rate, "boards")
+
+    random.seed(args.seed)
+    elapsed, rate = measure(sudoku.generate_board, [args.difficulty] * args.count)
+    report("generate: BoardState bitmask (after)", elapsed, rate, "boards")
+
+
+def bench_engines(args):
+    """Сравнение движков решателя по времени, узлам и откатам на одном наборе головоломок"""
+    corpora = {
+        "seeded corpus": make_corpus(args.count, args.difficulty, args.seed),
+        "hard puzzles": [parse_puzzle(text) for text in HARD_PUZZLES],
+    }
+    for corpus_name, corpus in corpora.items():
+        print(f"{corpus_name} ({len(corpus)} boards)")
+        for engine in sudoku.SOLVER_ENGINES:
+            if engine == "backtrack" and corpus_name == "hard puzzles" and not args.hard_backtrack:
+                print(f"  {engine:<12} skipped (use --hard-backtrack, may take minutes)")
+                continue
+            stats = sudoku.SolveStats()
+            start = time.perf_counter()
+            for board in corpus:
+                sudoku.solve(copy.deepcopy(board), engine, stats)
+            elapsed = time.perf_counter() - start
+            print(f"  {engine:<12} {elapsed:8.3f} s  nodes={stats.nodes:<10} backtracks={stats.backtracks}")
+
+
+def bench_dlx(args):
+    """Сравнение Dancing Links с исходным рекурсивным решателем на фиксированном наборе"""
+    corpus = make_corpus(args.count, args.difficulty, args.seed)
+
+    random.seed(args.seed)
+    elapsed, rate = measure(lambda board: _legacy_solved_board(copy.deepcopy(board)), corpus)
+    report("legacy recursive solver", elapsed, rate, "boards")
+
+    for engine in ("backtrack", "dlx"):
+        random.seed(args.seed)
+        elapsed, rate = measure(lambda board: sudoku.solve(copy.deepcopy(board), engine), corpus)
+        report(f"solve engine={engine}", elapsed, rate, "boards")
+
+    elapsed, rate = measure(sudoku.count_solutions, corpus)
+    report("dlx count_solutions(limit=2)", elapsed, rate, "boards")
+
+    hard = [parse_puzzle(text) for text in HARD_PUZZLES]
+    for engine in ("mrv", "dlx"):
+        elapsed, rate = measure(lambda board: sudoku.solve(copy.deepcopy(board), engine), hard)
+        report(f"hard puzzles engine={engine}", elapsed, rate, "boards")
+
+
+def bench_unique(args):
+    """Стоимость генерации по сложностям: случайное удаление против удаления с проверкой единственности"""
+    for difficulty in (1, 2, 3):
+        for unique in (False, True):
+            random.seed(args.seed)
+            sudoku.generation_timings.clear()
+            empty_cells = 0
+            start = time.perf_counter()
+            for _ in range(args.count):
+                grid = sudoku.generate_board(difficulty, unique=unique)[0]
+                empty_cells += sum(row.count(0) for row in grid)
+            elapsed = time.perf_counter() - start
+            mode = "unique" if unique else "random"
+            stages = sudoku.get_generation_timings()[difficulty]
+            stage_text = "  ".join(f"{stage}={info['mean_ms']:.2f}ms" for stage, info in stages.items())
+            print(f"difficulty={difficulty} {mode:<7} {args.count / elapsed:9.1f} boards/s  "
+                  f"clues={81 - empty_cells / args.count:5.1f}  {stage_text}")
+
+
+def bench_pack(args):
+    """Время открытия набора и случайного доступа к уровню в зависимости от размера файла"""
+    import os
+    import tempfile
+
+    random.seed(args.seed)
+    samples = [sudoku.generate_board(args.difficulty, unique=True) for _ in range(16)]
+    for size in (args.count, args.count * 100, args.count * 10000):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.sdkp")
+            with sudoku.PuzzlePackWriter(path) as writer:
+                for number in range(size):
+                    game_data = samples[number % len(samples)]
+                    writer.add(game_data[0], game_data[1], args.difficulty)
+
+            start = time.perf_counter()
+            pack = sudoku.PuzzlePack(path)
+            opened = time.perf_counter() - start
+            numbers = [random.randrange(size) for _ in range(10000)]
+            elapsed, rate = measure(pack.__getitem__, numbers)
+            pack.close()
+            print(f"{size:>10} puzzles  {os.path.getsize(path) / 2 ** 20:8.1f} MiB  open={opened * 1e6:7.1f} us  "
+                  f"load #N={elapsed / len(numbers) * 1e6:6.2f} us")
+
+
+def bench_board(args):
+    """Память и скорость копирования/сравнения: Board (bytearray) против списка списков"""
+    import sys
+
+    random.seed(args.seed)
+    boards = [sudoku.generate_board(args.difficulty)[1] for _ in range(args.count)]
+    nested = [board.to_lists() for board in boards]
+
+    nested_size = sys.getsizeof(nested[0]) + sum(sys.getsizeof(row) for row in nested[0])
+    board_size = sys.getsizeof(boards[0]) + sys.getsizeof(boards[0].cells)
+    print(f"memory per board: nested lists={nested_size} B  Board={board_size} B")
+
+    repeat = 50
+    elapsed, rate = measure(copy.deepcopy, nested * repeat)
+    report("copy: copy.deepcopy(list)", elapsed, rate, "copies")
+    elapsed, rate = measure(sudoku.Board.copy, boards * repeat)
+    report("copy: Board.copy()", elapsed, rate, "copies")
+
+    nested_pairs = [(board, copy.deepcopy(board)) for board in nested]
+    board_pairs = [(board, board.copy()) for board in boards]
+    elapsed, rate = measure(lambda pair: pair[0] == pair[1], nested_pairs * repeat)
+    report("equal: list == list", elapsed, rate, "compares")
+    elapsed, rate = measure(lambda pair: pair[0] == pair[1], board_pairs * repeat)
+    report("equal: Board == Board", elapsed, rate, "compares")
+
+
+def init_headless_display():
+    """Открывает окно на фиктивном видеодрайвере SDL (как в sudoku_test.py) и готовит шрифты"""
+    import os
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    sudoku.init_display()
+    return sudoku.pygame, sudoku.screen
+
+
+def bench_render(args):
+    """Процессорное время кадра: полная перерисовка с flip против BoardRenderer с update(rects)"""
+    pygame, screen = init_headless_display()
+    random.seed(args.seed)
+    grid, solution, hints, mistakes = sudoku.generate_board(args.difficulty)
+    original = grid.copy()
+    empty = [index for index in range(81) if grid.cells[index] == 0]
+    frames = args.count * 10
+
+    def full_frame(frame):
+        sudoku.draw_board(screen)
+        sudoku.draw_selected_cell(screen, 4, 4)
+        sudoku.draw_numbers(screen, grid, original, solution)
+        sudoku.draw_game_info(screen, hints, frame * 16, mistakes)
+        pygame.display.flip()
+
+    renderer = sudoku.BoardRenderer()
+
+    def dirty_frame(frame):
+        rects = renderer.render(screen, grid, original, solution, (4, 4), None, hints, frame * 16, mistakes)
+        if rects:
+            pygame.display.update(rects)
+
+    for title, draw in (("full redraw + flip (before)", full_frame), ("dirty rects + update (after)", dirty_frame)):
+        for scenario in ("idle", "typing"):
+            start = time.process_time()
+            for frame in range(frames):
+                if scenario == "typing" and frame % 10 == 0:
+                    index = empty[(frame // 10) % len(empty)]
+                    grid.cells[index] = solution.cells[index] if grid.cells[index] == 0 else 0
+                draw(frame)
+            per_frame = (time.process_time() - start) / frames
+            print(f"{title:<30} {scenario:<7} {per_frame * 1e3:8.3f} ms CPU/frame")
+    print(f"glyph cache: {sudoku.glyph_cache.stats()}")
+    pygame.quit()
+
+
+def _click(pygame, x, y):
+    """Создаёт событие нажатия левой кнопки мыши в точке (x, y)"""
+    return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=1)
+
+
+def _key(pygame, key):
+    """Создаёт событие нажатия клавиши"""
+    return pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode="", scancode=0)
+
+
+def _idle_script(pygame, state):
+    """События, которые переводят игру из меню в заданное состояние"""
+    easy = _click(pygame, 10, sudoku.HEIGHT // 2)
+    if state == "start":
+        return []
+    if state == "playing":
+        return [easy]
+    if state == "win":
+        return [easy, _click(pygame, 10, 10), _key(pygame, pygame.K_RETURN)]
+    script = [easy]
+    for index in range(81):
+        script.append(_click(pygame, sudoku.COL_OF[index] * sudoku.CELL_SIZE + 5, sudoku.ROW_OF[index] * sudoku.CELL_SIZE + 5))
+        script.extend(_key(pygame, getattr(pygame, f"K_{digit}")) for digit in range(1, 10))
+    return script
+
+
+def _run_idle(state, event_driven, seconds, mouse=False):
+    """
+    Запускает sudoku.main() в заданном состоянии на seconds секунд и возвращает (CPU, wall) в секундах
+
+    :param mouse: Имитировать движение мыши - событие MOUSEMOTION каждые 5 мс
+    """
+    pygame, screen = init_headless_display()
+    sudoku.clock = pygame.time.Clock()
+    for event in _idle_script(pygame, state):
+        pygame.event.post(event)
+    if mouse:
+        pygame.time.set_timer(pygame.event.Event(pygame.MOUSEMOTION, pos=(100, 100), rel=(1, 0), buttons=(0, 0, 0)), 5)
+    pygame.time.set_timer(pygame.QUIT, int(seconds * 1000), 1)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    sudoku.main(event_driven=event_driven)
+    return time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+
+def bench_idle(args):
+    """
+    Загрузка процессора игровым циклом в каждом состоянии: опрос 60 FPS против ожидания событий
+
+    Цикл запускается дважды - на 1 секунду и на 1 + seconds секунд. Разница исключает
+    стоимость запуска (пул процессов, генерация уровня, переход в состояние). Каждое
+    состояние замеряется без ввода и с движущейся мышью
+    """
+    for state in ("start", "playing", "win", "lose"):
+        for mouse in (False, True):
+            for event_driven in (False, True):
+                short_cpu, short_wall = _run_idle(state, event_driven, 1.0, mouse)
+                long_cpu, long_wall = _run_idle(state, event_driven, 1.0 + args.seconds, mouse)
+                cpu = max(long_cpu - short_cpu, 0.0)
+                wall = long_wall - short_wall
+                mode = "event wait" if event_driven else "poll 60 FPS"
+                scenario = "mouse" if mouse else "still"
+                print(f"{state:<8} {scenario:<6} {mode:<12} idle CPU {cpu / wall * 100:6.2f} %  "
+                      f"({cpu * 1000:.0f} ms over {wall:.1f} s)")
+
+
+def random_game_script(session, rng, wrong_rate=0.15, hint_rate=0.05):
+    """
+    Строит сценарий партии для GameSession: обход пустых клеток со случайными ошибками и подсказками
+
+    :return: Список действий (действие, *аргументы)
+    """
+    empty = [index for index in range(81) if session.grid.cells[index] == 0]
+    rng.shuffle(empty)
+    script = []
+    for index in empty:
+        row, col = sudoku.ROW_OF[index], sudoku.COL_OF[index]
+        answer = session.solution_grid.cells[index]
+        script.append(("click", col * sudoku.CELL_SIZE + 5, row * sudoku.CELL_SIZE + 5))
+        roll = rng.random()
+        if roll < wrong_rate:
+            script.append(("digit", answer % 9 + 1))
+            script.append(("delete",))
+        if roll > 1 - hint_rate:
+            script.append(("hint",))
+        script.append(("digit", answer))
+    return script
+
+
+def percentile(values, fraction):
+    """Значение перцентиля fraction (0..1) в списке"""
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+def bench_sim(args):
+    """
+    Безоконный прогон тысяч партий через GameSession
+
+    Уровни берутся из заранее сгенерированного набора, часы партии - счётчик кадров,
+    поэтому замеряется только логика игры и (с отрисовкой) BoardRenderer
+    """
+    pygame, screen = init_headless_display()
+    random.seed(args.seed)
+    corpus = [sudoku.generate_board(args.difficulty, unique=True) for _ in range(16)]
+    frame_clock = [0]
+
+    def puzzle_source(difficulty):
+        return corpus[frame_clock[0] % len(corpus)]
+
+    def clock():
+        frame_clock[0] += 16
+        return frame_clock[0]
+
+    for render in (False, True):
+        rng = random.Random(args.seed)
+        renderer = sudoku.BoardRenderer()
+        latencies = []
+        results = {"win": 0, "lose": 0, "playing": 0}
+        start = time.perf_counter()
+        for _ in range(args.count):
+            session = sudoku.GameSession(puzzle_source, clock)
+            session.click(10, sudoku.HEIGHT // 2)
+            renderer.invalidate()
+            for step in random_game_script(session, rng):
+                frame_start = time.perf_counter()
+                session.handle(*step)
+                session.tick()
+                if render and session.state == "playing":
+                    renderer.render(screen, session.grid, session.original_grid, session.solution_grid,
+                                    (session.selected_row, session.selected_col), session.mistake_number,
+                                    session.hints_count, session.game_time, session.mistakes_left)
+                latencies.append(time.perf_counter() - frame_start)
+                if session.state != "playing":
+                    break
+            results[session.state] += 1
+        elapsed = time.perf_counter() - start
+        title = "logic + BoardRenderer" if render else "logic only"
+        print(f"{title:<22} {args.count / elapsed:9.1f} games/s {len(latencies) / elapsed:11.1f} moves/s  "
+              f"frame p50={percentile(latencies, 0.5) * 1e6:7.1f} us p99={percentile(latencies, 0.99) * 1e6:7.1f} us  {results}")
+    pygame.quit()
+
+
+def bench_grade(args):
+    """Скорость оценки сложности и распределение оценок по уровням генератора"""
+    import os
+
+    for difficulty in (1, 2, 3):
+        random.seed(args.seed)
+        corpus = [sudoku.generate_board(difficulty, unique=True)[0] for _ in range(args.count)]
+        start = time.perf_counter()
+        results = [sudoku.grade_puzzle(board) for board in corpus]
+        elapsed = time.perf_counter() - start
+        scores = [result.score for result in results]
+        hardest = {}
+        for result in results:
+            hardest[result.hardest] = hardest.get(result.hardest, 0) + 1
+        print(f"difficulty={difficulty} {args.count / elapsed:9.1f} puzzles/s  "
+              f"score p50={percentile(scores, 0.5):5} p90={percentile(scores, 0.9):5} max={max(scores):5}  "
+              f"hardest={hardest}")
+
+    start = time.perf_counter()
+    sudoku.grade_many(corpus, chunk_size=64)
+    elapsed = time.perf_counter() - start
+    print(f"grade_many difficulty=3 {args.count / elapsed:9.1f} puzzles/s ({os.cpu_count()} cpu)")
+
+
+def bench_hint(args):
+    """Задержка подсказки следующего шага: HintEngine с инкрементальными кандидатами против полного пересчёта"""
+    random.seed(args.seed)
+    corpus = [sudoku.generate_board(args.difficulty, unique=True) for _ in range(args.count)]
+    for incremental in (True, False):
+        latencies = []
+        for game_data in corpus:
+            session = sudoku.GameSession(lambda difficulty: game_data, clock=lambda: 0)
+            session.start(args.difficulty)
+            session.hints_count = 81
+            while session.state == "playing":
+                session.selected_row = session.selected_col = None
+                start = time.perf_counter()
+                if not incremental:
+                    session.hint_engine.reset(session.grid)
+                session.hint()
+                latencies.append(time.perf_counter() - start)
+        title = "incremental HintEngine" if incremental else "rebuild candidates"
+        print(f"{title:<24} {len(latencies):7} hints  p50={percentile(latencies, 0.5) * 1e6:7.1f} us  "
+              f"p99={percentile(latencies, 0.99) * 1e6:7.1f} us  max={max(latencies) * 1e6:8.1f} us")
+
+
+def bench_sizes(args):
+    """Генерация, решение и отрисовка полей NxN по размерам (4, 9, 16, 25)"""
+    pygame, screen = init_headless_display()
+    for size in sudoku.GRID_SIZES:
+        unique = size < 25 or args.difficulty < 3
+        rng = random.Random(args.seed)
+        count = max(1, args.count // size)
+        boards = []
+        start = time.perf_counter()
+        for _ in range(count):
+            boards.append(sudoku.generate_grid(size, args.difficulty, unique, rng))
+        generate_elapsed = time.perf_counter() - start
+
+        stats = sudoku.SolveStats()
+        start = time.perf_counter()
+        for puzzle, solution in boards:
+            solved = sudoku.solve_grid(puzzle.copy(), stats)
+            assert solved == solution or not unique
+        solve_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for puzzle, solution in boards:
+            sudoku.draw_grid_board(screen, solution, puzzle)
+        draw_elapsed = time.perf_counter() - start
+
+        empty = sum(puzzle.cells.count(0) for puzzle, _ in boards) / count
+        print(f"{size:>2}x{size:<2} unique={unique!s:<5} generate={generate_elapsed / count * 1e3:9.1f} ms  "
+              f"solve={solve_elapsed / count * 1e3:8.2f} ms (nodes={stats.nodes // count})  "
+              f"draw={draw_elapsed / count * 1e3:6.2f} ms  empty={empty:.0f}/{size * size}")
+    pygame.quit()
+
+
+def bench_seeded(args):
+    """Удаление клеток: подбор randint с отказами против перестановки; генерация по идентификатору"""
+    solution = sudoku.Board()
+    sudoku.solved_board(solution, rng=random.Random(args.seed))
+
+    def rejection(difficulty):
+        board = solution.copy()
+        deleted = 0
+        while deleted != difficulty * 20:
+            index = random.randint(0, 8) * 9 + random.randint(0, 8)
+            if board.cells[index]:
+                board.cells[index] = 0
+                deleted += 1
+
+    def permutation(difficulty):
+        board = solution.copy()
+        for index in rng.sample(range(81), difficulty * 20):
+            board.cells[index] = 0
+
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    repeats = [None] * (args.count * 50)
+    for difficulty in (1, 2, 3):
+        for title, dig in (("randint rejection", rejection), ("shuffled permutation", permutation)):
+            elapsed, rate = measure(lambda _: dig(difficulty), repeats)
+            report(f"difficulty={difficulty} {title}", elapsed, rate, "digs")
+
+    for unique in (False, True):
+        ids = [sudoku.make_puzzle_id(args.difficulty, seed, unique) for seed in range(args.count)]
+        elapsed, rate = measure(sudoku.generate_by_id, ids)
+        report(f"generate_by_id unique={unique}", elapsed, rate, "boards")
+
+
+def bench_transform(args):
+    """Источники решений: перебор с пустого поля против преобразований базовых решений (по одному и пачкой numpy)"""
+    rng = random.Random(args.seed)
+    items = [None] * args.count
+    for engine in ("backtrack", "dlx"):
+        elapsed, rate = measure(lambda _: sudoku.solved_board(sudoku.Board(), engine, rng), items)
+        report(f"search engine={engine}", elapsed, rate, "solutions")
+
+    bases = sudoku.base_solutions()
+    elapsed, rate = measure(lambda _: sudoku.apply_transform(rng.choice(bases), sudoku.random_transform(rng)), items)
+    report("apply_transform (python)", elapsed, rate, "solutions")
+
+    batch = args.count * 1000
+    start = time.perf_counter()
+    solutions = sudoku.solution_batch(batch, args.seed)
+    elapsed = time.perf_counter() - start
+    report(f"solution_batch numpy x{batch}", elapsed, batch / elapsed, "solutions")
+
+    for source in ("search", "transform"):
+        elapsed, rate = measure(lambda seed: sudoku.generate_board(args.difficulty, seed=seed, solution_source=source),
+                                range(args.count))
+        report(f"generate_board source={source}", elapsed, rate, "boards")
+
+    sample = [bytes(row) for row in solutions[:min(args.count, 50)]]
+    elapsed, rate = measure(sudoku.canonical_form, sample)
+    classes = len({sudoku.canonical_form(cells) for cells in sample})
+    report(f"canonical_form ({classes} classes)", elapsed, rate, "grids")
+
+
+def bench_dedupe(args):
+    """Скорость канонизации головоломок и проверки принадлежности в PuzzleIndex по мере роста индекса"""
+    import os
+    import tempfile
+
+    rng = random.Random(args.seed)
+    games = [sudoku.generate_board(args.difficulty, unique=True, seed=seed)[:2] for seed in range(args.count)]
+    elapsed, rate = measure(lambda game: sudoku.canonical_puzzle(*game), games)
+    report("canonical_puzzle (known solution)", elapsed, rate, "puzzles")
+    elapsed, rate = measure(lambda game: sudoku.canonical_puzzle(game[0]), games[:max(1, args.count // 4)])
+    report("canonical_puzzle (solve first)", elapsed, rate, "puzzles")
+
+    with tempfile.TemporaryDirectory() as directory:
+        with sudoku.PuzzleIndex(os.path.join(directory, "index.sqlite")) as index:
+            inserted = 0
+            for size in (10 ** 4, 10 ** 5, 10 ** 6):
+                batch = [rng.getrandbits(128).to_bytes(16, "little") for _ in range(size - inserted)]
+                start = time.perf_counter()
+                for fingerprint in batch:
+                    index.add(fingerprint)
+                index.commit()
+                insert_elapsed = time.perf_counter() - start
+                inserted = size
+
+                probes = batch[:5000] + [rng.getrandbits(128).to_bytes(16, "little") for _ in range(5000)]
+                elapsed, rate = measure(index.__contains__, probes)
+                print(f"index size={size:>8}  insert {len(batch) / insert_elapsed:10.1f} /s  "
+                      f"lookup {rate:10.1f} /s  file={os.path.getsize(index.path) / 2 ** 20:6.1f} MiB")
+
+
+def bench_cache(args):
+    """Повторная проверка присланных полей: solve без кэша против SolveCache при разной ёмкости"""
+    rng = random.Random(args.seed)
+    puzzles = [sudoku.generate_board(args.difficulty, unique=True, seed=seed)[0] for seed in range(args.count)]
+    requests = [puzzles[min(int(rng.paretovariate(1.2)) - 1, len(puzzles) - 1)] for _ in range(args.count * 20)]
+    for capacity in (0, args.count // 10, args.count):
+        cache = sudoku.SolveCache(capacity)
+        elapsed, rate = measure(lambda board: sudoku.solve(board.copy(), "dlx", cache=cache), requests)
+        report(f"capacity={capacity} hit_rate={cache.stats()['hit_rate']:.2f}", elapsed, rate, "solves")
+
+
+def bench_instrument(args):
+    """Накладные расходы instrumentation: функция без обёртки, обёртка с выключенным и включённым сбором"""
+    pygame, screen = init_headless_display()
+    random.seed(args.seed)
+    grid, solution, _, _ = sudoku.generate_board(args.difficulty)
+    repeats = [None] * (args.count * 10)
+    variants = (("unwrapped", sudoku.draw_numbers.__wrapped__, False),
+                ("wrapped, disabled", sudoku.draw_numbers, False),
+                ("wrapped, enabled", sudoku.draw_numbers, True))
+    for title, draw, enabled in variants:
+        sudoku.instrumentation.enabled = enabled
+        elapsed, rate = measure(lambda _: draw(screen, grid, grid, solution), repeats)
+        report(f"draw_numbers {title}", elapsed, rate, "calls")
+
+    corpus = make_corpus(args.count, args.difficulty, args.seed)
+    for enabled in (False, True):
+        sudoku.instrumentation.enabled = enabled
+        elapsed, rate = measure(lambda board: sudoku.solve(copy.deepcopy(board), "mrv"), corpus)
+        report(f"solve mrv instrumentation={enabled}", elapsed, rate, "boards")
+    sudoku.instrumentation.enabled = False
+    pygame.quit()
+
+
+def bench_server(args):
+    """Сервер головоломок: нагрузка --concurrency клиентов по --count запросов, p50/p99 и запросы в секунду"""
+    async def run():
+        server = sudoku_server.PuzzleServer(port=0)
+        await server.start()
+        try:
+            return await sudoku_server.run_load(server.host, server.port, args.concurrency, args.count,
+                                                args.difficulty, args.seed)
+        finally:
+            await server.close()
+
+    sudoku_server.print_load_report(asyncio.run(run()))
+
+
+def bench_validate(args):
+    """Пакетная проверка: validate_batch на --count * 1000 решённых и испорченных полях против find_conflicts"""
+    total = args.count * 1000
+    boards = sudoku.solution_batch(total, args.seed)
+    boards[::2, 0] = boards[::2, 1]
+    started = time.perf_counter()
+    result = sudoku.validate_batch(boards)
+    elapsed = time.perf_counter() - started
+    assert int(result.solved.sum()) == total // 2
+    report("validate_batch", elapsed, total / elapsed, "boards")
+
+    sample = [sudoku.Board(bytes(board)) for board in boards[:args.count * 10]]
+    elapsed, rate = measure(sudoku.find_conflicts, sample)
+    report("find_conflicts (one board at a time)", elapsed, rate, "boards")
+
+
+def bench_journal(args):
+    """Журнал ходов: запись, отмена и повтор, перемотка к случайной позиции и память на ход"""
+    rng = random.Random(args.seed)
+    total = args.count * 1000
+    moves = [(rng.randrange(81), rng.randrange(10)) for _ in range(total)]
+    journal = sudoku.MoveJournal(bytes(81))
+    cells = bytearray(81)
+
+    def record(move):
+        cell, digit = move
+        journal.record(cell, cells[cell], digit, "digit", 0)
+        cells[cell] = digit
+
+    elapsed, rate = measure(record, moves)
+    report("record", elapsed, rate, "moves")
+    elapsed, rate = measure(lambda _: journal.undo(0), moves[:total // 2])
+    report("undo", elapsed, rate, "moves")
+    elapsed, rate = measure(lambda _: journal.redo(0), moves[:total // 2])
+    report("redo", elapsed, rate, "moves")
+    positions = [rng.randrange(len(journal) + 1) for _ in range(args.count * 10)]
+    elapsed, rate = measure(journal.board_at, positions)
+    report("board_at (checkpoints)", elapsed, rate, "seeks")
+    print(f"{'memory per record':<40}{journal.nbytes / len(journal):8.2f} bytes")
+
+
+def bench_notes(args):
+    """Кадр с заметками во всех пустых клетках: мини-глифы из NoteGlyphCache против растеризации каждой цифры"""
+    pygame, screen = init_headless_display()
+    random.seed(args.seed)
+    grid, solution, _, _ = sudoku.generate_board(3)
+    original = grid.copy()
+    rng = random.Random(args.seed)
+    notes = array("H", (0 if value else rng.randrange(2, 1 << 10) & sudoku.FULL_MASK for value in grid.cells))
+    frames = args.count * 5
+
+    def rasterized_frame(frame):
+        sudoku.draw_board(screen)
+        sudoku.draw_numbers(screen, grid, original, solution)
+        step = sudoku.CELL_SIZE // 3
+        for index, mask in enumerate(notes):
+            for digit in sudoku.MASK_DIGITS[mask]:
+                glyph = sudoku.small_font.render(str(digit), True, sudoku.BLACK)
+                screen.blit(glyph, (sudoku.COL_OF[index] * sudoku.CELL_SIZE + (digit - 1) % 3 * step,
+                                    sudoku.ROW_OF[index] * sudoku.CELL_SIZE + (digit - 1) // 3 * step))
+
+    def cached_frame(frame):
+        sudoku.draw_board(screen)
+        sudoku.draw_numbers(screen, grid, original, solution, notes=notes)
+
+    renderer = sudoku.BoardRenderer()
+
+    def renderer_frame(frame):
+        renderer.invalidate()
+        renderer.render(screen, grid, original, solution, (4, 4), None, 3, frame * 16, 3, notes=notes)
+
+    for title, draw in (("render every note digit", rasterized_frame), ("note glyph cache", cached_frame),
+                        ("BoardRenderer full redraw", renderer_frame)):
+        start = time.process_time()
+        for frame in range(frames):
+            draw(frame)
+        per_frame = (time.process_time() - start) / frames
+        print(f"{title:<30} {per_frame * 1e3:8.3f} ms CPU/frame (budget 16.7 ms)")
+    print(f"note glyph cache: hits={sudoku.note_glyphs.hits} misses={sudoku.note_glyphs.misses}")
+    pygame.quit()
+
+
+STARTUP_SCRIPTS = {
+    "import sudoku": "import sudoku",
+    "import sudoku + pygame (before)": "import pygame, sudoku",
+    "first frame, pygame.init + SysFont (before)": (
+        "import sudoku, pygame\n"
+        "pygame.init()\n"
+        "sudoku.screen = pygame.display.set_mode((sudoku.WIDTH, sudoku.HEIGHT))\n"
+        "sudoku.font = pygame.font.SysFont('Times New Roman', 40)\n"
+        "sudoku.small_font = pygame.font.SysFont('Times New Roman', 18)\n"
+        "sudoku.glyph_cache.prewarm()\n"
+        "sudoku.draw_intro(sudoku.screen)\n"
+        "pygame.display.flip()"),
+    "first frame, PuzzlePool before flip (before)": (
+        "import sudoku, sys\n"
+        "pool = sudoku.PuzzlePool()\n"
+        "sudoku.init_display(sys.argv[1])\n"
+        "sudoku.draw_intro(sudoku.screen)\n"
+        "sudoku.pygame.display.flip()"),
+    "first frame, init_display (after)": (
+        "import sudoku, sys\n"
+        "sudoku.init_display(sys.argv[1])\n"
+        "sudoku.draw_intro(sudoku.screen)\n"
+        "sudoku.pygame.display.flip()"),
+}
+"""dict: Сценарии бенчмарка startup: название -> код, время которого замеряется в новом процессе"""
+
+
+def bench_startup(args):
+    """Время запуска в новом процессе: импорт sudoku и время до первого кадра, с холодным и тёплым кэшем шрифтов"""
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    runs = max(3, args.count // 40)
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    directory = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as cache_directory:
+        for title, body in STARTUP_SCRIPTS.items():
+            for cache in ("cold", "warm") if "init_display" in body else ("",):
+                cache_path = os.path.join(cache_directory, "fonts.json")
+                timings = []
+                for _ in range(runs):
+                    if cache == "cold" and os.path.exists(cache_path):
+                        os.remove(cache_path)
+                    code = ("import time\nstarted = time.perf_counter()\n" + body
+                            + "\nprint(time.perf_counter() - started)")
+                    output = subprocess.run([sys.executable, "-c", code, cache_path], cwd=directory, env=environment,
+                                            capture_output=True, text=True, check=True).stdout
+                    timings.append(float(output.split()[-1]))
+                label = f"{title} [{cache} font cache]" if cache else title
+                print(f"{label:<56} median {percentile(timings, 0.5) * 1e3:8.1f} ms  min {min(timings) * 1e3:8.1f} ms")
+
+
+BENCHMARKS = {
+    "bitmask": bench_bitmask,
+    "engines": bench_engines,
+    "dlx": bench_dlx,
+    "unique": bench_unique,
+    "pack": bench_pack,
+    "board": bench_board,
+    "render": bench_render,
+    "idle": bench_idle,
+    "sim": bench_sim,
+    "grade": bench_grade,
+    "hint": bench_hint,
+    "sizes": bench_sizes,
+    "seeded": bench_seeded,
+    "transform": bench_transform,
+    "dedupe": bench_dedupe,
+    "cache": bench_cache,
+    "instrument": bench_instrument,
+    "server": bench_server,
+    "validate": bench_validate,
+    "journal": bench_journal,
+    "notes": bench_notes,
+    "startup": bench_startup,
+}
+"""dict: Имя бенчмарка -> функция, принимающая разобранные аргументы командной строки"""
+
+
+def main():
+    """Разбирает аргументы командной строки и запускает выбранный бенчмарк"""
+    parser = argparse.ArgumentParser(description="Бенчмарки Судоку")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="Имя бенчмарка")
+    parser.add_argument("--count", type=int, default=200, help="Размер набора головоломок")
+    parser.add_argument("--difficulty", type=int, default=2, choices=(1, 2, 3), help="Сложность головоломок")
+    parser.add_argument("--seed", type=int, default=2024, help="Зерно для воспроизводимого набора")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Длительность замера для бенчмарка idle")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных клиентов для бенчмарка server")
+    parser.add_argument("--hard-backtrack", action="store_true", help="Запускать перебор 'backtrack' на трудных головоломках")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Сервер головоломок Судоку на asyncio: TCP, один JSON-объект на строку
+
+Запуск сервера: python sudoku_server.py serve [--host --port --workers]
+Нагрузочный тест: python sudoku_server.py load [--host --port --concurrency --requests --difficulty]
+
+Каждое соединение хранит свою партию GameSession. Запросы:
+    {"type": "new", "difficulty": 2} или {"type": "new", "puzzle_id": "2bu-..."}
+    {"type": "move", "row": 0, "col": 4, "digit": 7} (digit 0 - очистить клетку)
+    {"type": "hint"}
+    {"type": "validate"} или {"type": "validate", "board": "<81 цифра>"}
+Поле "id" запроса, если есть, возвращается в ответе. Ответ содержит "ok": true
+или "ok": false и "error" с описанием ошибки
+"""
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sudoku
+
+MAX_LINE = 64 * 1024
+"""int: Максимальная длина строки запроса в байтах"""
+
+
+class RequestError(sudoku.SudokuError):
+    """Неверный запрос клиента. Текст ошибки возвращается клиенту"""
+    pass
+
+
+def _validate_board(cells):
+    """Задача для исполнителя: конфликты, заполненность и решаемость поля (bytes из 81 клетки)"""
+    board = sudoku.Board(cells)
+    conflicts = sudoku.find_conflicts(board)
+    solvable = not conflicts and sudoku.solve(board.copy(), "dlx", cache=sudoku.solve_cache) is not False
+    return {"conflicts": [[sudoku.ROW_OF[index], sudoku.COL_OF[index]] for index in conflicts],
+            "complete": 0 not in board.cells, "solvable": solvable}
+
+
+class PuzzleServer:
+    """
+    TCP-сервер головоломок с партией на каждое соединение
+
+    Генерация и проверка решаемости выполняются в executor (по умолчанию - пул
+    процессов), поэтому цикл событий не блокируется на вычислениях
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, executor=None, workers=None):
+        """
+        :param host: Адрес для прослушивания
+        :param port: Порт (0 - любой свободный)
+        :param executor: concurrent.futures.Executor для тяжёлых задач. None - ProcessPoolExecutor
+        :param workers: Количество процессов пула по умолчанию
+        """
+        self.host = host
+        """str: Адрес для прослушивания"""
+
+        self.port = port
+        """int: Порт. После start - фактический порт"""
+
+        self.executor = executor or ProcessPoolExecutor(max_workers=workers,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+        """concurrent.futures.Executor: Исполнитель генерации и проверки"""
+
+        self.requests = 0
+        """int: Количество обработанных запросов"""
+
+        self.connections = 0
+        """int: Количество открытых соединений"""
+
+        self._owns_executor = executor is None
+        self._server = None
+
+    async def start(self):
+        """Начинает принимать соединения"""
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port, limit=MAX_LINE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def serve_forever(self):
+        """Запускает сервер и обслуживает соединения до отмены"""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Останавливает приём соединений и освобождает пул процессов"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, func, *args):
+        """Выполняет func(*args) в executor"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def handle_connection(self, reader, writer):
+        """Обслуживает одно соединение: читает строки запросов и пишет строки ответов"""
+        self.connections += 1
+        session = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    writer.write(b'{"ok": false, "error": "request line is too long"}\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                request = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise RequestError("request must be a JSON object")
+                    session, response = await self.dispatch(session, request)
+                    response["ok"] = True
+                except (RequestError, ValueError) as error:
+                    response = {"ok": False, "error": str(error)}
+                if isinstance(request, dict) and "id" in request:
+                    response["id"] = request["id"]
+                self.requests += 1
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def dispatch(self, session, request):
+        """
+        Выполняет один запрос
+
+        :param session: GameSession соединения или None, если партия ещё не начата
+        :param request: Разобранный JSON-объект
+        :return: (session, response) - возможно новая партия и словарь ответа
+        :raises RequestError: Если запрос неверен
+        """
+        kind = request.get("type")
+        if kind == "new":
+            return await self._new(request)
+        if kind == "validate":
+            if "board" in request:
+                board = sudoku.board_from_string(str(request["board"]))
+            elif session is not None:
+                board = session.grid
+            else:
+                raise RequestError("no board given and no game started")
+            return session, await self._run(_validate_board, bytes(board.cells))
+        if kind in ("move", "hint"):
+            if session is None or session.state != "playing":
+                raise RequestError("no game in progress, send 'new' first")
+            return session, (self._move(session, request) if kind == "move" else self._hint(session))
+        raise RequestError(f"unknown request type: {kind!r}")
+
+    async def _new(self, request):
+        """Запрос 'new': генерация уровня в executor и новая партия соединения"""
+        if "puzzle_id" in request:
+            game_data = await self._run(sudoku.generate_by_id, str(request["puzzle_id"]))
+        else:
+            difficulty = request.get("difficulty", 2)
+            if difficulty not in (1, 2, 3):
+                raise RequestError(f"difficulty must be 1, 2 or 3, got {difficulty!r}")
+            game_data = await self._run(sudoku.generate_board, difficulty, "backtrack", True)
+        session = sudoku.GameSession(lambda difficulty: game_data)
+        session.start(request.get("difficulty", 2))
+        return session, {"puzzle": sudoku.board_to_string(session.grid), "hints": session.hints_count,
+                         "mistakes": session.mistakes_left}
+
+    @staticmethod
+    def _move(session, request):
+        """Запрос 'move': ход в партии соединения"""
+        try:
+            row, col, digit = int(request["row"]), int(request["col"]), int(request["digit"])
+        except (KeyError, TypeError, ValueError):
+            raise RequestError("move needs integer 'row', 'col' and 'digit'")
+        if not (0 <= row < 9 and 0 <= col < 9 and 0 <= digit <= 9):
+            raise RequestError(f"move out of range: row={row}, col={col}, digit={digit}")
+        session.select(row, col)
+        changed = session.enter_digit(digit) if digit else session.delete()
+        return {"changed": changed, "correct": session.grid[row][col] == session.solution_grid[row][col],
+                "state": session.state, "mistakes_left": session.mistakes_left, "moves": session.moves}
+
+    @staticmethod
+    def _hint(session):
+        """Запрос 'hint': следующий логический шаг (HintEngine)"""
+        session.selected_row = session.selected_col = None
+        used = session.hint()
+        response = {"used": used, "message": session.hint_message, "hints_left": session.hints_count,
+                    "state": session.state}
+        if session.selected_row is not None:
+            response.update(row=session.selected_row, col=session.selected_col,
+                            digit=session.grid[session.selected_row][session.selected_col])
+        return response
+
+
+async def _load_client(host, port, requests, difficulty, latencies, errors, outcomes, rng, wrong_rate):
+    """
+    Один клиент нагрузочного теста: партии и поток запросов move/hint/validate
+
+    Клиент решает полученную головоломку сам и ходит настоящими цифрами в пустые
+    клетки: верной или, с вероятностью wrong_rate, неверной. Поэтому нагружаются
+    проверка хода, жизни, подсказки по живому полю и переходы в 'win'/'lose'
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+
+    async def call(request):
+        started = time.perf_counter()
+        writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.setdefault(request["type"], []).append(time.perf_counter() - started)
+        if not response["ok"]:
+            errors.append(response["error"])
+        return response
+
+    async def new_game():
+        board = sudoku.board_from_string((await call({"type": "new", "difficulty": difficulty}))["puzzle"])
+        return board.cells, sudoku.solve(board.copy(), "dlx").cells
+
+    cells, solution = await new_game()
+    for number in range(requests - 1):
+        kind = ("move", "move", "hint", "validate")[number % 4]
+        empty = [index for index in range(81) if not cells[index]]
+        if kind == "move" and empty:
+            index = rng.choice(empty)
+            digit = solution[index]
+            if rng.random() < wrong_rate:
+                digit = rng.choice([other for other in range(1, 10) if other != digit])
+            response = await call({"type": "move", "row": index // 9, "col": index % 9, "digit": digit})
+            cells[index] = digit
+        elif kind == "hint":
+            response = await call({"type": "hint"})
+            if "digit" in response:
+                cells[response["row"] * 9 + response["col"]] = response["digit"]
+        else:
+            response = await call({"type": "validate"})
+        if response.get("state") in ("win", "lose"):
+            outcomes[response["state"]] += 1
+            cells, solution = await new_game()
+    writer.close()
+
+
+def _percentile(values, fraction):
+    """Значение перцентиля fraction (0..1) в списке"""
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+async def run_load(host, port, concurrency=50, requests=200, difficulty=2, seed=0, wrong_rate=0.1):
+    """
+    Нагрузочный тест: concurrency клиентов, каждый отправляет requests запросов по очереди
+
+    :param seed: Зерно выбора клеток и ошибок. Клиент i использует random.Random(seed + i)
+    :param wrong_rate: Доля ходов неверной цифрой
+    :return: dict с requests_per_second, количеством ошибок, выигранных и проигранных партий
+        и p50/p99 задержек (мс) по типам запросов
+    """
+    latencies = {}
+    errors = []
+    outcomes = {"win": 0, "lose": 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(_load_client(host, port, requests, difficulty, latencies, errors, outcomes,
+                                        random.Random(seed + number), wrong_rate)
+                           for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    total = sum(len(values) for values in latencies.values())
+    everything = [value for values in latencies.values() for value in values]
+    report = {"requests": total, "seconds": elapsed, "requests_per_second": total / elapsed, "errors": len(errors),
+              "wins": outcomes["win"], "losses": outcomes["lose"],
+              "p50_ms": _percentile(everything, 0.5) * 1000, "p99_ms": _percentile(everything, 0.99) * 1000}
+    for kind, values in sorted(latencies.items()):
+        report[kind] = {"count": len(values), "p50_ms": _percentile(values, 0.5) * 1000,
+                        "p99_ms": _percentile(values, 0.99) * 1000}
+    return report
+
+
+def print_load_report(report):
+    """Печатает результат run_load"""
+    print(f"{report['requests']} requests in {report['seconds']:.2f} s: {report['requests_per_second']:.1f} req/s, "
+          f"p50={report['p50_ms']:.2f} ms p99={report['p99_ms']:.2f} ms, errors={report['errors']}, "
+          f"games won={report['wins']} lost={report['losses']}")
+    for kind in ("new", "move", "hint", "validate"):
+        if kind in report:
+            stats = report[kind]
+            print(f"  {kind:<9} n={stats['count']:<7} p50={stats['p50_ms']:8.2f} ms  p99={stats['p99_ms']:8.2f} ms")
+
+
+def main(argv=None):
+    """Разбирает аргументы командной строки и запускает сервер или нагрузочный тест"""
+    parser = argparse.ArgumentParser(description="Сервер головоломок Судоку (JSON-строки по TCP)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Запустить сервер")
+    load = commands.add_parser("load", help="Нагрузочный тест запущенного сервера")
+    for command in (serve, load):
+        command.add_argument("--host", default="127.0.0.1", help="Адрес сервера")
+        command.add_argument("--port", type=int, default=8765, help="Порт сервера")
+    serve.add_argument("--workers", type=int, default=None, help="Процессов генерации (по умолчанию - по числу ядер)")
+    load.add_argument("--concurrency", type=int, default=50, help="Количество одновременных клиентов")
+    load.add_argument("--requests", type=int, default=200, help="Запросов на клиента")
+    load.add_argument("--difficulty", type=int, choices=(1, 2, 3), default=2, help="Сложность уровней")
+    load.add_argument("--seed", type=int, default=0, help="Зерно выбора ходов")
+    load.add_argument("--wrong-rate", type=float, default=0.1, help="Доля ходов неверной цифрой")
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "serve":
+        server = PuzzleServer(arguments.host, arguments.port, workers=arguments.workers)
+        print(f"Сервер Судоку слушает {arguments.host}:{arguments.port}")
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            print("Сервер остановлен")
+    else:
+        print_load_report(asyncio.run(run_load(arguments.host, arguments.port, arguments.concurrency,
+                                               arguments.requests, arguments.difficulty, arguments.seed,
+                                               arguments.wrong_rate)))
+
+
+if __name__ == "__main__":
+    main()
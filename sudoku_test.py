@@ -3,6 +3,12 @@ import sudoku
 import copy
 import pygame
 import os
+import json
+import random
+import time
+import asyncio
+import sudoku_server
+from concurrent.futures import ThreadPoolExecutor
 
 def test_is_valid_move_success():
     """Тест №1: Проверка валидного хода."""
@@ -222,4 +228,982 @@ def test_draw_intro_exception():
         with pytest.raises(AttributeError):
             sudoku.draw_intro("Not a surface")
     finally:
-        pygame.quit()
\ No newline at end of file
+        pygame.quit()
+
+def test_board_state_success():
+    """Тест №19: Маски BoardState обновляются при постановке и удалении цифры."""
+    board = [[0] * 9 for _ in range(9)]
+    board[0][0] = 5
+    state = sudoku.BoardState(board)
+
+    assert sudoku.is_valid_move(state, 0, 1, 6) is True
+    assert sudoku.is_valid_move(state, 4, 0, 5) is False
+    assert sudoku.is_valid_move(state, 2, 2, 5) is False
+
+    state.remove(0, 0)
+    assert sudoku.is_valid_move(state, 4, 0, 5) is True
+    assert state.candidates(4, 0) == sudoku.FULL_MASK
+
+
+def test_board_state_exception():
+    """Тест №20: Проверка хода по BoardState с неверными координатами вызывает ValueError."""
+    state = sudoku.BoardState()
+
+    with pytest.raises(ValueError):
+        sudoku.is_valid_move(state, 9, 0, 1)
+
+def test_solve_mrv_success():
+    """Тест №21: Движок 'mrv' решает головоломку и считает узлы перебора."""
+    grid, solution, hints, mistakes = sudoku.generate_board(3)
+    stats = sudoku.SolveStats()
+
+    result = sudoku.solve(copy.deepcopy(grid), engine="mrv", stats=stats)
+
+    assert result is not False
+    for row in range(9):
+        for col in range(9):
+            if grid[row][col]:
+                assert result[row][col] == grid[row][col]
+    assert all(sudoku.BIT_COUNT[mask] == 9 for mask in sudoku.BoardState(result).rows)
+    assert stats.nodes >= stats.backtracks
+
+
+def test_solve_mrv_exception():
+    """Тест №22: Неизвестный движок решателя вызывает SudokuError."""
+    board = [[0] * 9 for _ in range(9)]
+
+    with pytest.raises(sudoku.SudokuError):
+        sudoku.solve(board, engine="no-such-engine")
+
+def test_count_solutions_success():
+    """Тест №23: Dancing Links считает решения до порога и решает поле через solve()."""
+    empty = [[0] * 9 for _ in range(9)]
+    assert sudoku.count_solutions(empty, limit=2) == 2
+
+    grid, solution, hints, mistakes = sudoku.generate_board(1, engine="dlx")
+    assert sudoku.count_solutions(solution) == 1
+
+    puzzle = copy.deepcopy(solution)
+    puzzle[4][4] = 0
+    assert sudoku.count_solutions(puzzle) == 1
+    assert sudoku.solve(puzzle, engine="dlx") == solution
+
+
+def test_count_solutions_exception():
+    """Тест №24: Порог подсчёта меньше 1 вызывает ValueError, противоречивое поле даёт 0 решений."""
+    board = [[0] * 9 for _ in range(9)]
+    board[0][0] = board[0][1] = 7
+
+    assert sudoku.count_solutions(board) == 0
+    with pytest.raises(ValueError):
+        sudoku.count_solutions(board, limit=0)
+
+def test_generate_board_unique_success():
+    """Тест №25: Уникальный режим генерации даёт симметричную головоломку с единственным решением."""
+    grid, solution, hints, mistakes = sudoku.generate_board(3, unique=True)
+
+    assert sudoku.count_solutions(grid) == 1
+    for row in range(9):
+        for col in range(9):
+            assert (grid[row][col] == 0) == (grid[8 - row][8 - col] == 0)
+            assert grid[row][col] in (0, solution[row][col])
+    assert sudoku.get_generation_timings()[3]["dig_unique"]["count"] >= 1
+
+
+def test_generate_board_unique_exception():
+    """Тест №26: Неверная сложность в уникальном режиме вызывает SudokuError."""
+    with pytest.raises(sudoku.SudokuError):
+        sudoku.generate_board(0, unique=True)
+
+def test_puzzle_pool_success():
+    """Тест №27: Пул отдаёт уровни, пополняется в фоне и считает попадания и промахи."""
+    executor = ThreadPoolExecutor(max_workers=1)
+    pool = sudoku.PuzzlePool(depth=1, difficulties=(1,), executor=executor)
+    try:
+        deadline = time.time() + 10
+        while pool.stats()["ready"][1] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+
+        grid, solution, hints, mistakes = pool.get(1)
+        assert hints == 6
+        assert sudoku.count_solutions(grid) == 1
+
+        stats = pool.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 0
+        assert stats["refill"]["count"] >= 1
+    finally:
+        pool.close()
+        executor.shutdown(wait=True)
+
+
+def test_puzzle_pool_exception(capsys):
+    """Тест №28: Неверная сложность в пуле вызывает SudokuError, а остановленный исполнитель запоминается в error без повторных попыток."""
+    executor = ThreadPoolExecutor(max_workers=1)
+    pool = sudoku.PuzzlePool(depth=0, difficulties=(1,), executor=executor)
+    try:
+        with pytest.raises(sudoku.SudokuError):
+            pool.get(7)
+    finally:
+        pool.close()
+        executor.shutdown(wait=True)
+
+    pool = sudoku.PuzzlePool(depth=1, difficulties=(1,), executor=executor)
+    assert isinstance(pool.error, RuntimeError)
+    submits = []
+    executor.submit = lambda *args: submits.append(args)
+    assert pool.get(1)[2] == 6 and pool.get(1)[2] == 6
+    assert submits == [] and capsys.readouterr().out == ""
+    stats = pool.stats()
+    assert stats["broken"] and stats["misses"] == 2 and stats["pending"] == {1: 0}
+    pool.close()
+
+def test_generate_many_success(tmp_path):
+    """Тест №29: Пакетная генерация воспроизводима по зерну и потоково пишется в файл."""
+    first = list(sudoku.generate_many(5, 1, workers=1, seed=11, chunk_size=2))
+    second = list(sudoku.generate_many(5, 1, workers=1, seed=11, chunk_size=2))
+    assert first == second
+    assert len(first) == 5
+
+    path = tmp_path / "puzzles.txt"
+    assert sudoku.write_puzzles(path, first) == 5
+    puzzle_text, solution_text = path.read_text(encoding="utf-8").splitlines()[0].split()
+    assert sudoku.board_from_string(puzzle_text) == first[0][0]
+    assert sudoku.board_from_string(solution_text) == first[0][1]
+
+
+def test_generate_many_exception():
+    """Тест №30: Неверная сложность и испорченная строка поля вызывают ошибки."""
+    with pytest.raises(sudoku.SudokuError):
+        sudoku.generate_many(10, 5)
+
+    with pytest.raises(ValueError):
+        sudoku.board_from_string("12x")
+
+def test_puzzle_pack_success(tmp_path):
+    """Тест №31: Уровни записываются в бинарный набор и читаются по номеру через mmap."""
+    games = [sudoku.generate_board(2, unique=True) for _ in range(3)]
+    path = tmp_path / "pack.sdkp"
+    assert sudoku.write_pack(path, games, 2) == 3
+
+    with sudoku.PuzzlePack(path) as pack:
+        assert len(pack) == 3
+        assert pack.count(2) == 3 and pack.count(1) == 0
+        puzzle, solution, difficulty = pack[1]
+        assert (puzzle, solution, difficulty) == (games[1][0], games[1][1], 2)
+        assert pack.number_for(2, 2) == 2
+
+        grid, solution, hints, mistakes = sudoku.generate_board(2, pack=pack)
+        assert hints == 4
+        assert any(grid == game_data[0] for game_data in games)
+
+        picks = []
+        for seed in range(8):
+            random.seed(seed)
+            first = sudoku.generate_board(2, pack=pack, seed=seed)[0]
+            random.seed(seed + 100)
+            assert sudoku.generate_board(2, pack=pack, seed=seed)[0] == first
+            picks.append(first)
+        assert len({str(grid) for grid in picks}) > 1
+
+
+def test_puzzle_pack_exception(tmp_path):
+    """Тест №32: Чужой файл, неверный номер и отсутствующая сложность вызывают ошибки."""
+    wrong = tmp_path / "wrong.sdkp"
+    wrong.write_bytes(b"not a pack" * 10)
+    with pytest.raises(ValueError):
+        sudoku.PuzzlePack(wrong)
+
+    path = tmp_path / "pack.sdkp"
+    sudoku.write_pack(path, [sudoku.generate_board(1)], 1)
+    with sudoku.PuzzlePack(path) as pack:
+        with pytest.raises(IndexError):
+            pack[5]
+        with pytest.raises(sudoku.SudokuError):
+            sudoku.generate_board(3, pack=pack)
+
+def test_board_success():
+    """Тест №33: Board совместим с доступом board[r][c], дешево копируется и сравнивается."""
+    grid, solution, hints, mistakes = sudoku.generate_board(1)
+    assert isinstance(solution, sudoku.Board)
+
+    board = solution.copy()
+    assert board == solution and hash(board) == hash(solution)
+    assert board == solution.to_lists()
+
+    board[0][0] = 0
+    assert board != solution
+    assert solution[0][0] != 0
+    assert board[0, 0] == 0
+    assert sorted(solution.row(3)) == sorted(solution.col(3)) == sorted(solution.box(4)) == list(range(1, 10))
+
+
+def test_board_exception():
+    """Тест №34: Выход индекса за пределы строки вызывает IndexError, а не запись в соседнюю строку."""
+    board = sudoku.Board()
+
+    with pytest.raises(IndexError):
+        board[0][9] = 5
+    with pytest.raises(IndexError):
+        board[9]
+    assert board.cells.count(0) == 81
+
+def test_board_renderer_success():
+    """Тест №35: BoardRenderer перерисовывает только изменившиеся клетки."""
+    pygame.init()
+    pygame.font.init()
+    sudoku.font = pygame.font.SysFont("Arial", 20)
+    surface = pygame.Surface((sudoku.WIDTH, sudoku.HEIGHT))
+
+    grid, solution, hints, mistakes = sudoku.generate_board(1)
+    original = grid.copy()
+    renderer = sudoku.BoardRenderer()
+    try:
+        first = renderer.render(surface, grid, original, solution, (None, None), None, hints, 0, mistakes)
+        assert first[0] == surface.get_rect()
+
+        assert renderer.render(surface, grid, original, solution, (None, None), None, hints, 500, mistakes) == []
+
+        changed = renderer.render(surface, grid, original, solution, (2, 3), None, hints, 500, mistakes)
+        assert changed == [pygame.Rect(3 * sudoku.CELL_SIZE, 2 * sudoku.CELL_SIZE, sudoku.CELL_SIZE, sudoku.CELL_SIZE)]
+
+        timer = renderer.render(surface, grid, original, solution, (2, 3), None, hints, 1000, mistakes)
+        assert timer == [pygame.Rect(sudoku.INFO_PANEL_RECT)]
+    finally:
+        pygame.quit()
+
+def test_board_renderer_exception():
+    """Тест №36: Отрисовка на невалидной поверхности вызывает AttributeError."""
+    pygame.init()
+    grid, solution, hints, mistakes = sudoku.generate_board(1)
+    try:
+        with pytest.raises(AttributeError):
+            sudoku.BoardRenderer().render(None, grid, grid, solution, (None, None), None, hints, 0, mistakes)
+    finally:
+        pygame.quit()
+
+def test_glyph_cache_success():
+    """Тест №37: Кэш глифов считает попадания и вытесняет давно не использованный текст."""
+    pygame.init()
+    pygame.font.init()
+    test_font = pygame.font.SysFont("Arial", 20)
+    cache = sudoku.GlyphCache(capacity=40)
+    try:
+        cache.prewarm(test_font)
+        assert cache.stats()["misses"] == 36
+
+        first = cache.get("5", sudoku.GREEN, test_font)
+        assert cache.get("5", sudoku.GREEN, test_font) is first
+        assert cache.stats()["hits"] == 2
+
+        for number in range(10):
+            cache.get(f"label {number}", sudoku.YELLOW, test_font)
+        assert cache.stats()["size"] == 40
+        assert cache.get("5", sudoku.GREEN, test_font) is first
+    finally:
+        pygame.quit()
+
+def test_glyph_cache_exception():
+    """Тест №38: Нестроковый текст вызывает TypeError и не попадает в кэш."""
+    pygame.init()
+    pygame.font.init()
+    test_font = pygame.font.SysFont("Arial", 20)
+    cache = sudoku.GlyphCache()
+    try:
+        with pytest.raises(TypeError):
+            cache.get(12345, sudoku.RED, test_font)
+        assert cache.stats()["size"] == 0
+    finally:
+        pygame.quit()
+
+def test_game_session_success():
+    """Тест №39: Сценарий ходов проводит партию без окна от меню до победы и поражения."""
+    game_data = sudoku.generate_board(1, unique=True)
+    session = sudoku.GameSession(lambda difficulty: game_data, clock=lambda: 0)
+    session.replay([("click", 10, 300)])
+    assert session.state == "playing" and session.hints_count == 6
+
+    empty = [index for index in range(81) if session.grid.cells[index] == 0]
+    row, col = sudoku.ROW_OF[empty[0]], sudoku.COL_OF[empty[0]]
+    answer = session.solution_grid[row][col]
+    session.replay([("select", row, col), ("digit", answer % 9 + 1)])
+    assert session.mistakes_left == 4 and session.mistake_number == answer % 9 + 1
+
+    session.replay([("delete",), ("hint",)])
+    assert session.grid[row][col] == answer and session.hints_count == 5
+
+    session.replay([("solve",)])
+    assert session.state == "win"
+
+    session.replay([("click", 200, 400), ("click", 10, 300)])
+    for index in empty[1:6]:
+        wrong = session.solution_grid.cells[index] % 9 + 1
+        session.replay([("select", sudoku.ROW_OF[index], sudoku.COL_OF[index]), ("digit", wrong)])
+    assert session.state == "lose"
+
+
+def test_game_session_exception():
+    """Тест №40: Неизвестное действие сценария вызывает SudokuError, ход без выбранной клетки игнорируется."""
+    session = sudoku.GameSession(lambda difficulty: sudoku.generate_board(difficulty))
+    session.click(10, 300)
+
+    assert session.enter_digit(5) is False
+    with pytest.raises(sudoku.SudokuError):
+        session.handle("teleport", 1, 2)
+
+
+def test_grade_puzzle():
+    """Тест №41: Оценка сложности находит нужные приёмы, и каждый шаг согласован с решением."""
+    x_wing = sudoku.board_from_string("100000569492056108056109240009640801064010000218035604040500016905061402621000005")
+    result = sudoku.grade_puzzle(x_wing)
+
+    assert result.solved
+    assert result.techniques["x_wing"] >= 1
+    assert result.hardest == "x_wing"
+    assert result.score == sum(sudoku.TECHNIQUE_WEIGHTS[name] * times for name, times in result.techniques.items())
+
+    solution = x_wing.copy()
+    sudoku.solve(solution, "dlx")
+    grid = sudoku.CandidateGrid(x_wing)
+    while grid.values.count(0):
+        step = sudoku.next_step(grid)
+        assert step.explain()
+        assert grid.apply(step)
+        assert all(solution.cells[index] == digit for index, digit in step.placements)
+        assert all(not mask >> solution.cells[index] & 1 for index, mask in step.eliminations)
+    assert grid.values == solution.cells
+
+
+def test_grade_puzzle_guess_and_score_band():
+    """Тест №42: Без логического пути оценка содержит перебор, пустой диапазон оценки вызывает ValueError."""
+    result = sudoku.grade_puzzle(sudoku.Board())
+
+    assert not result.solved
+    assert result.hardest == "guess"
+    assert sudoku.grade_many([sudoku.Board()], workers=1)[0].score == sudoku.GUESS_WEIGHT
+
+    puzzle = sudoku.generate_board(1, score_band=(0, 60))[0]
+    assert sudoku.grade_puzzle(puzzle).score <= 60
+    with pytest.raises(ValueError):
+        sudoku.generate_board(1, score_band=(10, 5))
+
+
+def test_hint_engine_success():
+    """Тест №43: Подсказка без выбранной клетки ставит цифру следующего логического шага и объясняет его."""
+    game_data = sudoku.generate_board(3, unique=True)
+    session = sudoku.GameSession(lambda difficulty: game_data, clock=lambda: 0)
+    session.start(3)
+    empty_before = session.grid.cells.count(0)
+
+    assert session.hint() is True
+    assert session.grid.cells.count(0) == empty_before - 1
+    index = session.selected_row * 9 + session.selected_col
+    assert session.grid.cells[index] == session.solution_grid.cells[index]
+    assert sudoku.cell_name(index) in session.hint_message
+
+    session.select(sudoku.ROW_OF[index], sudoku.COL_OF[index])
+    session.delete()
+    assert session.hint_engine.candidates.values == session.grid.cells
+    reference = sudoku.CandidateGrid(session.grid)
+    assert all(session.hint_engine.candidates.cands[cell] == reference.cands[cell] & ~session.hint_engine.excluded[cell]
+               for cell in range(81))
+
+
+def test_hint_engine_wrong_digit():
+    """Тест №44: Пока на поле есть неверная цифра, подсказка указывает на неё и не расходуется."""
+    game_data = sudoku.generate_board(1, unique=True)
+    session = sudoku.GameSession(lambda difficulty: game_data, clock=lambda: 0)
+    session.start(1)
+    index = session.grid.cells.index(0)
+    session.select(sudoku.ROW_OF[index], sudoku.COL_OF[index])
+    session.enter_digit(session.solution_grid.cells[index] % 9 + 1)
+
+    session.select(0, 0)
+    assert session.hint() is False
+    assert session.hints_count == 6
+    assert session.hint_message == f"{sudoku.cell_name(index)} does not match the solution"
+    assert (session.selected_row, session.selected_col) == (sudoku.ROW_OF[index], sudoku.COL_OF[index])
+
+
+def test_generate_grid_success():
+    """Тест №45: Поля 4x4 и 16x16 генерируются с единственным решением, без проверки пустых клеток ровно по цели."""
+    rng = random.Random(7)
+    for size in (4, 16):
+        puzzle, solution = sudoku.generate_grid(size, 2, rng=rng)
+        assert puzzle.size == size and 0 not in solution.cells
+        assert all(sorted(solution.cells[index] for index in unit) == list(range(1, size + 1))
+                   for unit in solution.geometry.units)
+        assert sudoku.count_grid_solutions(puzzle) == 1
+
+        solved = puzzle.copy()
+        assert sudoku.solve_grid(solved) == solution
+        assert puzzle.cells.count(0) > 0
+
+    for size, blanks in ((4, 10), (16, 188), (25, 462), (9, 60)):
+        for _ in range(5):
+            puzzle, _ = sudoku.generate_grid(size, 3, unique=False, rng=rng)
+            assert puzzle.cells.count(0) == blanks
+
+    state = sudoku.GridState(sudoku.GridBoard(16))
+    state.place(0, 16)
+    assert not state.is_valid(15, 16) and state.is_valid(17 * 4, 16)
+
+
+def test_generate_grid_exception():
+    """Тест №46: Неподдерживаемый размер и противоречивые исходные цифры вызывают ValueError."""
+    with pytest.raises(ValueError):
+        sudoku.GridBoard(10)
+    with pytest.raises(ValueError):
+        sudoku.generate_grid(8, 1)
+
+    board = sudoku.GridBoard(4)
+    board[0, 0] = 3
+    board[0, 3] = 3
+    with pytest.raises(ValueError):
+        sudoku.solve_grid(board)
+    with pytest.raises(IndexError):
+        board[4, 0]
+
+
+def test_generate_by_id_success():
+    """Тест №47: Одинаковый идентификатор даёт одинаковый уровень, в том числе в другом процессе."""
+    import subprocess
+    import sys
+
+    puzzle_id = sudoku.make_puzzle_id(3, seed=123456789)
+    assert sudoku.parse_puzzle_id(puzzle_id) == (3, 123456789, True, "backtrack")
+
+    grid, solution, hints, mistakes = sudoku.generate_by_id(puzzle_id)
+    assert sudoku.generate_by_id(puzzle_id)[0] == grid and hints == 2
+    assert sudoku.count_solutions(grid) == 1
+    assert sudoku.generate_board(1, seed="shared")[0] == sudoku.generate_board(1, seed="shared")[0]
+    assert sudoku.generate_board(3, seed=1)[0].cells.count(0) == 60
+
+    code = f"import sudoku; print(sudoku.board_to_string(sudoku.generate_by_id({puzzle_id!r})[0]))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(sudoku.__file__))).stdout
+    assert output.strip().splitlines()[-1] == sudoku.board_to_string(grid)
+
+
+def test_generate_by_id_exception():
+    """Тест №48: Повреждённый идентификатор или отрицательное зерно вызывают ValueError."""
+    for broken in ("", "4bu-1", "3xu-1", "3bu-", "3bu-1_0"):
+        with pytest.raises(ValueError):
+            sudoku.parse_puzzle_id(broken)
+    with pytest.raises(ValueError):
+        sudoku.make_puzzle_id(1, seed=-5)
+
+
+def test_transform_batch_success():
+    """Тест №49: Преобразования сохраняют правила, а каноническая форма одинакова для эквивалентных полей."""
+    pytest.importorskip("numpy")
+    base = sudoku.base_solutions()[0]
+    rng = random.Random(3)
+    canonical = sudoku.canonical_form(base)
+    assert canonical[:9] == bytes(range(1, 10))
+
+    transformed = [sudoku.apply_transform(base, sudoku.random_transform(rng)) for _ in range(3)]
+    transformed += [bytes(row) for row in sudoku.transform_batch([base] * 3, seed=1)]
+    for cells in transformed:
+        board = sudoku.Board(cells)
+        assert all(sorted(part) == list(range(1, 10))
+                   for number in range(9) for part in (board.row(number), board.col(number), board.box(number)))
+        assert sudoku.canonical_form(cells) == canonical
+
+    assert sudoku.solution_batch(5, seed=2).shape == (5, 81)
+    puzzle, solution, _, _ = sudoku.generate_board(2, seed=9, solution_source="transform")
+    assert sudoku.canonical_form(solution.cells) in {sudoku.canonical_form(cells) for cells in sudoku.base_solutions()}
+    assert all(value in (0, solution.cells[index]) for index, value in enumerate(puzzle.cells))
+
+
+def test_transform_batch_exception():
+    """Тест №50: Незаполненное поле и неизвестный источник решения вызывают ValueError."""
+    pytest.importorskip("numpy")
+    with pytest.raises(ValueError):
+        sudoku.canonical_form(bytes(81))
+    with pytest.raises(ValueError):
+        sudoku.generate_board(1, solution_source="magic")
+
+
+def test_dedupe_pack_success(tmp_path):
+    """Тест №51: Эквивалентные головоломки получают один отпечаток и отбрасываются при копировании набора."""
+    pytest.importorskip("numpy")
+    games = [sudoku.generate_board(2, unique=True, seed=seed)[:2] for seed in range(3)]
+    rng = random.Random(5)
+    for _ in range(2):
+        transform = sudoku.random_transform(rng)
+        games.append((sudoku.Board(sudoku.apply_transform(games[0][0].cells, transform)),
+                      sudoku.Board(sudoku.apply_transform(games[0][1].cells, transform))))
+    assert sudoku.canonical_puzzle(games[3][0]) == sudoku.canonical_puzzle(games[0][0], games[0][1])
+
+    source = tmp_path / "source.sdkp"
+    sudoku.write_pack(source, games, 2)
+    index_path = str(tmp_path / "index.sqlite")
+    with sudoku.PuzzleIndex(index_path) as index:
+        assert sudoku.dedupe_pack(source, tmp_path / "unique.sdkp", index) == (3, 2)
+
+    with sudoku.PuzzleIndex(index_path) as index, sudoku.PuzzlePack(tmp_path / "unique.sdkp") as pack:
+        assert len(index) == 3 and len(pack) == 3
+        assert sudoku.puzzle_fingerprint(games[4][0], games[4][1]) in index
+        assert index.add_puzzle(games[1][0], games[1][1]) is False
+
+
+def test_canonical_puzzle_exception():
+    """Тест №52: Головоломка без единственного решения не имеет канонической формы."""
+    pytest.importorskip("numpy")
+    with pytest.raises(ValueError):
+        sudoku.canonical_puzzle(sudoku.Board())
+
+
+def test_solve_cache_success(tmp_path):
+    """Тест №53: Повторное решение берётся из кэша копией, вердикт 'нет решения' тоже кэшируется, решение с rng кэш не трогает."""
+    cache = sudoku.SolveCache(capacity=2, path=str(tmp_path / "solves.bin"))
+    puzzle, solution, _, _ = sudoku.generate_board(2, unique=True, seed=1)
+
+    first = sudoku.solve(puzzle.copy(), "dlx", cache=cache)
+    first.cells[0] = 0
+    second = sudoku.solve(puzzle.copy(), "dlx", cache=cache)
+    assert second == solution
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    broken = solution.copy()
+    broken[0, 1] = broken[0, 0]
+    broken[0, 0] = 0
+    assert sudoku.solve(broken, cache=cache) is False
+    assert sudoku.solve(broken.copy(), rng=random, cache=cache) is False
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    sudoku.solve(sudoku.Board(), "mrv", rng=random, cache=cache)
+    assert cache.stats()["size"] == 2 and cache.stats()["misses"] == 2
+    sudoku.solve(sudoku.Board(), "mrv", cache=cache)
+    assert cache.stats()["evictions"] == 1 and cache.save() == 2
+    restored = sudoku.SolveCache(path=cache.path)
+    assert sudoku.solve(broken.copy(), cache=restored) is False
+    assert restored.stats()["hits"] == 1
+
+    shared = sudoku.SolveCache(capacity=4)
+    keys = [bytes([number]) * 16 for number in range(16)]
+
+    def churn(offset):
+        for number in range(2000):
+            key = keys[(number + offset) % 16]
+            shared.put(key, None)
+            shared.get(keys[(number * 7 + offset) % 16])
+
+    import sys
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(churn, range(4)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert shared.stats()["size"] == 4
+
+
+def test_solve_cache_exception(tmp_path):
+    """Тест №54: Чужой файл кэша и сохранение без пути вызывают ValueError."""
+    wrong = tmp_path / "wrong.bin"
+    wrong.write_bytes(b"garbage" * 5)
+    with pytest.raises(ValueError):
+        sudoku.SolveCache(path=str(wrong))
+    with pytest.raises(ValueError):
+        sudoku.SolveCache().save()
+
+
+def test_instrumentation_success(tmp_path):
+    """Тест №55: Включённый сбор считает узлы решателя и время отрисовки, выгружается в JSON и рисуется панелью."""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()
+    instrumentation = sudoku.Instrumentation(enabled=True)
+    original, original_font = sudoku.instrumentation, sudoku.font
+    sudoku.instrumentation = instrumentation
+    try:
+        sudoku.font = pygame.font.SysFont("Arial", 20)
+        surface = pygame.Surface((sudoku.WIDTH, sudoku.HEIGHT))
+        sudoku.solve(sudoku.Board(), "mrv")
+        timed_draw = instrumentation.timed("draw.test")(sudoku.draw_board.__wrapped__)
+        timed_draw(surface)
+        assert instrumentation.counters["solve.mrv.nodes"] > 0
+        assert instrumentation.counters["solve.mrv.empty_cells"] == 81
+        assert instrumentation.counters["solve.mrv.max_depth"] > 0
+
+        sudoku.generate_board(1, seed=3)
+        assert instrumentation.counters["generate.dig_attempts"] == 20
+        sudoku.generate_board(1, unique=True, seed=3)
+        assert instrumentation.counters["generate.dig_attempts"] >= 20 + 10
+        assert 20 < instrumentation.counters["generate.dig_deleted"] <= 40
+        for engine in sudoku.SOLVER_ENGINES:
+            stats = sudoku.SolveStats()
+            sudoku.solve(sudoku.Board(), engine, stats)
+            assert 0 < stats.max_depth <= 81
+            assert instrumentation.counters[f"solve.{engine}.max_depth"] == stats.max_depth
+        grid_stats = sudoku.SolveStats()
+        sudoku.solve_grid(sudoku.GridBoard(4), grid_stats)
+        assert 0 < grid_stats.max_depth <= 16
+        assert instrumentation.histograms["draw.test"].count == 1
+        assert sudoku.draw_debug_overlay(surface).height > 0
+
+        path = tmp_path / "metrics.json"
+        instrumentation.dump(path)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        assert data["histograms"]["solve.mrv"]["count"] == 2
+
+        profile_path = tmp_path / "run.prof"
+        assert sudoku.profile_call(str(profile_path), sum, [1, 2, 3]) == 6
+        assert profile_path.stat().st_size > 0
+    finally:
+        sudoku.instrumentation, sudoku.font = original, original_font
+        pygame.quit()
+
+
+def test_instrumentation_exception():
+    """Тест №56: Выключенный сбор ничего не копит, а исключение проходит через обёртку timed и всё равно замеряется."""
+    instrumentation = sudoku.Instrumentation()
+    instrumentation.count("anything")
+    instrumentation.observe("anything", 1.0)
+    assert instrumentation.snapshot() == {"counters": {}, "histograms": {}}
+
+    instrumentation.enabled = True
+
+    @instrumentation.timed("broken")
+    def broken():
+        raise sudoku.SudokuError("boom")
+
+    with pytest.raises(sudoku.SudokuError):
+        broken()
+    assert instrumentation.histograms["broken"].count == 1
+
+
+def _server_exchange(requests):
+    """Запускает сервер на свободном порту с пулом потоков и отправляет запросы по одному соединению"""
+    async def run():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            server = sudoku_server.PuzzleServer(port=0, executor=executor)
+            await server.start()
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            responses = []
+            for request in requests:
+                writer.write((request if isinstance(request, str) else json.dumps(request)).encode() + b"\n")
+                await writer.drain()
+                responses.append(json.loads(await reader.readline()))
+            writer.close()
+            await server.close()
+            return responses
+    return asyncio.run(run())
+
+
+def test_server_session():
+    """Тест №57: Сервер создаёт партию по puzzle_id, принимает ход, выдаёт подсказку и проверяет поле."""
+    puzzle_id = sudoku.make_puzzle_id(1, seed=7)
+    puzzle, solution, _, _ = sudoku.generate_by_id(puzzle_id)
+    index = next(i for i in range(81) if puzzle[i // 9][i % 9] == 0)
+    row, col = divmod(index, 9)
+    new, move, hint, valid, broken = _server_exchange([
+        {"type": "new", "puzzle_id": puzzle_id, "id": 1},
+        {"type": "move", "row": row, "col": col, "digit": solution[row][col]},
+        {"type": "hint"},
+        {"type": "validate"},
+        {"type": "validate", "board": "11" + "0" * 79}])
+    assert new["ok"] and new["id"] == 1
+    assert new["puzzle"] == "".join(str(digit) for line in puzzle for digit in line)
+    assert move["changed"] and move["correct"] and move["state"] == "playing"
+    assert hint["used"] and solution[hint["row"]][hint["col"]] == hint["digit"]
+    assert valid["ok"] and valid["conflicts"] == [] and valid["solvable"] and not valid["complete"]
+    assert broken["conflicts"] == [[0, 0], [0, 1]] and not broken["solvable"]
+
+
+def test_server_errors():
+    """Тест №58: Неверный JSON, неизвестный тип, ход без партии и ход вне поля возвращают ok=false, соединение живо."""
+    responses = _server_exchange([
+        "{not json",
+        {"type": "fly", "id": "x"},
+        {"type": "move", "row": 0, "col": 0, "digit": 1},
+        {"type": "new", "difficulty": 1},
+        {"type": "move", "row": 9, "col": 0, "digit": 1},
+        {"type": "new", "difficulty": 7}])
+    assert [response["ok"] for response in responses] == [False, False, False, True, False, False]
+    assert responses[1]["id"] == "x" and "unknown request type" in responses[1]["error"]
+    assert "send 'new' first" in responses[2]["error"]
+
+
+def test_validate_batch():
+    """Тест №59: Пакетная проверка совпадает с find_conflicts, отличает решённые поля и проверяет поток ходов."""
+    numpy = pytest.importorskip("numpy")
+    boards = sudoku.solution_batch(50, seed=3).reshape(-1, 9, 9)
+    correct = boards[1, 0, 0]
+    boards[1, 0, 0] = 0
+    boards[2, 0, 0] = boards[2, 0, 1]
+    result = sudoku.validate_batch(boards, chunk_size=7)
+    assert len(result) == 50 and result.conflicts.shape == (50, 9, 9)
+    assert result.solved[0] and not result.complete[1] and result.valid[1]
+    assert not result.valid[2]
+    for board, conflicts in zip(boards, result.conflicts):
+        expected = sudoku.find_conflicts(sudoku.Board(bytes(board.ravel())))
+        assert list(numpy.flatnonzero(conflicts)) == expected
+
+    moves = [(1, 0, 0, correct), (1, 0, 0, correct % 9 + 1), (0, 0, 0, boards[0, 0, 0])]
+    assert list(sudoku.validate_moves(boards, moves)) == [True, False, False]
+
+
+def test_validate_batch_exception():
+    """Тест №60: Поля не по 81 клетке, цифры больше 9 и ходы вне диапазона вызывают ValueError."""
+    numpy = pytest.importorskip("numpy")
+    with pytest.raises(ValueError):
+        sudoku.validate_batch(numpy.zeros((2, 80), dtype=numpy.uint8))
+    with pytest.raises(ValueError):
+        sudoku.validate_batch(numpy.full((1, 9, 9), 10, dtype=numpy.uint8))
+    with pytest.raises(ValueError):
+        sudoku.validate_moves(numpy.zeros((1, 81), dtype=numpy.uint8), [(1, 0, 0, 5)])
+    with pytest.raises(ValueError):
+        sudoku.validate_moves(numpy.zeros((1, 81), dtype=numpy.uint8), [(0, 0, 0, 0)])
+
+
+def test_move_journal(tmp_path):
+    """Тест №61: Журнал отменяет и повторяет ходы партии, перематывает по контрольным точкам и переживает сохранение."""
+    puzzle, solution, _, _ = sudoku.generate_by_id(sudoku.make_puzzle_id(1, seed=11))
+    ticks = iter(range(0, 10 ** 6, 7))
+    session = sudoku.GameSession(lambda difficulty: (puzzle, solution, 3, 3), lambda: next(ticks))
+    session.start(1)
+    empty = [index for index in range(81) if puzzle[index // 9][index % 9] == 0]
+    first, second = empty[:2]
+    wrong = solution[second // 9][second % 9] % 9 + 1
+    session.select(first // 9, first % 9)
+    session.enter_digit(solution[first // 9][first % 9])
+    session.select(second // 9, second % 9)
+    session.enter_digit(wrong)
+    assert session.undo() and session.grid.cells[second] == 0
+    assert session.mistakes_left == 2
+    assert session.redo() and session.grid.cells[second] == wrong
+    assert session.undo() and session.journal.can_undo and session.journal.can_redo
+
+    session.solve()
+    assert session.state == "win"
+    journal = session.journal
+    kinds = [record[3] for record in journal.records()]
+    assert kinds[:5] == ["digit", "digit", "undo", "redo", "undo"] and kinds[-1] == "solve"
+    assert len(journal) == 4 + len(empty)
+    assert journal.board_at(0) == sudoku.Board(puzzle) and journal.board_at() == sudoku.Board(solution)
+
+    path = str(tmp_path / "game.journal")
+    assert journal.save(path) == len(journal)
+    assert os.path.getsize(path) == sudoku.JOURNAL_HEADER.size + 81 + 8 * len(journal)
+    loaded = sudoku.MoveJournal.load(path)
+    assert list(loaded.records()) == list(journal.records())
+    assert loaded.can_undo and not loaded.can_redo
+
+    dense = sudoku.MoveJournal(bytes(81), checkpoint_every=4)
+    for number in range(30):
+        dense.record(number, 0, number % 9 + 1, "digit", number)
+    dense.undo(30)
+    assert dense.nbytes == 31 * 8 + 81 * (1 + 31 // 4)
+    for position in range(len(dense)):
+        expected = bytes(number % 9 + 1 if number < position else 0 for number in range(81))
+        assert dense.board_at(position).cells == expected
+    assert dense.board_at(len(dense)) == dense.board_at() == dense.board_at(29)
+
+
+def test_move_journal_exception(tmp_path):
+    """Тест №62: Неверные поле, вид записи, позиция перемотки и повреждённый файл журнала вызывают исключения."""
+    with pytest.raises(ValueError):
+        sudoku.MoveJournal(bytes(80))
+    journal = sudoku.MoveJournal(bytes(81), checkpoint_every=2)
+    assert journal.undo(0) == [] and journal.redo(0) == []
+    with pytest.raises(ValueError):
+        journal.record(0, 0, 5, "undo", 0)
+    journal.record(0, 0, 5, "digit", 10)
+    with pytest.raises(IndexError):
+        journal.board_at(2)
+
+    path = tmp_path / "broken.bin"
+    path.write_bytes(b"SDKJ" + bytes(10))
+    with pytest.raises(ValueError):
+        sudoku.MoveJournal.load(str(path))
+    path.write_bytes(sudoku.JOURNAL_HEADER.pack(sudoku.JOURNAL_MAGIC, 1, 64, 1) + bytes(81)
+                     + sudoku.JOURNAL_RECORD.pack(0, 0, 5, sudoku.JOURNAL_KINDS.index("undo"), 0))
+    with pytest.raises(ValueError):
+        sudoku.MoveJournal.load(str(path))
+
+
+def test_notes_mode():
+    """Тест №63: Заметки ставятся в режиме заметок, снимаются при ходе у соседей и рисуются из кэша мини-глифов."""
+    puzzle, solution, _, _ = sudoku.generate_by_id(sudoku.make_puzzle_id(2, seed=5))
+    session = sudoku.GameSession(lambda difficulty: (puzzle, solution, 3, 3))
+    session.start(2)
+    empty = [index for index in range(81) if puzzle[index // 9][index % 9] == 0]
+    target = empty[0]
+    peer = next(index for index in empty if index in sudoku.PEER_SETS[target])
+    digit = solution[target // 9][target % 9]
+
+    session.handle("notes")
+    session.select(peer // 9, peer % 9)
+    assert session.enter_digit(digit) and session.enter_digit(digit % 9 + 1)
+    assert session.notes[peer] == 1 << digit | 1 << (digit % 9 + 1)
+    assert session.moves == 0 and session.grid.cells[peer] == 0
+    session.select(target // 9, target % 9)
+    session.enter_digit(digit)
+
+    session.toggle_notes()
+    assert session.enter_digit(digit) and session.grid.cells[target] == digit
+    assert session.notes[target] == 0 and session.notes[peer] == 1 << (digit % 9 + 1)
+
+    assert session.undo() and session.grid.cells[target] == 0
+    assert session.notes[target] == 1 << digit and session.notes[peer] == 1 << digit | 1 << (digit % 9 + 1)
+    assert session.redo() and session.grid.cells[target] == digit
+    assert session.notes[target] == 0 and session.notes[peer] == 1 << (digit % 9 + 1)
+    assert session.undo() and session.notes[peer] == 1 << digit | 1 << (digit % 9 + 1)
+    assert session.redo() and session.notes[peer] == 1 << (digit % 9 + 1)
+
+    pygame.init()
+    pygame.font.init()
+    sudoku.font = pygame.font.SysFont("Arial", 20)
+    try:
+        surface = pygame.Surface((sudoku.WIDTH, sudoku.HEIGHT))
+        sudoku.draw_numbers(surface, session.grid, session.original_grid, session.solution_grid, notes=session.notes)
+        renderer = sudoku.BoardRenderer()
+        renderer.render(surface, session.grid, session.original_grid, session.solution_grid, (None, None), None,
+                        3, 0, 3, notes=session.notes, notes_mode=True)
+        session.select(peer // 9, peer % 9)
+        session.toggle_notes()
+        session.enter_digit(1 if digit != 1 else 2)
+        changed = renderer.render(surface, session.grid, session.original_grid, session.solution_grid,
+                                  (None, None), None, 3, 0, 3, notes=session.notes, notes_mode=True)
+        cell = pygame.Rect(peer % 9 * sudoku.CELL_SIZE, peer // 9 * sudoku.CELL_SIZE,
+                           sudoku.CELL_SIZE, sudoku.CELL_SIZE)
+        assert changed == [cell]
+        assert sudoku.note_glyphs.get(session.notes[peer]) is sudoku.note_glyphs.get(session.notes[peer])
+    finally:
+        sudoku.note_glyphs.clear()
+        pygame.quit()
+
+
+def test_notes_mode_exception():
+    """Тест №64: Заметки нельзя ставить в заполненную клетку, а маска с лишними битами вызывает ValueError."""
+    puzzle, solution, _, _ = sudoku.generate_by_id(sudoku.make_puzzle_id(1, seed=5))
+    session = sudoku.GameSession(lambda difficulty: (puzzle, solution, 3, 3))
+    session.start(1)
+    given = next(index for index in range(81) if puzzle[index // 9][index % 9])
+    session.toggle_notes()
+    session.select(given // 9, given % 9)
+    assert not session.enter_digit(5) and session.notes[given] == 0
+    with pytest.raises(ValueError):
+        sudoku.note_glyphs.get(1)
+    with pytest.raises(ValueError):
+        sudoku.note_glyphs.get(1 << 10)
+
+
+def test_lazy_pygame_startup(tmp_path, monkeypatch):
+    """Тест №65: Решатель импортируется без загрузки pygame, а путь к шрифту ищется один раз и берётся из кэша."""
+    import subprocess
+    import sys
+    code = ("import sys, sudoku\n"
+            "sudoku.solve(sudoku.generate_board(1)[0], 'mrv')\n"
+            "print('pygame.base' in sys.modules)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(sudoku.__file__))).stdout
+    assert output.strip().splitlines()[-1] == "False"
+
+    font_file = tmp_path / "times.ttf"
+    font_file.write_bytes(b"")
+    lookups = []
+    monkeypatch.setattr(pygame.font, "match_font", lambda name: lookups.append(name) or str(font_file))
+    cache_path = str(tmp_path / "cache" / "fonts.json")
+    assert sudoku.font_path("Times New Roman", cache_path) == str(font_file)
+    assert sudoku.font_path("Times New Roman", cache_path) == str(font_file)
+    assert lookups == ["Times New Roman"]
+    with open(cache_path, encoding="utf-8") as source:
+        assert json.load(source) == {"Times New Roman": str(font_file)}
+
+    font_file.unlink()
+    sudoku.font_path("Times New Roman", cache_path)
+    assert len(lookups) == 2
+
+
+def test_lazy_pygame_startup_exception(tmp_path, monkeypatch):
+    """Тест №66: Без pygame init_display вызывает SudokuError, отсутствующий модуль импортируется как None, а ненайденный шрифт не кэшируется."""
+    assert sudoku._lazy_import("no_such_module_for_sudoku") is None
+    cache_path = tmp_path / "fonts.json"
+    cache_path.write_text("not json", encoding="utf-8")
+    assert sudoku.font_path("No Such Font Family", str(cache_path)) is None
+    assert cache_path.read_text(encoding="utf-8") == "not json"
+
+    cache_path.write_text(json.dumps({"No Such Font Family": None}), encoding="utf-8")
+    lookups = []
+    monkeypatch.setattr(pygame.font, "match_font", lambda name: lookups.append(name))
+    assert sudoku.font_path("No Such Font Family", str(cache_path)) is None
+    assert sudoku.font_path("No Such Font Family", str(cache_path)) is None
+    assert len(lookups) == 2
+    monkeypatch.setattr(sudoku, "pygame", None)
+    with pytest.raises(sudoku.SudokuError):
+        sudoku.init_display(str(cache_path))
+
+
+def test_server_load():
+    """Тест №67: Нагрузочный клиент ходит настоящими цифрами: партии выигрываются и проигрываются без ошибок."""
+    async def run():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            server = sudoku_server.PuzzleServer(port=0, executor=executor)
+            await server.start()
+            try:
+                return await sudoku_server.run_load(server.host, server.port, concurrency=3, requests=120,
+                                                    difficulty=1, seed=5, wrong_rate=0.3)
+            finally:
+                await server.close()
+    report = asyncio.run(run())
+    assert report["errors"] == 0 and report["requests"] >= 3 * 120
+    assert report["losses"] > 0 and report["new"]["count"] == 3 + report["wins"] + report["losses"]
+
+
+
+def test_grade_puzzle_matches_step_by_step():
+    """Тест №68: Пакетная постановка одиночек в grade_puzzle даёт ту же оценку, что и пошаговый next_step."""
+    random.seed(68)
+    boards = [sudoku.generate_board(difficulty, unique=True)[0] for difficulty in (1, 2, 3) for _ in range(10)]
+    boards.append(sudoku.generate_board(3)[0])
+    for board in boards:
+        grid = sudoku.CandidateGrid(board)
+        techniques = {}
+        while grid.values.count(0):
+            step = sudoku.next_step(grid)
+            if step is None or not grid.apply(step):
+                techniques["guess"] = 1
+                break
+            techniques[step.technique] = techniques.get(step.technique, 0) + 1
+        result = sudoku.grade_puzzle(board)
+        assert result.techniques == techniques
+        assert result.steps == sum(times for name, times in techniques.items() if name != "guess")
+
+    assert [result.score for result in sudoku.grade_many(boards[:3])] == \
+        [sudoku.grade_puzzle(board).score for board in boards[:3]]
+
+
+def test_solve_stats_without_cache():
+    """Тест №69: solve без явного кэша запускает движок каждый раз, и повторное решение того же поля считает узлы."""
+    puzzle = sudoku.generate_board(3, unique=True, seed=69)[0]
+    shared = sudoku.solve_cache.stats()
+    for engine in sudoku.SOLVER_ENGINES:
+        counts = []
+        for _ in range(2):
+            stats = sudoku.SolveStats()
+            assert sudoku.solve(puzzle.copy(), engine, stats)
+            counts.append((stats.nodes, stats.backtracks, stats.max_depth))
+        assert counts[0] == counts[1] and counts[0][0] > 0 and counts[0][2] > 0
+    assert sudoku.solve_cache.stats() == shared
+
+
+def test_main_overlay_restores_instrumentation(tmp_path, monkeypatch):
+    """Тест №70: F3 включает сбор instrumentation только пока видна панель отладки, а сбор по --instrument не выключает."""
+    monkeypatch.setattr(sudoku, "PuzzlePool", lambda: sudoku.PuzzlePool(depth=0))
+    sudoku.init_display(str(tmp_path / "fonts.json"))
+    original = sudoku.instrumentation.enabled
+    try:
+        for requested in (False, True):
+            sudoku.instrumentation.enabled = requested
+            for key in (pygame.K_F3, pygame.K_F3):
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode="", scancode=0))
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+            sudoku.main()
+            assert sudoku.instrumentation.enabled is requested
+            sudoku.init_display(str(tmp_path / "fonts.json"))
+    finally:
+        sudoku.instrumentation.enabled = original
+        pygame.quit()